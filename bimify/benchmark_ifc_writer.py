@@ -0,0 +1,89 @@
+import argparse
+import time
+
+from shapely.geometry import box
+
+from . import global_variables as gvars
+from .elements import *
+from .ifc_modeling import IFCModelHandler
+
+
+# Compares the IFC export of walls, spaces, openings and slabs between the api path of IFCModelHandler
+# and its bulk writer mode, on a synthetic grid of rooms
+#   python -m bimify.benchmark_ifc_writer --rooms 20
+
+
+def create_grid_plan(rooms_per_side, room_size=400, thickness=10):
+    manager = ElementsManager()
+    walls = []
+    length = rooms_per_side * room_size
+    for i in range(rooms_per_side + 1):
+        offset = i * room_size
+        walls.append(Wall(manager, box(offset - thickness/2, 0, offset + thickness/2, length), ((offset, 0), (offset, length)), thickness))
+        walls.append(Wall(manager, box(0, offset - thickness/2, length, offset + thickness/2), ((0, offset), (length, offset)), thickness))
+
+    rooms = []
+    openings = []
+    for i in range(rooms_per_side):
+        for j in range(rooms_per_side):
+            x, y = i * room_size, j * room_size
+            rooms.append(Room(manager, box(x + thickness/2, y + thickness/2, x + room_size - thickness/2, y + room_size - thickness/2), name=f"room_{i}_{j}"))
+            # One door in the vertical wall on the left of the room, one window in the horizontal wall above it
+            openings.append(Opening(manager, (x, y + room_size/2), walls[2*i], 90, classname="door"))
+            openings.append(Opening(manager, (x + room_size/2, y), walls[2*j + 1], 120, classname="window"))
+
+    return walls, rooms, openings
+
+
+def run_export(bulk_writer, walls, rooms, openings):
+    handler = IFCModelHandler(bulk_writer=bulk_writer)
+    handler.create_project()
+    timings = {}
+
+    start = time.perf_counter()
+    handler.create_ifc_walls_from_polygons(walls)
+    timings["walls"] = (len(walls), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    handler.create_ifc_spaces_from_enclosed_areas(rooms)
+    timings["spaces"] = (len(rooms), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    handler.create_ifc_openings_from_polygons(openings)
+    timings["openings"] = (len(openings), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for room in rooms:
+        handler.create_slab(room.polygon, gvars.default_slab_thickness, f"slab_{room.id}")
+    timings["slabs"] = (len(rooms), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    handler.flush_relationships()
+    timings["relations"] = (len(walls) + 2 * len(rooms) + len(openings), time.perf_counter() - start)
+
+    return handler, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IFC export benchmark: api path vs bulk writer")
+    parser.add_argument("--rooms", type=int, default=20, help="Number of rooms per side of the grid")
+    args = parser.parse_args()
+
+    results = {}
+    for bulk_writer in (False, True):
+        # New elements for each run, the exports write their ifc_element
+        walls, rooms, openings = create_grid_plan(args.rooms)
+        handler, results[bulk_writer] = run_export(bulk_writer, walls, rooms, openings)
+        print(f"{'bulk' if bulk_writer else 'api'}: {len(handler.model.by_type('IfcRoot'))} rooted entities, {len(list(handler.model))} entities")
+
+    print(f"{'':10}{'count':>8}{'api el/s':>12}{'bulk el/s':>12}{'speedup':>10}")
+    for name, (count, api_time) in results[False].items():
+        bulk_time = results[True][name][1]
+        api_rate = count / api_time if api_time else None
+        bulk_rate = count / bulk_time if bulk_time else None
+        speedup = api_time / bulk_time if api_time and bulk_time else None
+        print(f"{name:10}{count:>8}{api_rate or float('nan'):>12.0f}{bulk_rate or float('nan'):>12.0f}{speedup or float('nan'):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+from .benchmark_ifc_writer import create_grid_plan
+from .elements import *
+from .ray_casting import RayCaster
+from .room_index import RoomIndex
+
+
+# Compares RayCaster with Object.set_origin_point_and_angle on a synthetic grid of rooms holding random objects:
+# both must give the same origin points, angles, polygons, depths and types. Exits with status 1 on a mismatch
+#   python -m bimify.compare_ray_casting --rooms 20 --objects 800
+
+
+OBJECT_CLASSNAMES = ["sink", "wc", "bath", "bed", "shower"]
+
+
+def create_objects(manager, count, length, seed):
+    # The same seed gives the same objects, one set for each method
+    rng = random.Random(seed)
+    objects = []
+    for _ in range(count):
+        x, y = rng.uniform(0, length), rng.uniform(0, length)
+        width, depth = rng.uniform(20, 90), rng.uniform(20, 60)
+        classname = rng.choice(OBJECT_CLASSNAMES)
+        objects.append(Object(manager, classname, Polygon([(x, y), (x + width, y), (x + width, y + depth), (x, y + depth)])))
+    return objects
+
+
+def is_same_result(obj, other_obj, tolerance=1e-6):
+    return (
+        np.allclose(obj.origin_point, other_obj.origin_point, atol=tolerance)
+        and abs(obj.angle - other_obj.angle) < tolerance
+        and obj.polygon.equals_exact(other_obj.polygon, tolerance)
+        and abs(obj.depth - other_obj.depth) < tolerance
+        and obj.typename == other_obj.typename
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ray casting: Object.set_origin_point_and_angle vs RayCaster")
+    parser.add_argument("--rooms", type=int, default=20, help="Number of rooms per side of the grid")
+    parser.add_argument("--objects", type=int, default=800, help="Number of random objects")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    walls, rooms, openings = create_grid_plan(args.rooms)
+    manager = walls[0].manager
+    length = args.rooms * 400
+    walls_tree = shapely.STRtree([wall.polygon for wall in walls])
+
+    objects = create_objects(manager, args.objects, length, args.seed)
+    batched_objects = create_objects(manager, args.objects, length, args.seed)
+    RoomIndex(rooms).assign(objects=objects)
+    RoomIndex(rooms).assign(objects=batched_objects)
+
+    start = time.perf_counter()
+    for obj in objects:
+        obj.set_origin_point_and_angle(None, walls, walls_tree)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    RayCaster(walls, walls_tree).set_origin_points_and_angles(batched_objects)
+    batched_time = time.perf_counter() - start
+
+    mismatches = [obj.id for obj, batched_obj in zip(objects, batched_objects) if not is_same_result(obj, batched_obj)]
+    in_room = sum(obj.contained_in_room is not None for obj in objects)
+    print(f"{len(objects)} objects ({in_room} in a room), {len(walls)} walls")
+    print(f"loop: {loop_time:.3f} s, RayCaster: {batched_time:.3f} s, speedup {loop_time / batched_time:.1f}")
+    print(f"mismatches: {len(mismatches)}" + (f" (objects {mismatches[:10]})" if mismatches else ""))
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
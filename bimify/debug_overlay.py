@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class DebugOverlay:
+    # Records the debug drawings made during the processing (lines, points) and draws them all at the end with render().
+    # When disabled, recording is a no-op: no pixel work and no plan image needed during the processing
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lines = {} # {(color, thickness): [[x1, y1, x2, y2], ...]}
+        self.points = {} # {(color, radius): [[x, y], ...]}
+
+    def line(self, p1, p2, color, thickness=1):
+        if not self.enabled:
+            return
+        self.lines.setdefault((tuple(color), thickness), []).append((p1[0], p1[1], p2[0], p2[1]))
+
+    def add_lines(self, starts, ends, color, thickness=1):
+        # Bulk version of line() for (n, 2) arrays
+        if not self.enabled or len(starts) == 0:
+            return
+        self.lines.setdefault((tuple(color), thickness), []).extend(np.hstack((starts, ends)).tolist())
+
+    def point(self, p, color, radius=3):
+        if not self.enabled:
+            return
+        self.points.setdefault((tuple(color), radius), []).append((p[0], p[1]))
+
+    def clear(self):
+        self.lines = {}
+        self.points = {}
+
+    def render(self, img):
+        # One cv2 call per color/thickness
+        import cv2
+
+        for (color, thickness), lines in self.lines.items():
+            segments = np.rint(np.asarray(lines, dtype=float)).astype(np.int32).reshape(-1, 2, 2)
+            cv2.polylines(img, list(segments), False, color, thickness)
+        for (color, radius), points in self.points.items():
+            for x, y in np.rint(np.asarray(points, dtype=float)).astype(int).tolist():
+                cv2.circle(img, (x, y), radius, color, -1)
+        return img
@@ -0,0 +1,258 @@
+import numpy as np
+import shapely
+
+from . import global_variables as gvars
+
+
+class ColumnTable:
+    # Growable table of NumPy columns, one row per element
+    def __init__(self, columns, capacity=256):
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self.row_count = 0
+
+    def add_row(self):
+        if self.row_count == len(next(iter(self.columns.values()))):
+            for name, column in self.columns.items():
+                resized = np.zeros(2 * len(column), dtype=column.dtype)
+                resized[:len(column)] = column
+                self.columns[name] = resized
+        self.row_count += 1
+        return self.row_count - 1
+
+    def __getitem__(self, name):
+        # View over the used rows
+        return self.columns[name][:self.row_count]
+
+
+# Class ids of the wall rows
+WALL_CLASS_IDS = {"wall": 0, "subwall": 1}
+
+
+class ElementStore:
+    # Columns of the geometry of the walls and openings of a plan (endpoints, thickness, angle, length, center,
+    # class id). For the elements of a manager with a store, the columns are the only copy of this geometry:
+    # Wall.line/thickness and Opening.center_point/length/classname/corresponding_wall read and write their row
+    # (the elements have __slots__ and no per-instance dict), and lengths/angles/opening corners are read from the
+    # columns instead of being recomputed in Python. Whole-plan operations (orthogonalization, filtering, opening
+    # polygons...) work on the columns at once
+    def __init__(self):
+        self.walls = ColumnTable({
+            "x1": float, "y1": float, "x2": float, "y2": float,
+            "thickness": float, "angle": float, "length": float, "cx": float, "cy": float, "class_id": np.int64,
+            "alive": bool,
+        })
+        self.openings = ColumnTable({
+            "cx": float, "cy": float, "length": float, "wall_row": np.int64, "class_id": np.int64,
+            "alive": bool,
+        })
+        # The elements by row (the wall graph and the walls hold them anyway), None once removed
+        self.wall_objects = [] # [Wall] by row
+        self.opening_objects = [] # [Opening] by row
+
+    # Walls
+
+    def add_wall(self, wall):
+        row = self.walls.add_row()
+        self.wall_objects.append(wall)
+        self.walls.columns["alive"][row] = True
+        return row
+
+    def get_wall_line(self, row):
+        columns = self.walls.columns
+        return ((float(columns["x1"][row]), float(columns["y1"][row])), (float(columns["x2"][row]), float(columns["y2"][row])))
+
+    def get_wall_thickness(self, row):
+        return float(self.walls.columns["thickness"][row])
+
+    def set_wall_line(self, row, line):
+        (x1, y1), (x2, y2) = line
+        columns = self.walls.columns
+        columns["x1"][row], columns["y1"][row], columns["x2"][row], columns["y2"][row] = x1, y1, x2, y2
+        columns["angle"][row] = np.arctan2(y2 - y1, x2 - x1)
+        columns["length"][row] = np.hypot(x2 - x1, y2 - y1)
+        columns["cx"][row], columns["cy"][row] = (x1 + x2) / 2, (y1 + y2) / 2
+
+    def set_wall_thickness(self, row, thickness):
+        self.walls.columns["thickness"][row] = thickness
+
+    def set_wall_class(self, row, class_name):
+        self.walls.columns["class_id"][row] = WALL_CLASS_IDS[class_name]
+
+    def remove_wall(self, row):
+        self.walls.columns["alive"][row] = False
+        self.wall_objects[row] = None
+
+    def get_wall_lengths(self):
+        return self.walls["length"]
+
+    def get_wall_angles(self, direction_insenstive=False, to_degrees=False):
+        angles = self.walls["angle"]
+        if direction_insenstive:
+            angles = angles % np.pi
+        if to_degrees:
+            angles = np.degrees(angles)
+        return angles
+
+    def filter_walls(self, mask):
+        # Views of the alive walls selected by a boolean mask over the wall rows
+        return [WallView(self, row) for row in np.flatnonzero(mask & self.walls["alive"]).tolist()]
+
+    def orthogonalize_walls(self, epsilon_deg=gvars.epsilon_deg, shorter_length_threshold=gvars.shorter_length_threshold):
+        # Walls close to horizontal or vertical are rotated around their center to be exactly horizontal or vertical
+        # (twice the angle tolerance for walls shorter than shorter_length_threshold). Returns the rows of the rotated walls.
+        # Their polygons are rebuilt as rectangles around the new lines (one vectorized buffer) and the nodes connected
+        # to them are moved to the same distance from the start on the new lines. A node shared by two rotated walls
+        # follows the last one
+        angles = np.degrees(self.walls["angle"]) % 90
+        deviations = np.where(angles > 45, angles - 90, angles)
+        tolerances = np.where(self.walls["length"] < shorter_length_threshold, 2 * epsilon_deg, epsilon_deg)
+        rows = np.flatnonzero((np.abs(deviations) <= tolerances) & (deviations != 0) & self.walls["alive"])
+        if len(rows) == 0:
+            return rows
+
+        new_angles = self.walls["angle"][rows] - np.radians(deviations[rows])
+        half_vectors = np.stack((np.cos(new_angles), np.sin(new_angles)), axis=1) * (self.walls["length"][rows] / 2)[:, None]
+        centers = np.stack((self.walls["cx"][rows], self.walls["cy"][rows]), axis=1)
+        starts = centers - half_vectors
+        ends = centers + half_vectors
+        for row, start, end in zip(rows.tolist(), starts.tolist(), ends.tolist()):
+            self.set_wall_line(row, (tuple(start), tuple(end)))
+
+        polygons = shapely.buffer(shapely.linestrings(np.stack((starts, ends), axis=1)), self.walls["thickness"][rows] / 2, cap_style="flat")
+        directions = half_vectors / (self.walls["length"][rows] / 2)[:, None]
+        for wall_num, (row, polygon) in enumerate(zip(rows.tolist(), polygons.tolist())):
+            wall = self.wall_objects[row]
+            if wall is None:
+                continue
+            wall.polygon = polygon
+            graph = wall.manager.graph
+            slots = np.asarray(graph.get_wall_slots(wall.id), dtype=np.int64)
+            if len(slots):
+                graph.node_positions[graph.slot_node[slots]] = starts[wall_num] + graph.slot_distance[slots][:, None] * directions[wall_num]
+        return rows
+
+    # Openings
+
+    def add_opening(self, opening):
+        # The other columns are written by the Opening setters
+        row = self.openings.add_row()
+        self.opening_objects.append(opening)
+        self.openings.columns["alive"][row] = True
+        return row
+
+    def set_opening_center(self, row, center_point):
+        self.openings.columns["cx"][row], self.openings.columns["cy"][row] = center_point
+
+    def get_opening_center(self, row):
+        return float(self.openings.columns["cx"][row]), float(self.openings.columns["cy"][row])
+
+    def set_opening_length(self, row, length):
+        self.openings.columns["length"][row] = length
+
+    def get_opening_length(self, row):
+        return float(self.openings.columns["length"][row])
+
+    def set_opening_wall(self, row, wall):
+        if wall.row is None:
+            raise ValueError(f"Wall {wall.id} of the opening is not in the element store")
+        self.openings.columns["wall_row"][row] = wall.row
+
+    def set_opening_class(self, row, classname):
+        self.openings.columns["class_id"][row] = gvars.objects_class_map.get(classname, -1)
+
+    def remove_opening(self, row):
+        self.openings.columns["alive"][row] = False
+        self.opening_objects[row] = None
+
+    def filter_openings(self, mask):
+        # Views of the alive openings selected by a boolean mask over the opening rows
+        return [OpeningView(self, row) for row in np.flatnonzero(mask & self.openings["alive"]).tolist()]
+
+    def get_opening_corners(self, rows=None, thickness=None):
+        # Same corners as Opening.get_polygon, for many openings at once: (n, 4, 2)
+        if rows is None:
+            rows = np.flatnonzero(self.openings["alive"])
+        wall_rows = self.openings["wall_row"][rows]
+        wall_angles = self.walls["angle"][wall_rows]
+        if thickness is None:
+            thickness = gvars.default_opening_thickness/(gvars.scale_2d_to_ifc*1000)
+        half_thicknesses = np.broadcast_to(np.asarray(thickness, dtype=float) / 2, wall_angles.shape)
+        half_lengths = (self.openings["length"][rows] / 2) - 1
+        cos_angles, sin_angles = np.cos(wall_angles), np.sin(wall_angles)
+        centers = np.stack((self.openings["cx"][rows], self.openings["cy"][rows]), axis=1)
+        along = np.stack((half_lengths * cos_angles, half_lengths * sin_angles), axis=1)
+        across = np.stack((-half_thicknesses * sin_angles, half_thicknesses * cos_angles), axis=1)
+        p1, p2 = centers + along, centers - along
+        return np.stack((p1 + across, p1 - across, p2 - across, p2 + across), axis=1)
+
+    def get_opening_polygons(self, rows=None, thickness=None):
+        return shapely.polygons(self.get_opening_corners(rows, thickness))
+
+
+class WallView:
+    # Lightweight read-only view over one row of the wall columns
+    __slots__ = ("store", "row")
+
+    def __init__(self, store:ElementStore, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def wall(self):
+        return self.store.wall_objects[self.row]
+
+    @property
+    def line(self):
+        columns = self.store.walls.columns
+        return ((columns["x1"][self.row], columns["y1"][self.row]), (columns["x2"][self.row], columns["y2"][self.row]))
+
+    @property
+    def thickness(self):
+        return self.store.walls.columns["thickness"][self.row]
+
+    @property
+    def class_id(self):
+        return self.store.walls.columns["class_id"][self.row]
+
+    @property
+    def center(self):
+        return self.store.walls.columns["cx"][self.row], self.store.walls.columns["cy"][self.row]
+
+    def get_length(self):
+        return self.store.walls.columns["length"][self.row]
+
+    def get_angle(self, direction_insenstive=False, to_degrees=False):
+        angle = self.store.walls.columns["angle"][self.row]
+        if direction_insenstive:
+            angle = angle % np.pi
+        if to_degrees:
+            return angle * 180 / np.pi
+        return angle
+
+
+class OpeningView:
+    # Lightweight read-only view over one row of the opening columns
+    __slots__ = ("store", "row")
+
+    def __init__(self, store:ElementStore, row):
+        self.store = store
+        self.row = row
+
+    @property
+    def opening(self):
+        return self.store.opening_objects[self.row]
+
+    @property
+    def center_point(self):
+        return self.store.openings.columns["cx"][self.row], self.store.openings.columns["cy"][self.row]
+
+    @property
+    def length(self):
+        return self.store.openings.columns["length"][self.row]
+
+    @property
+    def class_id(self):
+        return self.store.openings.columns["class_id"][self.row]
+
+    def get_polygon(self, thickness=None):
+        return shapely.Polygon(self.store.get_opening_corners(np.array([self.row]), thickness)[0])
@@ -1,20 +1,25 @@
 from __future__ import annotations
 
+from bisect import bisect_left, bisect_right
 from enum import Enum
 import os
 import numpy as np
 from shapely import MultiLineString
 from shapely.geometry import Polygon, LineString, Point, MultiPoint
 from shapely.affinity import translate
-import cv2
 
 from . import global_variables as gvars
+from .wall_graph import WallGraph
+from .debug_overlay import DebugOverlay
+from .element_store import ElementStore
 
 
 class ElementsManager:
 
-    def __init__(self):
-        self.nodes: list[Node] = []
+    def __init__(self, use_element_store=False):
+        self.graph = WallGraph()
+        self.store: ElementStore = ElementStore() if use_element_store else None # columnar geometry of walls and openings
+        self.debug_overlay = DebugOverlay(enabled=gvars.debug_overlay)
         self.node_id_counter = 0
         self.wall_id_counter = 0
         self.room_id_counter = 0
@@ -22,6 +27,10 @@ class ElementsManager:
         self.object_id_counter = 0
         self.outlet_id_counter = 0
         self.housing_id_counter = 0
+
+    @property
+    def nodes(self):
+        return self.graph.nodes.values()
     
 
 class Node:
@@ -29,43 +38,89 @@ class Node:
     def __init__(self, manager:ElementsManager, position, connections=None):   # connections = [(wall, index (0 if start 1 if end)), ...]
 
         self.node_id = manager.node_id_counter
-        self.position: tuple[int, int] = position
-        self.connections: list[Wall, float] = connections if connections else []
-        self.previously_visited_nodes_for_enclosed_area_detection = []
-        manager.nodes.append(self)
+        self.graph: WallGraph = manager.graph
+        self.graph.add_node(self, position)
         manager.node_id_counter += 1
+        for wall, distance_from_start in connections or []:
+            wall.connect_to_node(self, distance_from_start)
+
+    @property
+    def position(self) -> tuple[float, float]: # read back from the float array of the wall graph
+        return self.graph.get_node_position(self.node_id)
+
+    @position.setter
+    def position(self, position):
+        self.graph.set_node_position(self.node_id, position)
+
+    @property
+    def connections(self) -> tuple[Wall, float]: # ((wall, dist_from_start), ...), read-only view of the wall graph
+        return self.graph.get_node_connections(self.node_id)
 
     def remove(self, manager:ElementsManager):
-        for connection in self.connections:
-            wall = connection[0]
-            wall.connected_nodes[connection[1]] = None
-        manager.nodes.remove(self)
+        manager.graph.remove_node(self.node_id)
 
 class Wall:
+    # No per-instance dict, the line and thickness live in manager.store when it is used
+    __slots__ = ("id", "row", "_line", "_thickness", "line_with_offsets", "polygon", "ifc_element", "extension", "subwalls",
+                 "is_subwall", "parent_wall", "openings", "manager", "__weakref__")
 
     def __init__(self, manager:ElementsManager, polygon:Polygon, line:tuple[2], thickness, wall_id=None):
         if wall_id is not None:
             self.id = wall_id
         else:
             self.id = manager.wall_id_counter
-        self.line:tuple[2] = line
+        self.row = None # row in manager.store, which then holds the line and thickness
         self.line_with_offsets:tuple[2] = None
-        self.thickness = thickness
         self.polygon = polygon
         self.ifc_element = None
-        self.connected_nodes:list[Node, float] = [] # (connected_node, dist_from_start)
-        # self.connected_nodes: list[Node, Node] = [None, None] # ([connected_node_to_start_point], [connected_node_to_end_point])
         self.extension:list[Wall, Wall] = [None, None] # Extensions start/end, created when joining a wall that was already joined with other wall
         self.subwalls: list[Wall] = []
         self.is_subwall: bool = False
         self.parent_wall = None
         self.openings: list[Opening] = []
-        manager.wall_id_counter = max(manager.wall_id_counter + 1, self.id + 1)
         self.manager = manager
 
         # if line is same points, raise error
         if line[0] == line[1]:
             raise ValueError("Wall line cannot have same points")
+        manager.graph.add_wall(self)
+        manager.wall_id_counter = max(manager.wall_id_counter + 1, self.id + 1)
+        if manager.store is not None:
+            self.row = manager.store.add_wall(self)
+        self.line:tuple[2] = line
+        self.thickness = thickness
+
+
+    @property
+    def line(self) -> tuple[2]:
+        if self.row is not None:
+            return self.manager.store.get_wall_line(self.row)
+        return self._line
+
+    @line.setter
+    def line(self, line):
+        if self.row is not None:
+            self.manager.store.set_wall_line(self.row, line)
+        else:
+            self._line = line
+
+    @property
+    def thickness(self):
+        if self.row is not None:
+            return self.manager.store.get_wall_thickness(self.row)
+        return self._thickness
+
+    @thickness.setter
+    def thickness(self, thickness):
+        if self.row is not None:
+            self.manager.store.set_wall_thickness(self.row, thickness)
+        else:
+            self._thickness = thickness
+
+
+    @property
+    def connected_nodes(self) -> tuple[Node, float]: # ((connected_node, dist_from_start), ...) sorted by distance, read-only view of the wall graph
+        return self.manager.graph.get_wall_nodes(self.id)
 
 
     def get_corners(self):
@@ -75,6 +130,8 @@ class Wall:
     def create_subwall(self, polygon, line:tuple[2], thickness):
         subwall = Wall(self.manager, polygon, line, thickness, wall_id=None)
         subwall.is_subwall = True
+        if subwall.row is not None:
+            self.manager.store.set_wall_class(subwall.row, "subwall")
 
         if self.is_subwall:
             subwall.parent_wall = self.parent_wall
@@ -88,52 +145,45 @@ class Wall:
     
 
     def is_wall_start_connected(self):
-        if self.connected_nodes:
-            node, distance = self.connected_nodes[0]
+        first_node = self.manager.graph.get_first_node(self.id)
+        if first_node:
+            node, distance = first_node
             if distance < 1:
                 return True
         return False
     
     def is_wall_end_connected(self):
-        if self.connected_nodes:
-            node, distance = self.connected_nodes[-1]
+        last_node = self.manager.graph.get_last_node(self.id)
+        if last_node:
+            node, distance = last_node
             if distance > self.get_length() - 1:
                 return True
         return False
 
 
     def connect_to_node(self, node:Node, distance_from_start):
-        self.connected_nodes.append([node, distance_from_start])
-        node.connections.append([self, distance_from_start])
-        self.connected_nodes = sorted(self.connected_nodes, key=lambda x: x[1])
-
-    def connect_to_node_old(self, node:Node, point_index):
-        self.connected_nodes[point_index] = node
-        node.connections.append([self, point_index])
+        self.manager.graph.connect(self.id, node.node_id, distance_from_start)
 
     def get_next_node(self, node:Node):
-        for i, (node_i, dist_from_start) in enumerate(self.connected_nodes):
-            if node == node_i:
-                if i < len(self.connected_nodes) - 1:
-                    return self.connected_nodes[i + 1][0]
-        return None
+        return self.manager.graph.get_next_node(self.id, node.node_id)
     
     def get_previous_node(self, node:Node):
-        for i, (node_i, dist_from_start) in enumerate(self.connected_nodes):
-            if node == node_i:
-                if i > 0:
-                    return self.connected_nodes[i - 1][0]
-        return None
+        return self.manager.graph.get_previous_node(self.id, node.node_id)
 
         
     def get_length(self):
+        if self.row is not None:
+            return self.manager.store.walls.columns["length"][self.row]
         p1, p2 = self.line
         return np.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2)
     
 
     def get_angle(self, direction_insenstive=False, to_degrees=False):
-        p1, p2 = self.line
-        angle = np.arctan2(p2[1] - p1[1], p2[0] - p1[0])
+        if self.row is not None:
+            angle = self.manager.store.walls.columns["angle"][self.row]
+        else:
+            p1, p2 = self.line
+            angle = np.arctan2(p2[1] - p1[1], p2[0] - p1[0])
         if direction_insenstive:
             angle = angle % np.pi
 
@@ -184,6 +234,8 @@ class RoomCategory(Enum): # (id, code, name, color)
     
 
 class Room:
+    __slots__ = ("id", "manager", "polygon", "ifc_element", "name", "surrounding_node_ids", "surrounding_walls", "is_adjusted",
+                 "contains_objects", "category", "doors", "windows", "linearization", "connected_rooms", "part_of_housing", "roomsides")
 
     def __init__(self, manager:ElementsManager, polygon, room_id=None, name = "default_room", category = RoomCategory.UNDEFINED):
         if room_id is not None:
@@ -191,10 +243,11 @@ class Room:
         else:
             self.id = manager.room_id_counter
 
+        self.manager = manager
         self.polygon:Polygon = polygon
         self.ifc_element = None
         self.name = name
-        self.surrounding_nodes: list[Node] = []
+        self.surrounding_node_ids: list[int] = []
         self.surrounding_walls: list[Wall] = []
         self.is_adjusted = False
         self.contains_objects: list[Object] = []
@@ -207,6 +260,15 @@ class Room:
         self.roomsides: list[RoomSide] = []
         manager.room_id_counter = max(manager.room_id_counter + 1, self.id + 1)    
 
+    @property
+    def surrounding_nodes(self) -> list[Node]:
+        nodes = self.manager.graph.nodes
+        return [nodes[node_id] for node_id in self.surrounding_node_ids if node_id in nodes]
+
+    @surrounding_nodes.setter
+    def surrounding_nodes(self, nodes):
+        self.surrounding_node_ids = [node.node_id for node in nodes]
+
     def get_corners(self):
         return list(self.polygon.exterior.coords[:-1])
 
@@ -275,14 +337,13 @@ class Room:
         self.name = self.category.name
 
 
-    def get_intserection_with_room_side(self, roomside, obj, polygon:Polygon, img=None):
+    def get_intserection_with_room_side(self, roomside, obj, polygon:Polygon):
         if polygon.intersects(roomside.linestring):
             intersection_line = polygon.intersection(roomside.linestring)
             if intersection_line.geom_type == 'LineString':
                 intersection_line = [intersection_line.coords[0], intersection_line.coords[1]]
                 color = gvars.colors[obj.id % len(gvars.colors)]
-                if img is not None:
-                    cv2.line(img, (round(intersection_line[0][0]), round(intersection_line[0][1])), (round(intersection_line[1][0]), round(intersection_line[1][1])), color, 2)
+                self.manager.debug_overlay.line(intersection_line[0], intersection_line[1], color, 2)
                 angle_intersection = np.degrees(np.arctan2(intersection_line[1][1] - intersection_line[0][1], intersection_line[1][0] - intersection_line[0][0]))
                 if abs(angle_intersection - roomside.angle_deg) > 90:
                     intersection_line = intersection_line[::-1] # Points clockwise
@@ -290,32 +351,10 @@ class Room:
         return None
 
 
-    def linearize(self, img, print_details=False) :
-    
-        room_coords = list(self.polygon.exterior.coords)
-        for i in range(len(room_coords) - 1):
-            p1 = room_coords[i]
-            p2 = room_coords[(i + 1) % len(room_coords)]
-            roomside = RoomSide(self, i, (p1, p2))
-            self.roomsides.append(roomside)
+    def linearize(self, img=None, print_details=False) : # debug drawings go to manager.debug_overlay, img is unused
+        from .linearization import Linearizer
 
-            for obj in self.contains_objects:
-                buffered_polygon = obj.polygon.buffer(0.07 / gvars.scale_2d_to_ifc)
-                intersection_line = self.get_intserection_with_room_side(roomside, obj, buffered_polygon, img)
-                if intersection_line:
-                    roomside.add_element(obj, intersection_line)
-
-            for window in self.windows:
-                window_polygon = window.get_polygon(thickness=window.corresponding_wall.thickness + (0.2/gvars.scale_2d_to_ifc))
-                intersection_line = self.get_intserection_with_room_side(roomside, window, window_polygon, img)
-                if intersection_line:
-                    roomside.add_element(window, intersection_line)
-            
-            for door in self.doors:
-                door_polygon = door.get_polygon(thickness=door.corresponding_wall.thickness + (0.2/gvars.scale_2d_to_ifc))
-                intersection_line = self.get_intserection_with_room_side(roomside, door, door_polygon, img)
-                if intersection_line:
-                    roomside.add_element(door, intersection_line)
+        Linearizer([self]).linearize()
 
 
     def get_longest_roomsides(self, number):
@@ -330,6 +369,9 @@ class RoomSide:
         self.index = index
         self.line = ((round(line[0][0]), round(line[0][1])), (round(line[1][0]), round(line[1][1])))
         self.contained_elements: list[tuple[2]] = [] # [(element, position on side), ...]
+        # Occupied spans of the side: sorted, merged and disjoint intervals [start, end]
+        self.occupied_starts: list[float] = []
+        self.occupied_ends: list[float] = []
         self.linestring = LineString(line)
         self.length = round(self.linestring.length)
         self.angle_deg = np.degrees(np.arctan2(line[1][1] - line[0][1], line[1][0] - line[0][0]))
@@ -347,7 +389,36 @@ class RoomSide:
                 position_start_end_on_side = (pos_start, pos_end)
 
             if position_start_end_on_side:
-                self.contained_elements.append((element, position_start_end_on_side))
+                self.add_element_position(element, position_start_end_on_side)
+
+
+    def add_element_position(self, element, position_start_end_on_side:tuple[2]):
+        self.contained_elements.append((element, position_start_end_on_side))
+        self.add_occupied_span(*position_start_end_on_side)
+
+
+    def add_occupied_span(self, start, end):
+        start, end = min(start, end), max(start, end)
+        # Spans overlapping or touching [start, end] are merged with it
+        first = bisect_left(self.occupied_ends, start)
+        last = bisect_right(self.occupied_starts, end)
+        if first < last:
+            start = min(start, self.occupied_starts[first])
+            end = max(end, self.occupied_ends[last - 1])
+        self.occupied_starts[first:last] = [start]
+        self.occupied_ends[first:last] = [end]
+
+
+    def get_free_segments(self, margin=0, min_length=0):
+        # Free parts of the side (between 0 and length), kept at margin from the occupied spans and the side ends
+        free_segments = []
+        previous_end = 0
+        for start, end in zip(self.occupied_starts + [self.length], self.occupied_ends + [self.length]):
+            segment = (previous_end + margin, start - margin)
+            if segment[1] - segment[0] >= min_length:
+                free_segments.append(segment)
+            previous_end = end
+        return free_segments
 
 
     def get_position_on_side(self, point:tuple[2]):
@@ -364,37 +435,92 @@ class RoomSide:
     def is_position_valid(self, position):
         if position < 0 or position > self.length:
             return False
-        for elem in self.contained_elements:
-            if elem[1][0] <= position <= elem[1][1]:
-                return False
-        return True
+        span = bisect_right(self.occupied_starts, position) - 1
+        return span < 0 or position > self.occupied_ends[span]
 
 
 class Opening:
+    # No per-instance dict, the center point, length, wall and class live in manager.store when it is used
+    __slots__ = ("id", "manager", "row", "_center_point", "_length", "_corresponding_wall", "_classname", "ifc_element",
+                 "polygon", "connects_rooms", "score", "__weakref__")
 
     def __init__(self, manager:ElementsManager, center_point, corresponding_wall:Wall, length, opening_id=None, classname="door", score=0.0):
         if opening_id is not None:
             self.id = opening_id
         else:
             self.id = manager.opening_id_counter
+        self.manager = manager
+        # row in manager.store, which then holds the center point, length, wall and class
+        self.row = manager.store.add_opening(self) if manager.store is not None else None
         self.center_point = center_point
         self.corresponding_wall: Wall = corresponding_wall
         corresponding_wall.openings.append(self)     
         self.length = length
         self.ifc_element = None
         manager.opening_id_counter = max(manager.opening_id_counter + 1, self.id + 1)
-        self.polygon:Polygon = self.get_polygon()
         self.classname = classname
+        self.polygon:Polygon = self.get_polygon()
         self.connects_rooms: list[Room, Room] = [None, None]
         self.score = score
 
 
+    @property
+    def center_point(self) -> tuple[2]:
+        if self.row is not None:
+            return self.manager.store.get_opening_center(self.row)
+        return self._center_point
+
+    @center_point.setter
+    def center_point(self, center_point):
+        if self.row is not None:
+            self.manager.store.set_opening_center(self.row, center_point)
+        else:
+            self._center_point = center_point
+
+    @property
+    def length(self):
+        if self.row is not None:
+            return self.manager.store.get_opening_length(self.row)
+        return self._length
+
+    @length.setter
+    def length(self, length):
+        if self.row is not None:
+            self.manager.store.set_opening_length(self.row, length)
+        else:
+            self._length = length
+
+    @property
+    def corresponding_wall(self) -> Wall:
+        return self._corresponding_wall
+
+    @corresponding_wall.setter
+    def corresponding_wall(self, wall):
+        if self.row is not None:
+            self.manager.store.set_opening_wall(self.row, wall)
+        self._corresponding_wall = wall
+
+    @property
+    def classname(self):
+        return self._classname
+
+    @classname.setter
+    def classname(self, classname):
+        if self.row is not None:
+            self.manager.store.set_opening_class(self.row, classname)
+        self._classname = classname
+
+
+    def remove(self, manager:ElementsManager):
+        if self in self.corresponding_wall.openings:
+            self.corresponding_wall.openings.remove(self)
+        if self.row is not None:
+            manager.store.remove_opening(self.row)
+
+
     def find_adjacent_rooms(self, rooms_list: list[Room]):
 
-        ortho_dist = self.corresponding_wall.thickness / 2 + (0.3 / gvars.scale_2d_to_ifc)
-        ortho_angle = (self.corresponding_wall.get_angle(direction_insenstive=True, to_degrees=False) + np.pi/2) % np.pi
-        p1 = (self.center_point[0] + ortho_dist * np.cos(ortho_angle), self.center_point[1] + ortho_dist * np.sin(ortho_angle))
-        p2 = (self.center_point[0] - ortho_dist * np.cos(ortho_angle), self.center_point[1] - ortho_dist * np.sin(ortho_angle))
+        p1, p2 = self.get_adjacent_rooms_test_points()
 
         room1, room2 = None, None
         for room in rooms_list:
@@ -403,6 +529,20 @@ class Opening:
             elif room.polygon.contains(Point(p2)):
                 room2 = room
 
+        return self.connect_rooms(room1, room2)
+
+
+    def get_adjacent_rooms_test_points(self):
+        # Points on both sides of the wall, just outside of it
+        ortho_dist = self.corresponding_wall.thickness / 2 + (0.3 / gvars.scale_2d_to_ifc)
+        ortho_angle = (self.corresponding_wall.get_angle(direction_insenstive=True, to_degrees=False) + np.pi/2) % np.pi
+        p1 = (self.center_point[0] + ortho_dist * np.cos(ortho_angle), self.center_point[1] + ortho_dist * np.sin(ortho_angle))
+        p2 = (self.center_point[0] - ortho_dist * np.cos(ortho_angle), self.center_point[1] - ortho_dist * np.sin(ortho_angle))
+        return p1, p2
+
+
+    def connect_rooms(self, room1:Room, room2:Room):
+
         self.connects_rooms[0] = room1
         self.connects_rooms[1] = room2
 
@@ -427,6 +567,8 @@ class Opening:
     
 
     def get_polygon(self, thickness=None):
+        if self.row is not None:
+            return Polygon(self.manager.store.get_opening_corners(np.array([self.row]), thickness)[0])
         if thickness is None:
             thickness = gvars.default_opening_thickness/(gvars.scale_2d_to_ifc*1000)
         wall_angle = self.corresponding_wall.get_angle()
@@ -453,6 +595,9 @@ class ObjectSideAgainstWall(Enum):
     NONE = 3
 
 class Object:
+    __slots__ = ("id", "classname", "typename", "ifc_class", "ifc_predefined_type", "ifc_type_name", "shortest_edge_length",
+                 "shortest_long_edge_length", "side_against_wall", "polygon", "ifc_element", "origin_point", "angle", "depth",
+                 "width", "contained_in_room", "score", "manager", "ifc_obj_width", "ifc_obj_depth")
 
     def __init__(self, manager:ElementsManager, classname, shapely_polygon:Polygon, obj_id=None, score=0.0):
 
@@ -476,6 +621,7 @@ class Object:
         self.width = 0
         self.contained_in_room:Room = None
         self.score = score
+        self.manager = manager
         manager.object_id_counter = max(manager.object_id_counter + 1, self.id + 1)
 
 
@@ -540,12 +686,16 @@ class Object:
     def set_room_container(self, rooms_list: list[Room]):
         for room in rooms_list:
             if room.polygon.contains(Point(self.get_center_point())):
-                self.contained_in_room = room
-                room.contains_objects.append(self)
+                self.set_room(room)
                 break
 
 
-    def set_origin_point_and_angle(self, img, walls_list, walls_tree):
+    def set_room(self, room:Room):
+        self.contained_in_room = room
+        room.contains_objects.append(self)
+
+
+    def set_origin_point_and_angle(self, img, walls_list, walls_tree): # debug drawings go to manager.debug_overlay, img is unused
 
         sides_to_check = []
         set_next_to_wall = False
@@ -597,7 +747,7 @@ class Object:
             p1 = Point(center_point[0] - dx, center_point[1] - dy)
             p2 = Point(center_point[0] + dx, center_point[1] + dy)
             extension_line = LineString([p1, p2])
-            cv2.line(img, (int(p1.x), int(p1.y)), (int(p2.x), int(p2.y)), (0, 128, 0), 1)
+            self.manager.debug_overlay.line((int(p1.x), int(p1.y)), (int(p2.x), int(p2.y)), (0, 128, 0), 1)
 
             if self.contained_in_room is not None:
 
@@ -707,7 +857,8 @@ class Outlet:
         self.angle = angle # angle en rad orienté par rapport à l'axe vertical orienté vers le bas (0, -1)
         self.ifc_element = None
         self.contained_in_room = room
-        roomside.add_element(self, [x,y])
+        if roomside is not None:
+            roomside.add_element(self, [x,y])
         self.symbol_lateral_offset = 0 # en pixels
         manager.outlet_id_counter = max(manager.outlet_id_counter + 1, self.id + 1)
 
@@ -728,6 +879,7 @@ class Housing:
         self.rooms: list[Room] = []
         self.type = "undefined"
         self.area = 0
+        self.bedroom_count = 0
 
         if id is not None:
             self.id = id
@@ -737,10 +889,13 @@ class Housing:
 
 
     def add_room(self, room: Room):
+        # Aggregates updated with the added room only (process_housing_type/process_area recompute them from all the rooms)
         self.rooms.append(room)
         room.part_of_housing = self
-        self.type = self.process_housing_type()
-        self.area = self.process_area()
+        if room.category == RoomCategory.BEDROOM:
+            self.bedroom_count += 1
+        self.type = "T" + str(self.bedroom_count + 1)
+        self.area += room.polygon.area
 
 
     def process_housing_type(self):
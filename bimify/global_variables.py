@@ -33,6 +33,9 @@ min_room_area = 0.03 / (scale_2d_to_ifc**2) # surface minimale d'une pièce en m
 max_gt_area = 1.0 / (scale_2d_to_ifc**2)
 ocr_conf = 0.2 # seuil de confiance pour lire une étiquette de pièce avec OCR
 
+# Debug
+debug_overlay = False # enregistre les tracés de debug (intersections, lignes d'extension...) pour les dessiner à la fin sur le plan
+
 # Paramètres pour la détection des objets, dimensions en mètres, puis conversion en unité 2d
 min_score_for_objects_detection = 0.2
 
@@ -58,6 +61,12 @@ default_slab_thickness = 200 # épaisseur des dalles
 
 default_outlet_height = 300 # hauteur des prises électriques
 
+# Placement des prises
+outlet_min_spacing = 1.0 / scale_2d_to_ifc # distance minimale entre deux prises d'une même paroi
+outlet_margin = 0.15 / scale_2d_to_ifc # distance minimale entre une prise et un angle ou un élément de la paroi (porte, fenêtre, objet)
+outlets_per_room_category = {"sejour": 5, "cuisine": 6, "chambre": 3, "sdb": 1, "buanderie": 2, "couloir": 1, "circulation": 0} # nombre de prises par type de pièce (code), 0 si absent
+rj45_per_room_category = {"sejour": 1, "chambre": 1} # nombre de prises RJ45 par type de pièce (code), 0 si absent
+
 
 
 # Prédiction des objets :
@@ -0,0 +1,58 @@
+from .elements import ElementsManager, Housing, Opening, Room, RoomCategory
+
+
+# Common parts of the building: the housings are separated at these rooms, which belong to no housing
+BREAK_CATEGORIES = (RoomCategory.ACCESS, RoomCategory.HALLWAY, RoomCategory.STAIRS, RoomCategory.ELEVATOR, RoomCategory.SHAFT)
+
+
+class HousingSegmenter:
+    # Housings of a plan: connected components of the rooms linked by doors (Opening.connects_rooms), computed with
+    # a union-find over the rooms, without crossing the common parts. Linear in the number of rooms and doors
+    def __init__(self, manager:ElementsManager, break_categories=BREAK_CATEGORIES):
+        self.manager = manager
+        self.break_categories = set(break_categories)
+
+    def find(self, parents, index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]] # path halving
+            index = parents[index]
+        return index
+
+    def union(self, parents, sizes, index1, index2):
+        root1, root2 = self.find(parents, index1), self.find(parents, index2)
+        if root1 == root2:
+            return
+        if sizes[root1] < sizes[root2]:
+            root1, root2 = root2, root1
+        parents[root2] = root1
+        sizes[root1] += sizes[root2]
+
+    def get_doors(self, rooms:list[Room]):
+        doors = {}
+        for room in rooms:
+            for door in room.doors:
+                doors[id(door)] = door
+        return list(doors.values())
+
+    def segment(self, rooms:list[Room], doors:list[Opening]=None):
+        # Creates the housings (in the order of their first room) and fills room.part_of_housing
+        rooms = [room for room in rooms if room.category not in self.break_categories]
+        room_indices = {id(room): room_num for room_num, room in enumerate(rooms)}
+        parents = list(range(len(rooms)))
+        sizes = [1] * len(rooms)
+
+        for door in (doors if doors is not None else self.get_doors(rooms)):
+            room1, room2 = door.connects_rooms
+            if room1 is None or room2 is None:
+                continue
+            index1, index2 = room_indices.get(id(room1)), room_indices.get(id(room2))
+            if index1 is not None and index2 is not None:
+                self.union(parents, sizes, index1, index2)
+
+        housings = {}
+        for room_num, room in enumerate(rooms):
+            root = self.find(parents, room_num)
+            if root not in housings:
+                housings[root] = Housing(self.manager)
+            housings[root].add_room(room)
+        return list(housings.values())
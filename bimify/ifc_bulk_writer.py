@@ -0,0 +1,305 @@
+import numpy as np
+import ifcopenshell
+import ifcopenshell.guid
+import ifcopenshell.util.unit
+
+from . import global_variables as gvars
+
+
+class RelationshipBatch:
+    # Relations collected during the export and written once in flush(): one IfcRelAggregates and one
+    # IfcRelContainedInSpatialStructure per relating object (an existing one is extended once), instead of
+    # rewriting the growing relation tuples for every element. Voids and fillings are created in bulk
+    def __init__(self):
+        self.aggregates = {} # {relating object id: (relating object, [products])}
+        self.containment = {} # {relating structure id: (relating structure, [products])}
+        self.voids = [] # [(building element, opening element)]
+        self.fillings = [] # [(opening element, filling element)]
+
+    def aggregate(self, relating_object, products):
+        self.aggregates.setdefault(relating_object.id(), (relating_object, []))[1].extend(products)
+
+    def contain(self, relating_structure, products):
+        self.containment.setdefault(relating_structure.id(), (relating_structure, []))[1].extend(products)
+
+    def void(self, element, opening):
+        self.voids.append((element, opening))
+
+    def fill(self, opening, element):
+        self.fillings.append((opening, element))
+
+    def flush(self, model):
+        for relating_object, products in self.aggregates.values():
+            relations = relating_object.IsDecomposedBy
+            if relations:
+                relations[0].RelatedObjects = relations[0].RelatedObjects + tuple(products)
+            else:
+                model.create_entity("IfcRelAggregates", GlobalId=ifcopenshell.guid.new(), RelatingObject=relating_object, RelatedObjects=products)
+
+        for relating_structure, products in self.containment.values():
+            relations = relating_structure.ContainsElements
+            if relations:
+                relations[0].RelatedElements = relations[0].RelatedElements + tuple(products)
+            else:
+                model.create_entity("IfcRelContainedInSpatialStructure", GlobalId=ifcopenshell.guid.new(), RelatingStructure=relating_structure, RelatedElements=products)
+
+        for element, opening in self.voids:
+            model.create_entity("IfcRelVoidsElement", GlobalId=ifcopenshell.guid.new(), RelatingBuildingElement=element, RelatedOpeningElement=opening)
+        for opening, element in self.fillings:
+            model.create_entity("IfcRelFillsElement", GlobalId=ifcopenshell.guid.new(), RelatingOpeningElement=opening, RelatedBuildingElement=element)
+
+        self.aggregates = {}
+        self.containment = {}
+        self.voids = []
+        self.fillings = []
+
+
+class IfcBulkWriter:
+    # Bulk mode of IFCModelHandler: walls, spaces, openings and slabs are written with direct entity creation
+    # from arrays of footprints, without the validation and bookkeeping of ifcopenshell.api.run for every element.
+    # All the products share one identity placement (relative to the storey) and one set of directions,
+    # and the styles are assigned in one batch at the end of each call. The relations go to the RelationshipBatch of the handler.
+    # With shared_representations, rectangular footprints (most walls and openings, a handful of distinct sizes) are written
+    # as an IfcMappedItem of one IfcRepresentationMap per rounded (length, width, height, elevation, style),
+    # the map holding an IfcRectangleProfileDef extrusion
+    def __init__(self, model, storey, body, relationships:RelationshipBatch, shared_representations=True):
+        self.model = model
+        self.relationships = relationships
+        self.shared_representations = shared_representations
+        self.body = body
+        # Footprints are converted to metres, then to the project length unit (as the api does)
+        self.unit_scale = ifcopenshell.util.unit.calculate_unit_scale(model)
+        self.origin = model.createIfcCartesianPoint((0., 0., 0.))
+        self.directions = {
+            1: model.createIfcDirection((0., 0., 1.)),
+            -1: model.createIfcDirection((0., 0., -1.)),
+        }
+        self.direction_x = model.createIfcDirection((1., 0., 0.))
+        self.identity_axis = model.createIfcAxis2Placement3D(self.origin, self.directions[1], self.direction_x)
+        self.storey_placements = {} # {storey id: IfcLocalPlacement relative to the storey}
+        self.elevation_axes = {} # {(elevation, direction): IfcAxis2Placement3D}
+        self.profile_position = model.createIfcAxis2Placement2D(model.createIfcCartesianPoint((0., 0.)), None)
+        self.representation_maps = {} # {(length, width, height, elevation, style id): IfcRepresentationMap}
+        self.mapping_directions = {} # {rounded angle: IfcDirection}
+        # Tolerance of the rectangle test, in project units (footprints are rounded to the millimetre)
+        self.rectangle_tolerance = 0.002 / self.unit_scale
+        self.pending_styles = [] # [(representation item, style)]
+        self.set_storey(storey)
+
+    def set_storey(self, storey):
+        # The representation maps and directions are shared by all the storeys, the placement is one per storey
+        self.storey = storey
+        if storey.id() not in self.storey_placements:
+            self.storey_placements[storey.id()] = self.model.createIfcLocalPlacement(storey.ObjectPlacement, self.identity_axis)
+        self.placement = self.storey_placements[storey.id()]
+
+    def convert_footprints(self, footprints):
+        # Plan coordinates (pixels) -> closed profile coordinates in project units, Y axis flipped.
+        # All the footprints are transformed in one pass over their concatenated coordinates
+        if len(footprints) == 0:
+            return []
+        arrays = [np.asarray(footprint, dtype=float).reshape(-1, 2) for footprint in footprints]
+        counts = np.array([len(coords) for coords in arrays])
+        ends = np.cumsum(counts)
+        coords = np.round(np.concatenate(arrays) * gvars.scale_2d_to_ifc, 3)
+        coords[:, 1] *= -1
+        coords /= self.unit_scale
+
+        # Closing point for the open footprints
+        firsts = coords[ends - counts]
+        open_footprints = np.any(firsts != coords[ends - 1], axis=1)
+        coords = np.insert(coords, ends[open_footprints], firsts[open_footprints], axis=0)
+        ends = np.cumsum(counts + open_footprints)
+        return np.split(coords, ends[:-1])
+
+    def create_profile(self, coords):
+        if self.model.schema == "IFC2X3":
+            points = [self.model.createIfcCartesianPoint(point) for point in coords.tolist()]
+            curve = self.model.createIfcPolyline(points)
+        else:
+            # One point list per profile instead of one entity per vertex
+            curve = self.model.createIfcIndexedPolyCurve(self.model.createIfcCartesianPointList2D(coords.tolist()), None, False)
+        return self.model.createIfcArbitraryClosedProfileDef("AREA", None, curve)
+
+    def get_elevation_axis(self, elevation, direction):
+        key = (float(elevation), direction)
+        if key not in self.elevation_axes:
+            placement_point = self.model.createIfcCartesianPoint((0.0, 0.0, float(elevation)))
+            self.elevation_axes[key] = self.model.createIfcAxis2Placement3D(placement_point, self.directions[direction], self.direction_x)
+        return self.elevation_axes[key]
+
+    def get_rectangle(self, coords):
+        # (center, angle, length, width) of a closed footprint of 4 corners forming a rectangle, None otherwise
+        if len(coords) != 5:
+            return None
+        corners = np.asarray(coords[:4])
+        sides = np.roll(corners, -1, axis=0) - corners
+        lengths = np.hypot(sides[:, 0], sides[:, 1])
+        if lengths.min() <= self.rectangle_tolerance:
+            return None
+        if np.abs(sides[0] + sides[2]).max() > self.rectangle_tolerance or np.abs(sides[1] + sides[3]).max() > self.rectangle_tolerance:
+            return None
+        if abs(np.dot(sides[0], sides[1])) / lengths[0] > self.rectangle_tolerance:
+            return None
+        # A rectangle is unchanged by a half turn: angles in [0, pi) so that more placements share their direction
+        angle = np.arctan2(sides[0, 1], sides[0, 0]) % np.pi
+        return corners.mean(axis=0), angle, lengths[0], lengths[1]
+
+    def get_representation_map(self, length, width, height, elevation, style):
+        key = (round(length * self.unit_scale, 3), round(width * self.unit_scale, 3), float(height), float(elevation), style.id() if style is not None else None)
+        if key not in self.representation_maps:
+            direction = -1 if height < 0 else 1
+            axis_placement = self.get_elevation_axis(elevation, direction) if elevation else None
+            profile = self.model.createIfcRectangleProfileDef("AREA", None, self.profile_position, key[0] / self.unit_scale, key[1] / self.unit_scale)
+            extrusion = self.model.createIfcExtrudedAreaSolid(profile, axis_placement, self.directions[direction], float(abs(height)))
+            representation = self.model.createIfcShapeRepresentation(self.body, "Body", "SweptSolid", [extrusion])
+            if style is not None:
+                self.pending_styles.append((extrusion, style))
+            self.representation_maps[key] = self.model.createIfcRepresentationMap(self.identity_axis, representation)
+        return self.representation_maps[key]
+
+    def get_mapping_direction(self, angle):
+        key = round(float(angle), 6)
+        if key not in self.mapping_directions:
+            self.mapping_directions[key] = self.model.createIfcDirection((float(np.cos(key)), float(np.sin(key)), 0.))
+        return self.mapping_directions[key]
+
+    def create_mapped_representation(self, rectangle, height, elevation=0, style=None):
+        center, angle, length, width = rectangle
+        representation_map = self.get_representation_map(length, width, height, elevation, style)
+        mapping_target = self.model.createIfcCartesianTransformationOperator3D(
+            self.get_mapping_direction(angle), None, self.model.createIfcCartesianPoint((float(center[0]), float(center[1]), 0.)), None, None
+        )
+        mapped_item = self.model.createIfcMappedItem(representation_map, mapping_target)
+        representation = self.model.createIfcShapeRepresentation(self.body, "Body", "MappedRepresentation", [mapped_item])
+        return self.model.createIfcProductDefinitionShape(None, None, [representation])
+
+    def create_extrusion_representation(self, coords, height, elevation=0, style=None):
+        rectangle = self.get_rectangle(coords) if self.shared_representations else None
+        if rectangle is not None:
+            return self.create_mapped_representation(rectangle, height, elevation, style)
+
+        direction = -1 if height < 0 else 1
+        axis_placement = self.get_elevation_axis(elevation, direction) if elevation else None
+        extrusion = self.model.createIfcExtrudedAreaSolid(self.create_profile(coords), axis_placement, self.directions[direction], float(abs(height)))
+        representation = self.model.createIfcShapeRepresentation(self.body, "Body", "SweptSolid", [extrusion])
+        if style is not None:
+            self.pending_styles.append((extrusion, style))
+        return self.model.createIfcProductDefinitionShape(None, None, [representation])
+
+    def create_products(self, ifc_class, footprints, heights, names, elevations=None, predefined_type=None, styles=None, attributes=None):
+        # One product per footprint, heights/elevations/styles are scalars or one value per footprint
+        count = len(footprints)
+        heights = np.broadcast_to(np.asarray(heights, dtype=float), (count,))
+        elevations = np.broadcast_to(np.asarray(elevations if elevations is not None else 0.0, dtype=float), (count,))
+        styles = styles if isinstance(styles, (list, tuple)) else [styles] * count
+        products = []
+        for coords, height, elevation, name, style in zip(self.convert_footprints(footprints), heights.tolist(), elevations.tolist(), names, styles):
+            product = self.model.create_entity(
+                ifc_class,
+                GlobalId=ifcopenshell.guid.new(),
+                Name=name,
+                ObjectPlacement=self.placement,
+                Representation=self.create_extrusion_representation(coords, height, elevation, style),
+                **(attributes or {})
+            )
+            if predefined_type is not None:
+                product.PredefinedType = predefined_type
+            products.append(product)
+        return products
+
+    def assign_styles(self):
+        for item, style in self.pending_styles:
+            self.model.createIfcStyledItem(item, [style], style.Name)
+        self.pending_styles = []
+
+    # Elements
+
+    def create_walls(self, walls_list, height, style=None):
+        ifc_walls = self.create_products(
+            "IfcWall",
+            [wall.polygon.exterior.coords[:-1] for wall in walls_list],
+            height,
+            [f"wall_{wall.id}" for wall in walls_list],
+            predefined_type="STANDARD",
+            styles=style,
+        )
+        for wall, ifc_wall in zip(walls_list, ifc_walls):
+            wall.ifc_element = ifc_wall
+        self.assign_styles()
+        self.relationships.contain(self.storey, ifc_walls)
+        return ifc_walls
+
+    def create_spaces(self, rooms, height, styles):
+        ifc_spaces = self.create_products(
+            "IfcSpace",
+            [room.polygon.exterior.coords for room in rooms],
+            height,
+            [room.name for room in rooms],
+            predefined_type="INTERNAL",
+            styles=styles,
+        )
+        for room, ifc_space in zip(rooms, ifc_spaces):
+            area = room.polygon.area * gvars.scale_2d_to_ifc ** 2
+            ifc_space.ObjectType = room.name
+            ifc_space.CompositionType = "ELEMENT"
+            ifc_space.LongName = str(room.id)
+            ifc_space.Description = f"Area: {str(round(area, 2))} m²"
+            room.ifc_element = ifc_space
+        self.assign_styles()
+        self.relationships.aggregate(self.storey, ifc_spaces)
+        return ifc_spaces
+
+    def create_openings(self, openings_list, door_style=None, window_style=None):
+        is_window = [opening.classname == "window" for opening in openings_list]
+        heights = [gvars.default_window_height if window else gvars.default_door_height for window in is_window]
+        sill_heights = [gvars.default_window_sill_height if window else 0.0 for window in is_window]
+        ifc_openings = []
+        for ifc_class, predefined_type, style, selected in (
+            ("IfcWindow", "WINDOW", window_style, True),
+            ("IfcDoor", "DOOR", door_style, False),
+        ):
+            indices = [i for i, window in enumerate(is_window) if window == selected]
+            products = self.create_products(
+                ifc_class,
+                [openings_list[i].get_corners() for i in indices],
+                [heights[i] for i in indices],
+                [f"opening_{openings_list[i].id}" for i in indices],
+                elevations=[sill_heights[i] for i in indices],
+                predefined_type=predefined_type,
+                styles=style,
+            )
+            for i, product in zip(indices, products):
+                openings_list[i].ifc_element = product
+            ifc_openings.extend(products)
+        self.assign_styles()
+
+        # Openings in the walls, with their voids and fillings
+        walls = [opening.corresponding_wall if opening.corresponding_wall.is_subwall == False else opening.corresponding_wall.parent_wall for opening in openings_list]
+        ifc_opening_elements = self.create_products(
+            "IfcOpeningElement",
+            [opening.get_corners(thickness=wall.thickness + 10) for opening, wall in zip(openings_list, walls)],
+            heights,
+            [f"opening_{opening.id}" for opening in openings_list],
+            elevations=sill_heights,
+            attributes={"ObjectType": "Opening"},
+        )
+        for opening, wall, ifc_opening_element in zip(openings_list, walls, ifc_opening_elements):
+            self.relationships.void(wall.ifc_element, ifc_opening_element)
+            self.relationships.fill(ifc_opening_element, opening.ifc_element)
+
+        self.relationships.contain(self.storey, ifc_openings)
+        return ifc_openings
+
+    def create_slabs(self, polygons, thickness, names, style=None):
+        ifc_slabs = self.create_products(
+            "IfcSlab",
+            [polygon.exterior.coords for polygon in polygons],
+            -thickness,
+            names,
+            predefined_type="FLOOR",
+            styles=style,
+        )
+        self.assign_styles()
+        self.relationships.contain(self.storey, ifc_slabs)
+        return ifc_slabs
@@ -6,19 +6,30 @@ import ifcopenshell
 import ifcopenshell.api.geometry.assign_representation
 import ifcopenshell.util.placement
 import ifcopenshell.util.representation
+import ifcopenshell.util.unit
 import numpy as np
 from shapely.geometry import Polygon
 
 from . import global_variables as gvars
 from .elements import *
+from .ifc_bulk_writer import IfcBulkWriter, RelationshipBatch
+from .object_library import get_object_library
 
 
 class IFCModelHandler:
-    def __init__(self):
+    def __init__(self, bulk_writer=False, shared_representations=True):
         self.model = None
         self.body = None
         self.storey = None
+        self.building = None
+        self.storey_elevation = 0.0 # elevation of the current storey in metres
+        self.color_styles = {} # {(name, red, green, blue, transparency): IfcSurfaceStyle}
+        self.bulk_writer = bulk_writer # Walls, spaces, openings and slabs written with IfcBulkWriter
+        self.shared_representations = shared_representations # Bulk writer: repeated rectangular shapes written once as IfcRepresentationMap
+        self.writer = None
+        self.relationships = RelationshipBatch() # Aggregation, containment, voids and fillings, written by flush_relationships
         self.library_filename = os.path.join(gvars.root_folder, "resources", "object_library.ifc")
+        self.library = None
         self.library_model = None
         self.type_names_to_ifc_object_types = {}
         self.object_type_wc = None
@@ -31,7 +42,7 @@ class IFCModelHandler:
 
 
 
-    def create_project(self):
+    def create_project(self, storey_name="FloorPlan", storey_elevation=0.0):
         self.model = ifcopenshell.file()
         project = run("root.create_entity", self.model, ifc_class="IfcProject", name="My Project")
         run("unit.assign_unit", self.model)
@@ -39,19 +50,54 @@ class IFCModelHandler:
         self.body = run("context.add_context", self.model, context_type="Model", context_identifier="Body", target_view="MODEL_VIEW", parent=context)
         site = run("root.create_entity", self.model, ifc_class="IfcSite", name="My Site")
         building = run("root.create_entity", self.model, ifc_class="IfcBuilding", name="My Building")
-        self.storey = run("root.create_entity", self.model, ifc_class="IfcBuildingStorey", name="FloorPlan")
-        self.storey.Elevation = 0.0
-        run("geometry.edit_object_placement", self.model, product=self.storey)
+        self.building = building
+        self.unit_scale = ifcopenshell.util.unit.calculate_unit_scale(self.model)
+        storey = self.create_storey(storey_name, storey_elevation)
         run("aggregate.assign_object", self.model, relating_object=project, products=[site])
         run("aggregate.assign_object", self.model, relating_object=site, products=[building])
-        run("aggregate.assign_object", self.model, relating_object=building, products=[self.storey])
+        run("aggregate.assign_object", self.model, relating_object=building, products=[storey])
+        if self.bulk_writer:
+            self.writer = IfcBulkWriter(self.model, storey, self.body, self.relationships, shared_representations=self.shared_representations)
+        self.set_storey(storey)
+
+
+    def create_storey(self, name, elevation):
+        # elevation in project units (mm)
+        storey = run("root.create_entity", self.model, ifc_class="IfcBuildingStorey", name=name)
+        storey.Elevation = float(elevation)
+        matrix = np.eye(4)
+        matrix[2, 3] = elevation * self.unit_scale
+        run("geometry.edit_object_placement", self.model, product=storey, matrix=matrix)
+        return storey
+
+
+    def add_storey(self, name, elevation):
+        # New storey of the building, the elements created next go to this storey
+        storey = self.create_storey(name, elevation)
+        self.relationships.aggregate(self.building, [storey])
+        self.set_storey(storey)
+        return storey
+
+
+    def set_storey(self, storey):
+        self.storey = storey
+        self.storey_elevation = (storey.Elevation or 0.0) * self.unit_scale
+        if self.writer:
+            self.writer.set_storey(storey)
+
+
+    def place_in_storey(self, product):
+        # Elements are placed before their containment is written (see flush_relationships): absolute placement at the storey elevation
+        matrix = np.eye(4)
+        matrix[2, 3] = self.storey_elevation
+        run("geometry.edit_object_placement", self.model, product=product, matrix=matrix)
 
 
     def convert_to_ifc_units(self, value):
         if isinstance(value, (int, float)):
             return value * gvars.scale_2d_to_ifc
-        elif isinstance(value, (list, tuple)):
-            return [self.convert_to_ifc_units(v) for v in value]
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            return (np.asarray(value, dtype=float) * gvars.scale_2d_to_ifc).tolist()
         else:
             return value
         
@@ -59,12 +105,16 @@ class IFCModelHandler:
     def create_ifc_walls_from_polygons(self, walls_list):
 
         default_wall_style = self.create_color_style("Default Wall Style", 0.9, 0.9, 0.7)
+        if self.writer:
+            self.writer.create_walls(walls_list, gvars.default_wall_height, style=default_wall_style)
+            return
+
         ifc_walls = []
 
         for wall in walls_list:
             ifc_walls.append(self.create_wall(wall, gvars.default_wall_height, f"wall_{wall.id}", style=default_wall_style))
 
-        run("spatial.assign_container", self.model, relating_structure=self.storey, products=ifc_walls)
+        self.relationships.contain(self.storey, ifc_walls)
 
 
     def create_ifc_spaces_from_enclosed_areas(self, rooms:list[Room]):
@@ -74,6 +124,10 @@ class IFCModelHandler:
             space_style = self.create_color_style(f"{room_cat.name} Space Style", room_cat.color[0],  room_cat.color[1],  room_cat.color[2], transparency=0.5)
             space_styles.append(space_style)
 
+        if self.writer:
+            rooms = [room for room in rooms if len(room.polygon.exterior.coords) >= 3]
+            self.writer.create_spaces(rooms, gvars.default_space_height, [space_styles[room.category.id] for room in rooms])
+            return
 
         ifc_space_count = 0
 
@@ -109,7 +163,7 @@ class IFCModelHandler:
 
         ifc_wall = run("root.create_entity", self.model, ifc_class="IfcWall", predefined_type="STANDARD")
         ifc_wall.Name = name
-        run("geometry.edit_object_placement", self.model, product=ifc_wall)
+        self.place_in_storey(ifc_wall)
 
         corners = self.convert_to_ifc_units(wall.polygon.exterior.coords[:-1])
         representation = self.assign_extrusion_representation(ifc_wall, corners, height, style=style)
@@ -123,10 +177,13 @@ class IFCModelHandler:
 
     def assign_extrusion_representation(self, ifc_element, corners, height, elevation=0, style=None):
         
-        if corners[0] != corners[-1]:
-            corners.append(corners[0])
+        coords = np.asarray(corners, dtype=float)
+        if not np.array_equal(coords[0], coords[-1]):
+            coords = np.vstack((coords, coords[:1]))
 
-        corners_as_floats = [(float(round(x, 3)), -float(round(y, 3))) for x, y in corners]
+        coords = np.round(coords, 3)
+        coords[:, 1] *= -1
+        corners_as_floats = [tuple(corner) for corner in coords.tolist()]
         base = run("profile.add_arbitrary_profile", self.model, profile=corners_as_floats) # Fonction modifiée dans librairie IfcOpenShell
 
         if height < 0:
@@ -150,11 +207,16 @@ class IFCModelHandler:
 
 
     def create_color_style(self, name, red, green, blue, transparency=0.0):
+        # One style per name and color in the model (created again for every storey otherwise)
+        key = (name, red, green, blue, transparency)
+        if key in self.color_styles:
+            return self.color_styles[key]
         style = ifcopenshell.api.run("style.add_style", self.model, name=name)
         ifcopenshell.api.run("style.add_surface_style", self.model, style=style, ifc_class="IfcSurfaceStyleShading", attributes={
                     "SurfaceColour": { "Name": None, "Red": red, "Green": green, "Blue": blue },
                     "Transparency": transparency,
                 })
+        self.color_styles[key] = style
         return style
 
 
@@ -170,8 +232,8 @@ class IFCModelHandler:
         # area = Polygon(polygon_coords).area
         ifc_space.Description = f"Area: {str(round(area, 2))} m²"
 
-        run("geometry.edit_object_placement", self.model, product=ifc_space)
-        run("aggregate.assign_object", self.model, products=[ifc_space], relating_object=self.storey)
+        self.place_in_storey(ifc_space)
+        self.relationships.aggregate(self.storey, [ifc_space])
 
         corners = self.convert_to_ifc_units(list(room.polygon.exterior.coords))
         representation = self.assign_extrusion_representation(ifc_space, corners, height, style=style)
@@ -185,7 +247,7 @@ class IFCModelHandler:
     def create_opening(self, door, height, sill_height, name, ifc_class, ifc_type, style=None):
         ifc_door = run("root.create_entity", self.model, ifc_class=ifc_class, predefined_type=ifc_type)
         ifc_door.Name = name
-        run("geometry.edit_object_placement", self.model, product=ifc_door)
+        self.place_in_storey(ifc_door)
 
         corners = self.convert_to_ifc_units(door.get_corners())
         representation = self.assign_extrusion_representation(ifc_door, corners, height, elevation=sill_height)
@@ -200,6 +262,10 @@ class IFCModelHandler:
     def create_ifc_openings_from_polygons(self, openings_list:list[Opening]):
         default_door_style = self.create_color_style("Default Door Style", 0.9, 0.5, 0.2)
         default_window_style = self.create_color_style("Default Window Style", 0.6, 0.8, 1.0, transparency=0.7)
+        if self.writer:
+            self.writer.create_openings(openings_list, door_style=default_door_style, window_style=default_window_style)
+            return
+
         ifc_openings = []
         door_count = 0
         window_count = 0
@@ -224,17 +290,17 @@ class IFCModelHandler:
             corresponding_wall = opening.corresponding_wall if opening.corresponding_wall.is_subwall == False else opening.corresponding_wall.parent_wall
             self.add_opening_to_wall(corresponding_wall, opening, height, sill_height)
 
-        run("spatial.assign_container", self.model, relating_structure=self.storey, products=ifc_openings)
+        self.relationships.contain(self.storey, ifc_openings)
 
 
     def add_opening_to_wall(self, wall, opening:Polygon, height, sill_height):
         ifc_opening = run("root.create_entity", self.model, ifc_class="IfcOpeningElement", name=f"opening_{opening.id}")
         corners = self.convert_to_ifc_units(opening.get_corners(thickness=wall.thickness + 10))
         self.assign_extrusion_representation(ifc_opening, corners, height, elevation=sill_height)
-        run("void.add_opening", self.model, opening=ifc_opening, element=wall.ifc_element)
-        ifcopenshell.api.run("void.add_filling", self.model, opening=ifc_opening, element=opening.ifc_element)
+        self.relationships.void(wall.ifc_element, ifc_opening)
+        self.relationships.fill(ifc_opening, opening.ifc_element)
         ifc_opening.ObjectType = "Opening"
-        run("geometry.edit_object_placement", self.model, product=ifc_opening)
+        self.place_in_storey(ifc_opening)
 
 
     def create_electrical_devices(self, elem_list:list[Outlet]):
@@ -275,7 +341,7 @@ class IFCModelHandler:
         location_matrix = np.eye(4)
         angle_deg = round(obj.angle * -1 * 180/np.pi)
         location_matrix = ifcopenshell.util.placement.rotation(angle_deg, "Z") @ location_matrix
-        location_matrix[:,3][0:3] = (origin_point[0], -origin_point[1], elevation)
+        location_matrix[:,3][0:3] = (origin_point[0], -origin_point[1], self.storey_elevation + elevation)
         run("geometry.edit_object_placement", self.model, product=obj_ifc, matrix=location_matrix)
 
 
@@ -284,9 +350,9 @@ class IFCModelHandler:
         ifc_obj = run("root.create_entity", self.model, ifc_class=generic_obj.ifc_class, predefined_type=generic_obj.ifc_predefined_type)
         ifc_obj.Name = name
         if generic_obj.contained_in_room and generic_obj.contained_in_room.ifc_element:
-            run("spatial.assign_container", self.model, relating_structure=generic_obj.contained_in_room.ifc_element, products=[ifc_obj])
+            self.relationships.contain(generic_obj.contained_in_room.ifc_element, [ifc_obj])
         else:
-            run("spatial.assign_container", self.model, relating_structure=self.storey, products=[ifc_obj])
+            self.relationships.contain(self.storey, [ifc_obj])
 
         generic_obj.ifc_element = ifc_obj
 
@@ -295,10 +361,13 @@ class IFCModelHandler:
 
     def create_slab(self, polygon, thickness, name, style=None):
 
+        if self.writer:
+            return self.writer.create_slabs([polygon], thickness, [name], style=style)[0]
+
         ifc_slab = run("root.create_entity", self.model, ifc_class="IfcSlab")
         ifc_slab.Name = name
-        run("spatial.assign_container", self.model, relating_structure=self.storey, products=[ifc_slab])
-        run("geometry.edit_object_placement", self.model, product=ifc_slab)
+        self.relationships.contain(self.storey, [ifc_slab])
+        self.place_in_storey(ifc_slab)
         ifc_slab.PredefinedType = "FLOOR"
         polygon_coords = self.convert_to_ifc_units(list(polygon.exterior.coords))
         representation = self.assign_extrusion_representation(ifc_slab, polygon_coords, -thickness)
@@ -307,26 +376,27 @@ class IFCModelHandler:
             ifcopenshell.api.run("style.assign_representation_styles", self.model, shape_representation=representation, styles=[style])
 
 
+    def flush_relationships(self):
+        self.relationships.flush(self.model)
+
+
     def save_ifc(self, filename=f"{gvars.root_folder}/output/pred_model.ifc"):
+        self.flush_relationships()
         self.model.write(filename)
 
 
     def get_library_object_type(self, name):
-        for obj_type in self.library_model.by_type("IfcTypeObject"):
-            if name.lower() == obj_type.Name.lower():
-                return obj_type
+        return self.library.get_type(name)
             
 
     def load_library_file(self):
-        try:
-            self.library_model = ifcopenshell.open(self.library_filename)
-        except:
-            self.library_model = ifcopenshell.open(os.path.basename(self.library_filename))
+        # Parsed once per process, see object_library
+        self.library = get_object_library(self.library_filename)
+        self.library_model = self.library.model
 
         ifc_type_names = [
             "wc", "sink", "shower", "bathtub", "bed-single", "bed-double", "outlet-simple", "outlet-rj45"
         ]
 
         for ifc_type_name in ifc_type_names:
-            source_objtype = self.get_library_object_type(ifc_type_name)
-            self.type_names_to_ifc_object_types[ifc_type_name] = self.model.add(source_objtype)
+            self.type_names_to_ifc_object_types[ifc_type_name] = self.library.copy_type(ifc_type_name, self.model)
@@ -0,0 +1,84 @@
+import numpy as np
+import shapely
+
+from . import global_variables as gvars
+from .elements import Room, RoomSide
+
+
+# Order of the element kinds on a side, as in the original per-room loop
+OBJECT, WINDOW, DOOR = 0, 1, 2
+
+
+class Linearizer:
+    # Linearization of the sides of all the rooms of a floor in one batch: the footprint of every element
+    # is computed once (a door is shared by two rooms), candidate side/element pairs come from one STRtree query,
+    # and the intersections and their positions along the sides are computed with shapely/NumPy array operations
+    def __init__(self, rooms:list[Room]):
+        self.rooms = list(rooms)
+        self.footprints = {} # {(kind, element id): buffered polygon}
+
+    def get_footprint(self, kind, element):
+        key = (kind, element.id)
+        if key not in self.footprints:
+            if kind == OBJECT:
+                self.footprints[key] = element.polygon.buffer(0.07 / gvars.scale_2d_to_ifc)
+            else:
+                self.footprints[key] = element.get_polygon(thickness=element.corresponding_wall.thickness + (0.2/gvars.scale_2d_to_ifc))
+        return self.footprints[key]
+
+    def linearize(self):
+        roomsides = []
+        side_rooms = []
+        for room_num, room in enumerate(self.rooms):
+            room_coords = list(room.polygon.exterior.coords)
+            for i in range(len(room_coords) - 1):
+                roomside = RoomSide(room, i, (room_coords[i], room_coords[i + 1]))
+                room.roomsides.append(roomside)
+                roomsides.append(roomside)
+                side_rooms.append(room_num)
+        if not roomsides:
+            return
+
+        elements = [] # (kind, element)
+        element_rooms = []
+        for room_num, room in enumerate(self.rooms):
+            for kind, room_elements in ((OBJECT, room.contains_objects), (WINDOW, room.windows), (DOOR, room.doors)):
+                for element in room_elements:
+                    elements.append((kind, element))
+                    element_rooms.append(room_num)
+        if not elements:
+            return
+
+        side_lines = np.array([roomside.linestring for roomside in roomsides])
+        footprints = np.array([self.get_footprint(kind, element) for kind, element in elements])
+        # Pairs (element, side of the same room) whose geometries intersect
+        element_indices, side_indices = shapely.STRtree(side_lines).query(footprints, predicate="intersects")
+        same_room = np.asarray(element_rooms)[element_indices] == np.asarray(side_rooms)[side_indices]
+        element_indices, side_indices = element_indices[same_room], side_indices[same_room]
+
+        intersections = shapely.intersection(footprints[element_indices], side_lines[side_indices])
+        is_line = shapely.get_type_id(intersections) == 1 # LineString
+        element_indices, side_indices, intersections = element_indices[is_line], side_indices[is_line], intersections[is_line]
+        start_points = shapely.get_point(intersections, 0)
+        end_points = shapely.get_point(intersections, 1)
+        starts = shapely.get_coordinates(start_points)
+        ends = shapely.get_coordinates(end_points)
+
+        # Points clockwise: the intersection goes in the direction of its side
+        side_angles = np.array([roomside.angle_deg for roomside in roomsides])[side_indices]
+        intersection_angles = np.degrees(np.arctan2(ends[:, 1] - starts[:, 1], ends[:, 0] - starts[:, 0]))
+        reversed_lines = np.abs(intersection_angles - side_angles) > 90
+        starts[reversed_lines], ends[reversed_lines] = ends[reversed_lines], starts[reversed_lines]
+
+        start_positions = shapely.line_locate_point(side_lines[side_indices], shapely.points(starts))
+        end_positions = shapely.line_locate_point(side_lines[side_indices], shapely.points(ends))
+
+        # Elements are added side by side, in the same order as the per-room loop
+        element_kinds = np.array([kind for kind, element in elements])
+        order = np.lexsort((element_indices, element_kinds[element_indices], side_indices))
+        debug_overlay = self.rooms[0].manager.debug_overlay
+        for pair in order.tolist():
+            kind, element = elements[element_indices[pair]]
+            roomsides[side_indices[pair]].add_element_position(element, (float(start_positions[pair]), float(end_positions[pair])))
+            if debug_overlay.enabled:
+                debug_overlay.line(starts[pair], ends[pair], gvars.colors[element.id % len(gvars.colors)], 2)
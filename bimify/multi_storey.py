@@ -0,0 +1,213 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+from .elements import *
+from .housing_segmentation import HousingSegmenter
+from .ifc_modeling import IFCModelHandler
+from .linearization import Linearizer
+from .outlet_placement import OutletPlacer
+from .ray_casting import RayCaster
+from .room_detection import RoomDetector
+from .room_index import RoomIndex
+
+
+class StoreyPlan:
+    # Detected geometry of one floor plan (plan coordinates in pixels), plain data so that it can be sent to a worker process
+    def __init__(self, name, elevation, walls, openings=(), objects=(), room_labels=()):
+        self.name = name
+        self.elevation = elevation # storey elevation in mm
+        self.walls = list(walls) # [(polygon coords, line ((x1, y1), (x2, y2)), thickness)]
+        self.openings = list(openings) # [(center point, wall index, length, classname)]
+        self.objects = list(objects) # [(classname, polygon coords)]
+        self.room_labels = list(room_labels) # [(position, cls_id)] room labels detected on the plan, see Room.set_category_from_cls_id
+
+
+class StoreyData:
+    # Result of build_elements as plain data (coordinates, classes and indices in the lists of the storey), what is sent
+    # back by the worker processes instead of the element graph. Only what the IFC export uses is kept
+    def __init__(self, plan:StoreyPlan, walls, rooms, housings, openings, objects, outlets):
+        self.plan = plan
+        self.walls = walls # [(polygon coords, line, thickness)]
+        self.rooms = rooms # [(polygon coords, category code)]
+        self.housings = housings # [[room index, ...]]
+        self.openings = openings # [(center point, wall index, length, classname)]
+        self.objects = objects # [(classname, polygon coords, ifc type name, origin point, angle, room index or None)]
+        self.outlets = outlets # [(outlet class name, x, y, angle, room index)]
+
+
+class StoreyElements:
+    # Elements of one storey, built by build_elements or restored from a StoreyData
+    def __init__(self, plan:StoreyPlan, manager:ElementsManager, walls, rooms, openings, objects, housings, outlets):
+        self.plan = plan
+        self.manager = manager
+        self.walls: list[Wall] = walls
+        self.rooms: list[Room] = rooms
+        self.openings: list[Opening] = openings
+        self.objects: list[Object] = objects
+        self.housings: list[Housing] = housings
+        self.outlets: list[Outlet] = outlets
+
+
+def connect_walls(manager:ElementsManager, walls:list[Wall], tolerance=1.0):
+    # Nodes at the wall ends and at the crossings of the wall lines, connected to every wall passing through them
+    if not walls:
+        return []
+    lines = shapely.linestrings([wall.line for wall in walls])
+    positions = [np.asarray([wall.line for wall in walls], dtype=float).reshape(-1, 2)]
+    crossing_lines, other_lines = shapely.STRtree(lines).query(lines, predicate="crosses")
+    if len(crossing_lines):
+        crossings = shapely.intersection(lines[crossing_lines], lines[other_lines])
+        crossings = crossings[shapely.get_type_id(crossings) == 0] # Point
+        positions.append(shapely.get_coordinates(crossings))
+    positions = np.unique(np.round(np.concatenate(positions)), axis=0)
+
+    nodes = [Node(manager, tuple(position)) for position in positions.tolist()]
+    points = shapely.points(positions)
+    node_indices, wall_indices = shapely.STRtree(lines).query(points, predicate="dwithin", distance=tolerance)
+    distances = shapely.line_locate_point(lines[wall_indices], points[node_indices])
+    for node_index, wall_index, distance in zip(node_indices.tolist(), wall_indices.tolist(), distances.tolist()):
+        walls[wall_index].connect_to_node(nodes[node_index], distance)
+    return nodes
+
+
+def set_room_categories(room_index:RoomIndex, room_labels):
+    # Rooms with labels get the category of their labels (the most prioritary one, in the RoomCategory order),
+    # the others are categorized from their contents
+    label_room_indices = room_index.locate_points([position for position, cls_id in room_labels]).tolist()
+    label_categories = {} # {room index: [RoomCategory]}
+    for room_num, (position, cls_id) in zip(label_room_indices, room_labels):
+        room = room_index.get_room(room_num)
+        if room is not None:
+            room.set_category_from_cls_id(cls_id)
+            label_categories.setdefault(room_num, []).append(room.category)
+    for room_num, room in enumerate(room_index.rooms):
+        if room_num in label_categories:
+            room.category = max(label_categories[room_num], key=lambda category: category.id)
+            room.name = room.category.name
+        else:
+            room.set_category()
+
+
+def build_elements(plan:StoreyPlan):
+    # Whole processing of one floor plan: walls and nodes, room detection, assignment of the openings and objects
+    # to the rooms, housings, linearization of the room sides, placement of the objects and outlets. Runs in a worker process
+    manager = ElementsManager()
+    walls = [Wall(manager, Polygon(coords), tuple(map(tuple, line)), thickness) for coords, line, thickness in plan.walls]
+    connect_walls(manager, walls)
+    rooms = RoomDetector(manager).detect_rooms()
+
+    openings = [Opening(manager, tuple(center), walls[wall_index], length, classname=classname) for center, wall_index, length, classname in plan.openings]
+    objects = [Object(manager, classname, Polygon(coords)) for classname, coords in plan.objects]
+    room_index = RoomIndex(rooms)
+    room_index.assign(openings=openings, objects=objects)
+    set_room_categories(room_index, plan.room_labels)
+    housings = HousingSegmenter(manager).segment(rooms, [opening for opening in openings if opening.classname == "door"])
+
+    if rooms:
+        Linearizer(rooms).linearize()
+    if objects and walls:
+        RayCaster(walls, shapely.STRtree([wall.polygon for wall in walls])).set_origin_points_and_angles(objects)
+    outlets = OutletPlacer(manager).place(rooms)
+
+    return StoreyElements(plan, manager, walls, rooms, openings, objects, housings, outlets)
+
+
+def export_elements(storey:StoreyElements):
+    walls = [(list(wall.polygon.exterior.coords), wall.line, wall.thickness) for wall in storey.walls]
+    wall_indices = {id(wall): wall_num for wall_num, wall in enumerate(storey.walls)}
+    room_indices = {id(room): room_num for room_num, room in enumerate(storey.rooms)}
+    rooms = [(list(room.polygon.exterior.coords), room.category.code) for room in storey.rooms]
+    housings = [[room_indices[id(room)] for room in housing.rooms] for housing in storey.housings]
+    openings = []
+    for opening in storey.openings:
+        wall = opening.corresponding_wall.parent_wall if opening.corresponding_wall.is_subwall else opening.corresponding_wall
+        openings.append((opening.center_point, wall_indices[id(wall)], opening.length, opening.classname))
+    objects = [
+        (obj.classname, list(obj.polygon.exterior.coords), obj.ifc_type_name, obj.origin_point, obj.angle,
+         room_indices.get(id(obj.contained_in_room)) if obj.contained_in_room is not None else None)
+        for obj in storey.objects
+    ]
+    outlets = [(type(outlet).__name__, outlet.x, outlet.y, outlet.angle, room_indices[id(outlet.contained_in_room)]) for outlet in storey.outlets]
+    return StoreyData(storey.plan, walls, rooms, housings, openings, objects, outlets)
+
+
+def restore_elements(data:StoreyData, manager:ElementsManager):
+    # Elements rebuilt in the main process. All the storeys share the manager, so the ids (and the names of the
+    # IFC elements, wall_<id>, opening_<id>, Logement <id>...) are unique in the building
+    walls = [Wall(manager, Polygon(coords), tuple(map(tuple, line)), thickness) for coords, line, thickness in data.walls]
+    rooms = []
+    for coords, category_code in data.rooms:
+        category = RoomCategory.find_by_code(category_code)
+        rooms.append(Room(manager, Polygon(coords), name=category.name, category=category))
+    housings = []
+    for room_indices in data.housings:
+        housing = Housing(manager)
+        for room_index in room_indices:
+            housing.add_room(rooms[room_index])
+        housings.append(housing)
+    openings = [Opening(manager, tuple(center), walls[wall_index], length, classname=classname) for center, wall_index, length, classname in data.openings]
+
+    objects = []
+    for classname, coords, ifc_type_name, origin_point, angle, room_index in data.objects:
+        obj = Object(manager, classname, Polygon(coords))
+        obj.ifc_type_name = ifc_type_name
+        obj.origin_point = origin_point
+        obj.angle = angle
+        if room_index is not None:
+            obj.contained_in_room = rooms[room_index]
+            rooms[room_index].contains_objects.append(obj)
+        objects.append(obj)
+    outlet_classes = {"Outlet": Outlet, "RJ45": RJ45}
+    outlets = [outlet_classes[class_name](manager, x, y, angle, rooms[room_index], None) for class_name, x, y, angle, room_index in data.outlets]
+    return StoreyElements(data.plan, manager, walls, rooms, openings, objects, housings, outlets)
+
+
+def build_storey_data(plan:StoreyPlan):
+    return export_elements(build_elements(plan))
+
+
+def build_storeys(plans:list[StoreyPlan], workers=None):
+    # One worker process per plan (all the cores by default), results in the order of the plans
+    if workers == 1 or len(plans) <= 1:
+        storey_data = [build_storey_data(plan) for plan in plans]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(plans))) as executor:
+            storey_data = list(executor.map(build_storey_data, plans))
+    manager = ElementsManager()
+    return [restore_elements(data, manager) for data in storey_data]
+
+
+def assemble_ifc(storeys:list[StoreyElements], handler:IFCModelHandler=None, filename=None):
+    # One IFC project, one storey per plan at its elevation
+    if handler is None:
+        handler = IFCModelHandler(bulk_writer=True)
+    for storey_num, storey in enumerate(storeys):
+        if storey_num == 0:
+            handler.create_project(storey_name=storey.plan.name, storey_elevation=storey.plan.elevation)
+            if any(storey.objects or storey.outlets for storey in storeys):
+                handler.load_library_file()
+        else:
+            handler.add_storey(storey.plan.name, storey.plan.elevation)
+
+        handler.create_ifc_walls_from_polygons(storey.walls)
+        handler.create_ifc_spaces_from_enclosed_areas(storey.rooms)
+        handler.create_ifc_zones_for_housing_types(storey.housings)
+        handler.create_ifc_openings_from_polygons(storey.openings)
+        if storey.objects:
+            handler.create_ifc_objects(storey.objects)
+        if storey.outlets:
+            handler.create_electrical_devices(storey.outlets)
+
+    if filename:
+        handler.save_ifc(filename)
+    else:
+        handler.flush_relationships()
+    return handler
+
+
+def process_building(plans:list[StoreyPlan], filename=None, workers=None, handler:IFCModelHandler=None):
+    return assemble_ifc(build_storeys(plans, workers=workers), handler=handler, filename=filename)
@@ -0,0 +1,38 @@
+import os
+
+import ifcopenshell
+
+
+libraries = {} # {library filename: ObjectLibrary}, each library file is parsed once per process
+
+
+def get_object_library(filename):
+    if filename not in libraries:
+        libraries[filename] = ObjectLibrary(filename)
+    return libraries[filename]
+
+
+class ObjectLibrary:
+    # Object types of a library file, indexed by lowercase name
+    def __init__(self, filename):
+        try:
+            self.model = ifcopenshell.open(filename)
+        except:
+            self.model = ifcopenshell.open(os.path.basename(filename))
+        self.types_by_name = {}
+        for obj_type in self.model.by_type("IfcTypeObject"):
+            if obj_type.Name is not None:
+                # First type of each name, as the linear scan did
+                self.types_by_name.setdefault(obj_type.Name.lower(), obj_type)
+
+    def get_type(self, name):
+        return self.types_by_name.get(name.lower())
+
+    def copy_type(self, name, model):
+        # Copy of the type with its whole closure (property sets, representation maps and their geometry).
+        # model.add keeps the entities already copied into model, so the entities common to several types
+        # (contexts, units...) are copied once
+        obj_type = self.get_type(name)
+        if obj_type is None:
+            return None
+        return model.add(obj_type)
@@ -0,0 +1,93 @@
+import numpy as np
+import shapely
+
+from . import global_variables as gvars
+from .elements import ElementsManager, Outlet, RJ45, Room
+
+
+class OutletPlacer:
+    # Outlets of all the rooms of a floor in one pass. The candidate positions come from the free segments of the
+    # room sides (RoomSide interval index, at outlet_margin from the corners and from the doors, windows and objects),
+    # outlet_min_spacing apart. The outlets of a room are spread over its sides, longest sides first, and all the
+    # coordinates are interpolated along the sides in one call. A candidate closer than outlet_min_spacing to an outlet
+    # already placed on another side of the room (around a corner) is skipped. The rooms must be linearized
+    def __init__(self, manager:ElementsManager, min_spacing=gvars.outlet_min_spacing, margin=gvars.outlet_margin,
+                 outlets_per_room_category=gvars.outlets_per_room_category, rj45_per_room_category=gvars.rj45_per_room_category):
+        self.manager = manager
+        self.min_spacing = min_spacing
+        self.margin = margin
+        self.outlets_per_room_category = outlets_per_room_category
+        self.rj45_per_room_category = rj45_per_room_category
+
+    def get_candidates(self, room:Room):
+        # [(roomside, position)] ordered so that the first positions spread over the longest sides:
+        # first position of every side, then the second ones...
+        side_numbers = []
+        ranks = []
+        positions = []
+        sides = room.get_longest_roomsides(len(room.roomsides))
+        for side_num, roomside in enumerate(sides):
+            side_positions = []
+            for start, end in roomside.get_free_segments(margin=self.margin):
+                for position in (start + self.min_spacing * np.arange(int((end - start) // self.min_spacing) + 1)).tolist():
+                    # Free segments separated by a short element: the spacing also applies across the element
+                    if not side_positions or position - side_positions[-1] >= self.min_spacing:
+                        side_positions.append(position)
+            side_numbers.extend([side_num] * len(side_positions))
+            ranks.extend(range(len(side_positions)))
+            positions.extend(side_positions)
+        order = np.lexsort((side_numbers, ranks))
+        return [(sides[side_numbers[i]], positions[i]) for i in order.tolist()]
+
+    def select_spaced(self, candidates, points, count):
+        # First count candidates at outlet_min_spacing from the ones selected on the other sides
+        # (the candidates of a same side are already spaced along it)
+        selected = []
+        selected_points = np.empty((0, 2))
+        selected_sides = []
+        for candidate, point in zip(candidates, points):
+            other_sides = np.array([roomside is not candidate[0] for roomside in selected_sides], dtype=bool)
+            if np.any(np.hypot(*(selected_points[other_sides] - point).T) < self.min_spacing):
+                continue
+            selected.append((candidate, point))
+            selected_points = np.vstack((selected_points, point))
+            selected_sides.append(candidate[0])
+            if len(selected) == count:
+                break
+        return selected
+
+    def get_inward_angle(self, roomside):
+        # Angle of the outlet facing the inside of the room, same convention as Object.angle
+        (x1, y1), (x2, y2) = roomside.line
+        if shapely.is_ccw(roomside.room.polygon.exterior):
+            normal = (y1 - y2, x2 - x1)
+        else:
+            normal = (y2 - y1, x1 - x2)
+        return np.arctan2(normal[1], normal[0]) - np.pi/2
+
+    def place(self, rooms:list[Room]):
+        candidates_by_room = [] # (room, outlet count, rj45 count, candidates)
+        for room in rooms:
+            outlet_count = self.outlets_per_room_category.get(room.category.code, 0)
+            rj45_count = self.rj45_per_room_category.get(room.category.code, 0)
+            if outlet_count + rj45_count:
+                candidates_by_room.append((room, outlet_count, rj45_count, self.get_candidates(room)))
+        candidates = [candidate for room, outlet_count, rj45_count, room_candidates in candidates_by_room for candidate in room_candidates]
+        if not candidates:
+            return []
+
+        lines = np.array([roomside.linestring for roomside, position in candidates])
+        points = shapely.get_coordinates(shapely.line_interpolate_point(lines, [position for roomside, position in candidates]))
+        outlets = []
+        angles = {}
+        start = 0
+        for room, outlet_count, rj45_count, room_candidates in candidates_by_room:
+            room_points = points[start:start + len(room_candidates)]
+            start += len(room_candidates)
+            selected = self.select_spaced(room_candidates, room_points, outlet_count + rj45_count)
+            for candidate_num, ((roomside, position), (x, y)) in enumerate(selected):
+                if id(roomside) not in angles:
+                    angles[id(roomside)] = self.get_inward_angle(roomside)
+                outlet_class = Outlet if candidate_num < outlet_count else RJ45
+                outlets.append(outlet_class(self.manager, float(x), float(y), angles[id(roomside)], room, roomside))
+        return outlets
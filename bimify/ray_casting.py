@@ -0,0 +1,187 @@
+import numpy as np
+import shapely
+from shapely.affinity import translate
+
+from . import global_variables as gvars
+from .elements import Object, ObjectSideAgainstWall
+
+
+class RayCaster:
+    # Batched version of Object.set_origin_point_and_angle. Room edges and wall faces are kept as NumPy segment arrays
+    # (computed once per room / once per plan), the extension lines of all the objects are intersected with them
+    # in one vectorized segment-segment test, and the origin points, angles and translations come out as arrays
+    def __init__(self, walls_list, walls_tree):
+        self.walls_list = walls_list
+        self.walls_tree = walls_tree
+        self.room_segments = {} # {room id: (n, 2, 2) array of the room edges}
+        # The two long faces of every wall: exterior coords 0 -> 1 and 2 -> 3
+        wall_coords = np.array([wall.polygon.exterior.coords[:4] for wall in walls_list]).reshape(-1, 4, 2)
+        self.wall_segments = np.stack((wall_coords[:, 0:2], wall_coords[:, 2:4]), axis=1) # (walls, 2 faces, 2 points, 2)
+        self.wall_angles = np.array([wall.get_angle() for wall in walls_list])
+
+    def get_room_segments(self, room):
+        if room.id not in self.room_segments:
+            coords = np.asarray(room.polygon.exterior.coords)
+            self.room_segments[room.id] = np.stack((coords[:-1], coords[1:]), axis=1)
+        return self.room_segments[room.id]
+
+    def cast(self, objects:list[Object]):
+        object_count = len(objects)
+        if object_count == 0:
+            return None
+        coords = np.array([obj.polygon.exterior.coords[:5] for obj in objects]).reshape(-1, 5, 2)
+        centers = shapely.get_coordinates(shapely.centroid([obj.polygon for obj in objects])).reshape(-1, 2)
+        side_vectors = coords[:, 1:] - coords[:, :-1]
+        side_lengths = np.hypot(side_vectors[:, :, 0], side_vectors[:, :, 1])
+        max_side_indices = np.argmax(side_lengths, axis=1)
+        min_side_indices = np.argmin(side_lengths, axis=1)
+        max_side_indices = np.where(min_side_indices == max_side_indices, (max_side_indices + 1) % 4, max_side_indices) # square polygons
+        rows = np.arange(object_count)
+        max_sides = side_lengths[rows, max_side_indices]
+        min_sides = side_lengths[rows, min_side_indices]
+
+        checks_long_side_ray = np.array([obj.side_against_wall in [ObjectSideAgainstWall.SHORT, ObjectSideAgainstWall.ANY] for obj in objects])
+        checks_short_side_ray = np.array([obj.side_against_wall in [ObjectSideAgainstWall.LONG, ObjectSideAgainstWall.ANY] for obj in objects])
+        # The last checked side is the main side (depth/width, default origin and translation)
+        main_side_indices = np.where(checks_short_side_ray, min_side_indices, max_side_indices)
+        main_side_vectors = side_vectors[rows, main_side_indices]
+        main_side_lengths = side_lengths[rows, main_side_indices]
+        depths = np.where(checks_short_side_ray, min_sides, np.where(checks_long_side_ray, max_sides, 0.0))
+        widths = np.where(checks_short_side_ray, max_sides, np.where(checks_long_side_ray, min_sides, 0.0))
+
+        # Extension lines (rays) through the center along the checked sides
+        ray_objects = np.concatenate((rows[checks_long_side_ray], rows[checks_short_side_ray]))
+        ray_side_indices = np.concatenate((max_side_indices[checks_long_side_ray], min_side_indices[checks_short_side_ray]))
+        order = np.argsort(ray_objects, kind="stable")
+        ray_objects, ray_side_indices = ray_objects[order], ray_side_indices[order]
+        ray_vectors = side_vectors[ray_objects, ray_side_indices]
+        ray_half_lengths = side_lengths[ray_objects, ray_side_indices] / 2 + 0.5 / gvars.scale_2d_to_ifc
+        ray_angles = np.arctan2(ray_vectors[:, 1], ray_vectors[:, 0])
+        ray_directions = np.stack((np.cos(ray_angles), np.sin(ray_angles)), axis=1) * ray_half_lengths[:, None]
+        ray_starts = centers[ray_objects] - ray_directions
+        ray_ends = centers[ray_objects] + ray_directions
+        objects[0].manager.debug_overlay.add_lines(ray_starts.astype(int), ray_ends.astype(int), (0, 128, 0), 1)
+
+        ray_pairs, segments, segment_angles, segment_walls = self.get_candidate_segments(objects, ray_objects)
+        points, hits = self.intersect_segments(ray_starts[ray_pairs], ray_ends[ray_pairs], segments[:, 0], segments[:, 1])
+        pair_objects = ray_objects[ray_pairs][hits]
+        points = points[hits]
+        segment_angles = segment_angles[hits]
+        segment_walls = segment_walls[hits]
+        distances = np.hypot(*(points - centers[pair_objects]).T)
+
+        # Closest intersection of each object
+        origin_points = centers + main_side_vectors / 2
+        max_dists = np.zeros(object_count)
+        set_next_to_wall = np.zeros(object_count, dtype=bool)
+        attenant_angles = np.full(object_count, np.nan)
+        attenant_walls = np.full(object_count, -1, dtype=np.int64)
+        if len(pair_objects):
+            order = np.lexsort((distances, pair_objects))
+            first = order[np.unique(pair_objects[order], return_index=True)[1]]
+            closest_objects = pair_objects[first]
+            origin_points[closest_objects] = points[first]
+            max_dists[closest_objects] = distances[first]
+            set_next_to_wall[closest_objects] = True
+            attenant_angles[closest_objects] = segment_angles[first]
+            attenant_walls[closest_objects] = segment_walls[first]
+
+        # Orientation: perpendicular to the attenant wall or room edge, on the side of the object center
+        deltas = centers - origin_points
+        object_angles = np.arctan2(deltas[:, 1], deltas[:, 0])
+        angles_to_wall1 = np.where(attenant_angles > 0, attenant_angles - np.pi/2, attenant_angles + np.pi/2)
+        angles_to_wall2 = np.where(angles_to_wall1 > 0, angles_to_wall1 - np.pi, angles_to_wall1 + np.pi)
+        wrap = lambda a: np.abs((a + np.pi) % (2*np.pi) - np.pi)
+        wall_angles = np.where(wrap(object_angles - angles_to_wall1) < wrap(object_angles - angles_to_wall2), angles_to_wall1, angles_to_wall2)
+        angles = np.where(np.isnan(attenant_angles), object_angles, wall_angles) - np.pi/2
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            translations = np.where(
+                (max_dists != 0)[:, None],
+                -deltas * ((max_dists - main_side_lengths / 2) / max_dists)[:, None],
+                0.0,
+            )
+
+        return {
+            "origin_points": origin_points,
+            "angles": angles,
+            "translations": translations,
+            "set_next_to_wall": set_next_to_wall,
+            "attenant_walls": attenant_walls,
+            "depths": depths,
+            "widths": widths,
+        }
+
+    def get_candidate_segments(self, objects, ray_objects):
+        # (ray index, segment) pairs: edges of the room of the object, or faces of the walls near the object
+        ray_pairs = []
+        segments = []
+        segment_angles = []
+        segment_walls = []
+        rooms = [obj.contained_in_room for obj in objects]
+
+        outside_objects = [obj_num for obj_num, room in enumerate(rooms) if room is None]
+        walls_by_object = {}
+        if outside_objects and len(self.walls_list):
+            buffers = shapely.buffer([objects[obj_num].polygon for obj_num in outside_objects], 1/gvars.scale_2d_to_ifc)
+            query_indices, wall_indices = self.walls_tree.query(buffers)
+            for query_index, wall_index in zip(query_indices.tolist(), wall_indices.tolist()):
+                walls_by_object.setdefault(outside_objects[query_index], []).append(wall_index)
+
+        for ray_num, obj_num in enumerate(ray_objects.tolist()):
+            room = rooms[obj_num]
+            if room is not None:
+                room_segments = self.get_room_segments(room)
+                room_vectors = room_segments[:, 1] - room_segments[:, 0]
+                ray_pairs.append(np.full(len(room_segments), ray_num))
+                segments.append(room_segments)
+                segment_angles.append(np.arctan2(room_vectors[:, 1], room_vectors[:, 0]))
+                segment_walls.append(np.full(len(room_segments), -1))
+            elif obj_num in walls_by_object:
+                wall_indices = np.asarray(walls_by_object[obj_num])
+                ray_pairs.append(np.full(2 * len(wall_indices), ray_num))
+                segments.append(self.wall_segments[wall_indices].reshape(-1, 2, 2))
+                segment_angles.append(np.repeat(self.wall_angles[wall_indices], 2))
+                segment_walls.append(np.repeat(wall_indices, 2))
+
+        if not ray_pairs:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 2, 2)), np.zeros(0), np.zeros(0, dtype=np.int64)
+        return np.concatenate(ray_pairs), np.concatenate(segments), np.concatenate(segment_angles), np.concatenate(segment_walls)
+
+    def intersect_segments(self, p1, p2, q1, q2):
+        # Vectorized segment-segment intersection, parallel segments don't intersect in a single point
+        r = p2 - p1
+        s = q2 - q1
+        qp = q1 - p1
+        denominators = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / denominators
+            u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / denominators
+            points = p1 + t[:, None] * r
+        hits = (denominators != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+        return points, hits
+
+    def apply(self, objects:list[Object], result):
+        if result is None:
+            return
+        for obj_num, obj in enumerate(objects):
+            obj.depth = float(result["depths"][obj_num])
+            obj.width = float(result["widths"][obj_num])
+            if obj.classname == "bed":
+                if obj.width < 1.2 / gvars.scale_2d_to_ifc:
+                    obj.typename = "single"
+                    obj.ifc_type_name = "bed-single"
+                    obj.ifc_obj_width = 0.90 / gvars.scale_2d_to_ifc
+                    obj.ifc_obj_depth = 1.90 / gvars.scale_2d_to_ifc
+                else:
+                    obj.typename = "double"
+            obj.origin_point = tuple(result["origin_points"][obj_num].tolist())
+            obj.angle = float(result["angles"][obj_num])
+            delta_x, delta_y = result["translations"][obj_num].tolist()
+            if delta_x or delta_y:
+                obj.polygon = translate(obj.polygon, xoff=delta_x, yoff=delta_y)
+
+    def set_origin_points_and_angles(self, objects:list[Object]):
+        result = self.cast(objects)
+        self.apply(objects, result)
+        return result
@@ -0,0 +1,112 @@
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+from . import global_variables as gvars
+from .elements import ElementsManager, Room
+
+
+class RoomDetector:
+    # Enclosed rooms of a plan, extracted from the wall graph of the manager.
+    # "faces": every face of the planar graph is built in one traversal of the half-edges
+    # "polygonize": bulk shapely polygonize over the wall centerline segments between nodes
+    # In both cases the faces smaller than gvars.min_room_area are discarded with one vectorized area computation
+    def __init__(self, manager:ElementsManager):
+        self.manager = manager
+        self.graph = manager.graph
+
+    def detect_rooms(self, method="faces", min_area=None):
+        if min_area is None:
+            min_area = gvars.min_room_area
+        if method == "faces":
+            return self.detect_rooms_from_faces(min_area)
+        elif method == "polygonize":
+            return self.detect_rooms_by_polygonize(min_area)
+        raise ValueError(f"Unknown room detection method: {method}")
+
+    def detect_rooms_from_faces(self, min_area):
+        faces, origins, destinations, walls = self.graph.get_faces()
+        if not faces:
+            return []
+
+        face_lengths = np.array([len(face) for face in faces])
+        half_edges = np.concatenate([np.asarray(face) for face in faces])
+        face_starts = np.r_[0, np.cumsum(face_lengths)[:-1]]
+        # Shoelace formula over all faces at once: each half-edge contributes x1*y2 - x2*y1
+        start_points = self.graph.node_positions[origins[half_edges]]
+        end_points = self.graph.node_positions[destinations[half_edges]]
+        cross_products = start_points[:, 0] * end_points[:, 1] - end_points[:, 0] * start_points[:, 1]
+        signed_areas = np.add.reduceat(cross_products, face_starts) / 2
+
+        # Bounded faces are traversed in the opposite direction of the outer face of each connected part of the graph
+        # (positive signed area with the angular order used by the graph), outer faces and wall stubs are dropped here
+        kept_faces = np.flatnonzero(signed_areas >= min_area)
+
+        rooms = []
+        for face_index in kept_faces:
+            face = self.remove_dangling_half_edges(faces[face_index])
+            node_ids = origins[face].tolist()
+            room = Room(self.manager, Polygon(self.graph.node_positions[node_ids]))
+            room.surrounding_node_ids = node_ids
+            room.surrounding_walls = self.get_walls(walls[face])
+            rooms.append(room)
+        return rooms
+
+    def remove_dangling_half_edges(self, face):
+        # A wall stub inside a face is walked there and back (next half-edge = twin, h ^ 1),
+        # the pairs are cancelled with a stack so that the room polygon doesn't touch itself
+        kept = []
+        for half_edge in face:
+            if kept and kept[-1] == half_edge ^ 1:
+                kept.pop()
+            else:
+                kept.append(half_edge)
+        # Stub at the start of the walk
+        start = 0
+        while len(kept) - start >= 2 and kept[start] == kept[-1] ^ 1:
+            start += 1
+            kept.pop()
+        return kept[start:]
+
+    def detect_rooms_by_polygonize(self, min_area):
+        origins, destinations, walls = self.graph.get_half_edges()
+        if len(origins) == 0:
+            return []
+        # One centerline segment per edge (even half-edges)
+        segments = np.stack((self.graph.node_positions[origins[0::2]], self.graph.node_positions[destinations[0::2]]), axis=1)
+        polygons = np.asarray(shapely.get_parts(shapely.polygonize(shapely.linestrings(segments))))
+        if len(polygons) == 0:
+            return []
+        polygons = polygons[shapely.area(polygons) >= min_area]
+
+        # Faces come back as coordinates, nodes are found again from their position
+        node_ids_by_position = {tuple(self.graph.node_positions[node_id]): node_id for node_id in self.graph.nodes}
+        walls_by_edge = {}
+        for edge_index, wall_id in enumerate(walls[0::2].tolist()):
+            edge = frozenset((int(origins[2 * edge_index]), int(destinations[2 * edge_index])))
+            walls_by_edge[edge] = wall_id
+
+        rooms = []
+        for polygon in polygons:
+            room = Room(self.manager, polygon)
+            node_ids = [node_ids_by_position.get(coords) for coords in polygon.exterior.coords[:-1]]
+            if None not in node_ids:
+                room.surrounding_node_ids = node_ids
+                room.surrounding_walls = self.get_walls(
+                    walls_by_edge[frozenset((node_id, next_node_id))]
+                    for node_id, next_node_id in zip(node_ids, node_ids[1:] + node_ids[:1])
+                    if frozenset((node_id, next_node_id)) in walls_by_edge
+                )
+            rooms.append(room)
+        return rooms
+
+    def get_walls(self, wall_ids):
+        # Walls along a face, in order and without repetition
+        walls = []
+        seen = set()
+        for wall_id in wall_ids:
+            wall_id = int(wall_id)
+            if wall_id not in seen:
+                seen.add(wall_id)
+                walls.append(self.graph.walls[wall_id])
+        return walls
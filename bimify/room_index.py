@@ -0,0 +1,70 @@
+import numpy as np
+import shapely
+
+from .elements import Room, Opening, Object, Outlet
+
+
+class RoomIndex:
+    # Spatial index of the rooms of a plan, built once. Openings, objects and outlets are located in the rooms
+    # with a single batched STRtree query (point within room polygon) instead of testing every room for every element
+    def __init__(self, rooms:list[Room]):
+        self.rooms = list(rooms)
+        self.tree = shapely.STRtree([room.polygon for room in self.rooms])
+
+    def query_points(self, points):
+        # (point indices, room indices) of the pairs point within room
+        if len(points) == 0 or not self.rooms:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return self.tree.query(shapely.points(np.asarray(points, dtype=float)), predicate="within")
+
+    def select_rooms(self, point_count, point_indices, tree_indices, last=False):
+        # Index of the room containing each point, -1 if none. When rooms overlap: first room in the rooms order
+        # (as Object.set_room_container), or last one (as Opening.find_adjacent_rooms)
+        room_indices = np.full(point_count, -1, dtype=np.int64)
+        # The last assignment wins, pairs are sorted so that it is the chosen room
+        order = np.lexsort((tree_indices if last else -tree_indices, point_indices))
+        room_indices[point_indices[order]] = tree_indices[order]
+        return room_indices
+
+    def locate_points(self, points, last=False):
+        return self.select_rooms(len(points), *self.query_points(points), last=last)
+
+    def get_room(self, room_index):
+        return self.rooms[room_index] if room_index >= 0 else None
+
+    def assign(self, openings:list[Opening]=(), objects:list[Object]=(), outlets:list[Outlet]=()):
+        # Fills doors, windows, connected_rooms and contains_objects of the rooms, and the containers of the elements
+        # Points in one query: first side of the openings, second side of the openings, objects, outlets
+        test_points = [opening.get_adjacent_rooms_test_points() for opening in openings]
+        points = [p1 for p1, p2 in test_points] + [p2 for p1, p2 in test_points]
+        for obj in objects:
+            points.append(obj.get_center_point())
+        for outlet in outlets:
+            points.append(outlet.origin_point)
+        point_indices, tree_indices = self.query_points(points)
+
+        # Openings as in Opening.find_adjacent_rooms: room1 is the last room containing the first point,
+        # room2 the last room containing the second point but not the first one
+        opening_count = len(openings)
+        first_side = point_indices < opening_count
+        second_side = (point_indices >= opening_count) & (point_indices < 2 * opening_count)
+        first_side_pairs = point_indices[first_side] * len(self.rooms) + tree_indices[first_side]
+        second_side_pairs = (point_indices[second_side] - opening_count) * len(self.rooms) + tree_indices[second_side]
+        second_side[second_side] = ~np.isin(second_side_pairs, first_side_pairs)
+        opening_rooms = self.select_rooms(2 * opening_count, point_indices[first_side | second_side], tree_indices[first_side | second_side], last=True).tolist()
+        for opening_num, opening in enumerate(openings):
+            opening.connect_rooms(self.get_room(opening_rooms[opening_num]), self.get_room(opening_rooms[opening_count + opening_num]))
+
+        offset = 2 * opening_count
+        other_points = point_indices >= offset
+        room_indices = self.select_rooms(len(points), point_indices[other_points], tree_indices[other_points]).tolist()
+        for obj_num, obj in enumerate(objects):
+            room = self.get_room(room_indices[offset + obj_num])
+            if room is not None:
+                obj.set_room(room)
+
+        offset += len(objects)
+        for outlet_num, outlet in enumerate(outlets):
+            room = self.get_room(room_indices[offset + outlet_num])
+            if room is not None:
+                outlet.contained_in_room = room
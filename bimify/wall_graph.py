@@ -0,0 +1,232 @@
+import numpy as np
+
+
+NO_INDEX = -1
+
+
+class WallGraph:
+    # Planar graph of the walls and of the nodes connecting them, stored in arrays.
+    # A slot is the incidence of a node on a wall. The slots of a wall form a doubly linked list sorted by distance
+    # from the wall start, the segment between a slot and the next one is an edge of the graph. Removing a slot is O(1),
+    # inserting one walks the list of its wall from the end (O(1) when the nodes are connected in order along the wall).
+    # No half-edge pointers are stored: get_half_edges builds the half-edge arrays from the linked lists, edge i giving
+    # half-edges 2*i (along the wall direction) and 2*i+1 (its twin, half_edge ^ 1), and get_faces computes the next
+    # half-edges and the faces from them on each call
+    def __init__(self, capacity=256):
+        self.nodes = {} # {node id: Node}, insertion ordered
+        self.walls = {} # {wall id: Wall}
+        self.node_positions = np.zeros((capacity, 2))
+        self.node_slots = {} # {node id: {slot: None}}, insertion ordered set
+
+        self.slot_node = np.full(capacity, NO_INDEX, dtype=np.int64)
+        self.slot_wall = np.full(capacity, NO_INDEX, dtype=np.int64)
+        self.slot_distance = np.zeros(capacity)
+        self.slot_next = np.full(capacity, NO_INDEX, dtype=np.int64)
+        self.slot_previous = np.full(capacity, NO_INDEX, dtype=np.int64)
+        self.slot_count = 0
+        self.free_slots = []
+        self.slot_by_incidence = {} # {(wall id, node id): slot}
+        self.wall_first_slot = {} # {wall id: first slot of the wall or NO_INDEX}
+        self.wall_last_slot = {} # {wall id: last slot of the wall or NO_INDEX}
+
+    # Nodes
+
+    def add_node(self, node, position):
+        node_id = node.node_id
+        if node_id >= len(self.node_positions):
+            self.node_positions = np.resize(self.node_positions, (max(node_id + 1, 2 * len(self.node_positions)), 2))
+        self.nodes[node_id] = node
+        self.node_slots[node_id] = {}
+        self.set_node_position(node_id, position)
+
+    def remove_node(self, node_id):
+        for slot in list(self.node_slots.pop(node_id, ())):
+            self.remove_slot(slot)
+        self.nodes.pop(node_id, None)
+
+    def get_node_position(self, node_id):
+        return tuple(self.node_positions[node_id].tolist())
+
+    def set_node_position(self, node_id, position):
+        self.node_positions[node_id] = position
+
+    def get_node_connections(self, node_id):
+        return tuple((self.walls[self.slot_wall[slot]], float(self.slot_distance[slot])) for slot in self.node_slots.get(node_id, ()))
+
+    # Walls
+
+    def add_wall(self, wall):
+        if wall.id in self.walls:
+            raise ValueError(f"A wall with id {wall.id} is already in the graph")
+        self.walls[wall.id] = wall
+        self.wall_first_slot.setdefault(wall.id, NO_INDEX)
+        self.wall_last_slot.setdefault(wall.id, NO_INDEX)
+
+    def remove_wall(self, wall_id):
+        for slot in self.get_wall_slots(wall_id):
+            self.remove_slot(slot)
+        self.walls.pop(wall_id, None)
+        self.wall_first_slot.pop(wall_id, None)
+        self.wall_last_slot.pop(wall_id, None)
+
+    def get_wall_slots(self, wall_id):
+        slots = []
+        slot = self.wall_first_slot.get(wall_id, NO_INDEX)
+        while slot != NO_INDEX:
+            slots.append(slot)
+            slot = self.slot_next[slot]
+        return slots
+
+    def get_wall_nodes(self, wall_id):
+        return tuple((self.nodes[self.slot_node[slot]], float(self.slot_distance[slot])) for slot in self.get_wall_slots(wall_id))
+
+    def get_first_node(self, wall_id):
+        slot = self.wall_first_slot.get(wall_id, NO_INDEX)
+        if slot == NO_INDEX:
+            return None
+        return self.nodes[self.slot_node[slot]], float(self.slot_distance[slot])
+
+    def get_last_node(self, wall_id):
+        slot = self.wall_last_slot.get(wall_id, NO_INDEX)
+        if slot == NO_INDEX:
+            return None
+        return self.nodes[self.slot_node[slot]], float(self.slot_distance[slot])
+
+    # Slots (node <-> wall incidences)
+
+    def connect(self, wall_id, node_id, distance_from_start):
+        slot = self.allocate_slot()
+        self.slot_node[slot] = node_id
+        self.slot_wall[slot] = wall_id
+        self.slot_distance[slot] = distance_from_start
+        self.slot_by_incidence[(wall_id, node_id)] = slot
+        self.node_slots[node_id][slot] = None
+
+        # Sorted insertion along the wall, a node at the same distance as another one goes after it
+        previous_slot = self.wall_last_slot[wall_id]
+        while previous_slot != NO_INDEX and self.slot_distance[previous_slot] > distance_from_start:
+            previous_slot = self.slot_previous[previous_slot]
+        next_slot = self.slot_next[previous_slot] if previous_slot != NO_INDEX else self.wall_first_slot[wall_id]
+        self.slot_previous[slot] = previous_slot
+        self.slot_next[slot] = next_slot
+        if previous_slot != NO_INDEX:
+            self.slot_next[previous_slot] = slot
+        else:
+            self.wall_first_slot[wall_id] = slot
+        if next_slot != NO_INDEX:
+            self.slot_previous[next_slot] = slot
+        else:
+            self.wall_last_slot[wall_id] = slot
+        return slot
+
+    def allocate_slot(self):
+        if self.free_slots:
+            return self.free_slots.pop()
+        if self.slot_count == len(self.slot_node):
+            capacity = 2 * len(self.slot_node)
+            self.slot_node = self.resize_array(self.slot_node, capacity, NO_INDEX)
+            self.slot_wall = self.resize_array(self.slot_wall, capacity, NO_INDEX)
+            self.slot_distance = self.resize_array(self.slot_distance, capacity, 0.0)
+            self.slot_next = self.resize_array(self.slot_next, capacity, NO_INDEX)
+            self.slot_previous = self.resize_array(self.slot_previous, capacity, NO_INDEX)
+        self.slot_count += 1
+        return self.slot_count - 1
+
+    def resize_array(self, array, capacity, fill_value):
+        resized = np.full(capacity, fill_value, dtype=array.dtype)
+        resized[:len(array)] = array
+        return resized
+
+    def remove_slot(self, slot):
+        wall_id = int(self.slot_wall[slot])
+        node_id = int(self.slot_node[slot])
+        previous_slot = self.slot_previous[slot]
+        next_slot = self.slot_next[slot]
+        if previous_slot != NO_INDEX:
+            self.slot_next[previous_slot] = next_slot
+        elif wall_id in self.wall_first_slot:
+            self.wall_first_slot[wall_id] = next_slot
+        if next_slot != NO_INDEX:
+            self.slot_previous[next_slot] = previous_slot
+        elif wall_id in self.wall_last_slot:
+            self.wall_last_slot[wall_id] = previous_slot
+        self.node_slots.get(node_id, {}).pop(slot, None)
+        self.slot_by_incidence.pop((wall_id, node_id), None)
+        self.slot_node[slot] = NO_INDEX
+        self.slot_wall[slot] = NO_INDEX
+        self.slot_next[slot] = NO_INDEX
+        self.slot_previous[slot] = NO_INDEX
+        self.free_slots.append(slot)
+
+    def get_next_node(self, wall_id, node_id):
+        slot = self.slot_by_incidence.get((wall_id, node_id))
+        if slot is None or self.slot_next[slot] == NO_INDEX:
+            return None
+        return self.nodes[self.slot_node[self.slot_next[slot]]]
+
+    def get_previous_node(self, wall_id, node_id):
+        slot = self.slot_by_incidence.get((wall_id, node_id))
+        if slot is None or self.slot_previous[slot] == NO_INDEX:
+            return None
+        return self.nodes[self.slot_node[self.slot_previous[slot]]]
+
+    # Half-edges
+
+    def get_edge_slots(self):
+        # Slots starting an edge (having a next slot on their wall)
+        used = self.slot_node[:self.slot_count] != NO_INDEX
+        return np.flatnonzero(used & (self.slot_next[:self.slot_count] != NO_INDEX))
+
+    def get_half_edges(self):
+        # Half-edge arrays of the graph: half-edges 2*i and 2*i+1 are the two sides of edge i (twin = half_edge ^ 1)
+        edge_slots = self.get_edge_slots()
+        start_nodes = self.slot_node[edge_slots]
+        end_nodes = self.slot_node[self.slot_next[edge_slots]]
+        # Two nodes at the same place on a wall make an empty edge
+        valid = start_nodes != end_nodes
+        edge_slots, start_nodes, end_nodes = edge_slots[valid], start_nodes[valid], end_nodes[valid]
+        origins = np.empty(2 * len(edge_slots), dtype=np.int64)
+        origins[0::2] = start_nodes
+        origins[1::2] = end_nodes
+        destinations = np.empty_like(origins)
+        destinations[0::2] = end_nodes
+        destinations[1::2] = start_nodes
+        walls = np.repeat(self.slot_wall[edge_slots], 2)
+        return origins, destinations, walls
+
+    def get_faces(self):
+        # Faces of the planar graph, as lists of half-edges, in a single traversal.
+        # Around each node the outgoing half-edges are sorted by angle, the half-edge following h (u -> v) on its face
+        # is the outgoing half-edge of v coming right before twin(h) in that order
+        origins, destinations, walls = self.get_half_edges()
+        half_edge_count = len(origins)
+        if half_edge_count == 0:
+            return [], origins, destinations, walls
+
+        vectors = self.node_positions[destinations] - self.node_positions[origins]
+        angles = np.arctan2(vectors[:, 1], vectors[:, 0])
+        order = np.lexsort((angles, origins)) # outgoing half-edges grouped by node, sorted by angle
+        rank = np.empty(half_edge_count, dtype=np.int64)
+        rank[order] = np.arange(half_edge_count)
+        sorted_origins = origins[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_origins[1:] != sorted_origins[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, half_edge_count])
+        group_start_of_rank = np.repeat(group_starts, group_sizes)
+        group_size_of_rank = np.repeat(group_sizes, group_sizes)
+        previous_rank = group_start_of_rank + (np.arange(half_edge_count) - group_start_of_rank - 1) % group_size_of_rank
+        next_half_edges = order[previous_rank[rank[np.arange(half_edge_count) ^ 1]]]
+
+        faces = []
+        visited = np.zeros(half_edge_count, dtype=bool)
+        next_half_edges = next_half_edges.tolist()
+        for first_half_edge in range(half_edge_count):
+            if visited[first_half_edge]:
+                continue
+            face = []
+            half_edge = first_half_edge
+            while not visited[half_edge]:
+                visited[half_edge] = True
+                face.append(half_edge)
+                half_edge = next_half_edges[half_edge]
+            faces.append(face)
+        return faces, origins, destinations, walls
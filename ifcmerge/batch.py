@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Manifest format (paths are relative to the manifest folder):
+# {
+#     "defaults": {"merge_sites": true, "merge_buildings": true, "lvls_mgmt": 0, "remove_empty_containers": true},
+#     "jobs": [
+#         {"name": "building_A", "inputs": ["A/ARC.ifc", "A/CVP.ifc"], "output": "output/building_A.ifc", "options": {"lvls_mgmt": 1}},
+#         ...
+#     ]
+# }
+
+JOB_OPTIONS = (
+    "merge_sites",
+    "merge_buildings",
+    "lvls_mgmt",
+    "remove_empty_containers",
+    "relocation",
+    "relocate_by_map_conversion",
+    "flatten_placements",
+    "consolidate_relationships",
+)
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    manifest_folder = os.path.dirname(os.path.abspath(manifest_path))
+    defaults = manifest.get("defaults", {})
+    jobs = []
+    log_filenames = set()
+    outputs = set()
+    for job_num, job in enumerate(manifest.get("jobs", [])):
+        options = dict(defaults)
+        options.update(job.get("options", {}))
+        unknown_options = set(options) - set(JOB_OPTIONS)
+        if unknown_options:
+            raise ValueError(f"Unknown option(s) {sorted(unknown_options)} in job #{job_num}")
+        if len(job.get("inputs", [])) < 1 or not job.get("output"):
+            raise ValueError(f"Job #{job_num} needs at least one input and an output")
+        job_name = job.get("name", f"job_{job_num}")
+        log_filename = get_log_filename(job_name)
+        if log_filename in log_filenames:
+            raise ValueError(f"Job #{job_num} has the same log file as a previous job: {log_filename} (name: {job_name})")
+        log_filenames.add(log_filename)
+        output = os.path.join(manifest_folder, job["output"])
+        normalized_output = os.path.normcase(os.path.abspath(output))
+        if normalized_output in outputs:
+            raise ValueError(f"Job #{job_num} has the same output as a previous job: {job['output']}")
+        outputs.add(normalized_output)
+        jobs.append({
+            "name": job_name,
+            "inputs": [os.path.join(manifest_folder, path) for path in job["inputs"]],
+            "output": output,
+            "options": options,
+        })
+    return jobs
+
+
+def get_log_filename(job_name):
+    # Job names are free text, the log file stays in the log folder whatever the name ("../x", "a/b"...)
+    return (re.sub(r"[^\w.-]", "_", job_name).lstrip(".") or "job") + ".log"
+
+
+def warm_worker():
+    # Runs once per pool process, so every job after the first one starts with IfcOpenShell already loaded
+    import main
+    import ifcpatch_merge
+
+    ifcpatch_merge.warm_up()
+
+
+def run_job(job, log_folder=None):
+    import main
+
+    start_time = time.time()
+    status = "error"
+    error = ""
+    main_inst = main.Main()
+    main_inst.initiate_merge_environment(disable_log=False)
+    if log_folder:
+        main_inst.logger.no_output_file = False
+        main_inst.logger.quiet = True
+        main_inst.logger.initiate_logfile(log_folder, log_filename=get_log_filename(job["name"]))
+    else:
+        main_inst.logger.disabled = True
+    main_inst.print_memory_usage = job.get("print_memory", False)
+    main_inst.print_memory("Start")
+
+    try:
+        output_folder = os.path.dirname(job["output"])
+        if output_folder and not os.path.exists(output_folder):
+            os.makedirs(output_folder, exist_ok=True)
+        status, error = main_inst.run_merge("", job["inputs"], job["output"], job["options"])
+    except Exception as ex:
+        error = str(ex)
+        main_inst.logger.printlog(f"An error occured: {ex}")
+        main_inst.logger.printlog(traceback.format_exc())
+    finally:
+        main_inst.logger.close_log_file()
+
+    return {
+        "name": job["name"],
+        "status": status,
+        "error": error,
+        "output": job["output"],
+        "elapsed": round(time.time() - start_time, 2),
+    }
+
+
+def submit_job_to_server(server_socket, job, log_folder=None):
+    import forkserver
+
+    job = dict(job)
+    job["log_folder"] = os.path.abspath(log_folder) if log_folder else None
+    return forkserver.submit(server_socket, job)
+
+
+def run_batch(jobs, workers=None, log_folder=None, server_socket=None):
+    if log_folder and not os.path.exists(log_folder):
+        os.makedirs(log_folder, exist_ok=True)
+
+    results = []
+    if server_socket:
+        # The fork server runs every job in its own forked child, here threads only wait for the answers
+        executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        submit_args = lambda job: (submit_job_to_server, server_socket, job, log_folder)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker)
+        submit_args = lambda job: (run_job, job, log_folder)
+    with executor:
+        futures = {executor.submit(*submit_args(job)): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as ex:
+                result = {"name": job["name"], "status": "error", "error": str(ex), "output": job["output"], "elapsed": 0.0}
+            results.append(result)
+            print(f"[{len(results)}/{len(jobs)}] {result['name']}: {result['status']} ({result['elapsed']} s)", flush=True)
+    return results
+
+
+def print_summary(results):
+    succeeded = [result for result in results if result["status"] == "success"]
+    failed = [result for result in results if result["status"] != "success"]
+    print()
+    print("---------------------------------------------------")
+    print(f"Jobs: {len(results)} | Success: {len(succeeded)} | Failed: {len(failed)} | Total merge time: {round(sum(result['elapsed'] for result in results), 2)} s")
+    for result in failed:
+        print(f"  FAILED {result['name']}: {result['error'] or result['status']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch merge of IFC project sets described in a JSON manifest")
+    parser.add_argument("manifest", help="Path to the JSON manifest")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("-l", "--log-folder", default=None, help="Folder for per-job log files (<job name>.log, unsafe characters replaced by _)")
+    parser.add_argument("-s", "--summary", default=None, help="Write the job results to this JSON file")
+    parser.add_argument("--print-memory", action="store_true", help="Log the process RSS at every stage of each job (needs --log-folder)")
+    parser.add_argument("--server", default=None, help="Send the jobs to a running fork server (forkserver.py) listening on this socket")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    jobs = load_manifest(args.manifest)
+    for job in jobs:
+        job["print_memory"] = args.print_memory
+    start_time = time.time()
+    results = run_batch(jobs, workers=args.workers, log_folder=args.log_folder, server_socket=args.server)
+    print_summary(results)
+    print(f"Wall time: {round(time.time() - start_time, 2)} s")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    return 0 if all(result["status"] == "success" for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
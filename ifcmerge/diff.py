@@ -0,0 +1,106 @@
+import hashlib
+
+import ifcopenshell
+
+import traversal
+
+
+class ContentHasher:
+    # Id-independent content hash of every entity of a model: attributes are hashed together with the hash
+    # of the referenced subgraph. Each entity is hashed once (memoized), so hashing a model is linear in its size.
+    # Rooted entities referenced by another entity are represented by their GlobalId, not by their content,
+    # so a modified type or relationship is reported once instead of on every element pointing to it
+    def __init__(self, model):
+        self.model = model
+        self.hashes = {} # {entity id: digest}
+
+    def get_rooted_hashes(self):
+        rooted_hashes = {}
+        for entity in self.model.by_type("IfcRoot"):
+            rooted_hashes[entity.GlobalId] = self.get_hash(entity)
+        return rooted_hashes
+
+    def get_hash(self, entity):
+        # Iterative post-order walk, referenced entities are hashed before the entities referencing them
+        stack = [entity]
+        in_progress = set()
+        while stack:
+            current = stack[-1]
+            if current.id() in self.hashes:
+                stack.pop()
+                continue
+            if current.id() not in in_progress:
+                in_progress.add(current.id())
+                for ref in traversal.get_forward_references(self.model, current):
+                    if ref.id() not in self.hashes and ref.id() not in in_progress and not ref.is_a("IfcRoot"):
+                        stack.append(ref)
+                continue
+            stack.pop()
+            self.hashes[current.id()] = self.compute_hash(current)
+        return self.hashes[entity.id()]
+
+    def compute_hash(self, entity):
+        attributes = []
+        rooted = entity.is_a("IfcRoot")
+        for i in range(len(entity)):
+            # GlobalId is the diff key and OwnerHistory changes at every export
+            if rooted and i < 2:
+                continue
+            attributes.append(self.encode_value(entity[i]))
+        content = entity.is_a() + "(" + ",".join(attributes) + ")"
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+    def encode_value(self, value):
+        if value is None:
+            return "$"
+        if isinstance(value, ifcopenshell.entity_instance):
+            if not value.id():
+                # Type-wrapped select value (IfcLabel, IfcLengthMeasure...)
+                return value.is_a() + "(" + self.encode_value(value.wrappedValue) + ")"
+            if value.is_a("IfcRoot"):
+                return "#" + value.GlobalId
+            if value.is_a("IfcOwnerHistory"):
+                return "*"
+            # Hash placeholder for a reference cycle (doesn't happen in valid IFC)
+            return self.hashes.get(value.id(), "~")
+        if isinstance(value, (tuple, list)):
+            return "(" + ",".join(self.encode_value(v) for v in value) + ")"
+        if isinstance(value, float):
+            return format(value, ".10g")
+        return repr(value)
+
+
+class ModelDiff:
+    def __init__(self, logger, old_model, new_model):
+        self.logger = logger
+        self.old_model = old_model
+        self.new_model = new_model
+
+    def compute(self):
+        old_hashes = ContentHasher(self.old_model).get_rooted_hashes()
+        new_hashes = ContentHasher(self.new_model).get_rooted_hashes()
+        result = {
+            "added": [global_id for global_id in new_hashes if global_id not in old_hashes],
+            "removed": [global_id for global_id in old_hashes if global_id not in new_hashes],
+            "modified": [
+                global_id for global_id, digest in new_hashes.items()
+                if global_id in old_hashes and old_hashes[global_id] != digest
+            ],
+        }
+        result["unchanged"] = len(new_hashes) - len(result["added"]) - len(result["modified"])
+        return result
+
+    def print_report(self, result, max_listed=10):
+        self.logger.printlog(
+            f"  Added: {len(result['added'])} | Removed: {len(result['removed'])} | Modified: {len(result['modified'])} | Unchanged: {result['unchanged']}"
+        )
+        for title, global_ids, model in (
+            ("Added", result["added"], self.new_model),
+            ("Removed", result["removed"], self.old_model),
+            ("Modified", result["modified"], self.new_model),
+        ):
+            for global_id in global_ids[:max_listed]:
+                entity = model.by_guid(global_id)
+                self.logger.printlog(f"    {title}: {global_id} #{entity.id()}={entity.is_a()} ({getattr(entity, 'Name', None)})")
+            if len(global_ids) > max_listed:
+                self.logger.printlog(f"    ... and {len(global_ids) - max_listed} more")
@@ -0,0 +1,173 @@
+import os
+
+import ifcopenshell
+import ifcopenshell.util.unit
+
+import ifcpatch_merge
+
+
+ELEVATION_TOLERANCE = 1e-5 # in metres
+
+
+class FederatedLevel:
+    def __init__(self, key, name):
+        self.key = key # Global elevation in metres (levels by elevation) or storey name (levels by name)
+        self.name = name
+        self.storeys = [] # [(model_name, storey), ...]
+
+
+class Federation:
+    # "Virtual merge": every model stays in its own file, cross-model queries go through shared indexes
+    # built with the same level and context matching rules as the Merger.
+    # A physically merged model is only produced when materialize() is called
+    def __init__(self, logger, lvls_mgmt=0):
+        self.logger = logger
+        self.lvls_mgmt = lvls_mgmt
+        self.models = {} # {model_name: model}
+        self.model_paths = {}
+        self.unit_scales = {}
+        self.levels: list[FederatedLevel] = []
+        self.merged_model = None
+        self.merged_options = None # merge options of merged_model
+
+    def open_model(self, path):
+        model_name = os.path.basename(path)
+        self.logger.printlog(f"Opening file: {model_name} ...")
+        return self.add_model(model_name, ifcopenshell.open(path), path)
+
+    def get_unique_model_name(self, model_name):
+        # Models from different folders can share a file name, the later ones get a numbered name
+        unique_name = model_name
+        model_num = 2
+        while unique_name in self.models:
+            unique_name = f"{model_name} ({model_num})"
+            model_num += 1
+        return unique_name
+
+    def add_model(self, model_name, model, path=None):
+        # Returns the name of the model in the federation indexes
+        model_name = self.get_unique_model_name(model_name)
+        self.models[model_name] = model
+        self.model_paths[model_name] = path
+        self.unit_scales[model_name] = ifcopenshell.util.unit.calculate_unit_scale(model)
+        for storey in model.by_type("IfcBuildingStorey"):
+            self.add_storey_to_levels(model_name, storey)
+        self.merged_model = None
+        self.logger.printlog(f"Model <{model_name}> [{model.schema}] was added to the federation ({len(self.levels)} levels)")
+        return model_name
+
+    def add_storey_to_levels(self, model_name, storey):
+        if self.lvls_mgmt == 0:
+            if storey.Elevation is None:
+                return
+            key = ifcpatch_merge.get_global_elevation(storey) * self.unit_scales[model_name]
+            level = self.get_level(key)
+        else:
+            if not storey.Name:
+                return
+            key = storey.Name
+            level = self.get_level(key)
+        if level is None:
+            level = FederatedLevel(key, storey.Name)
+            self.levels.append(level)
+        level.storeys.append((model_name, storey))
+
+    def get_level(self, key):
+        for level in self.levels:
+            if self.lvls_mgmt == 0:
+                if abs(level.key - key) < ELEVATION_TOLERANCE:
+                    return level
+            elif level.key == key:
+                return level
+        return None
+
+    def get_levels(self):
+        if self.lvls_mgmt == 0:
+            return sorted(self.levels, key=lambda level: level.key)
+        return list(self.levels)
+
+    def by_guid(self, global_id):
+        # Returns (model_name, entity), each model has its own GlobalId index
+        for model_name, model in self.models.items():
+            try:
+                return model_name, model.by_guid(global_id)
+            except RuntimeError:
+                continue
+        return None
+
+    def by_type(self, ifc_class, include_subtypes=True):
+        elements = []
+        for model_name, model in self.models.items():
+            try:
+                model_elements = model.by_type(ifc_class, include_subtypes=include_subtypes)
+            except RuntimeError:
+                # Class that doesn't exist in the schema of this model
+                continue
+            elements.extend((model_name, element) for element in model_elements)
+        return elements
+
+    def get_elements_on_level(self, level, ifc_class=None):
+        elements = []
+        for model_name, storey in level.storeys:
+            for element in self.get_spatial_contents(storey):
+                if ifc_class is None or element.is_a(ifc_class):
+                    elements.append((model_name, element))
+        return elements
+
+    def get_spatial_contents(self, spatial_element):
+        # Elements contained in the spatial element and in the spatial elements it is decomposed into (IfcSpaces)
+        contents = []
+        to_visit = [spatial_element]
+        while to_visit:
+            current = to_visit.pop()
+            for rel_cont in getattr(current, "ContainsElements", None) or ():
+                contents.extend(rel_cont.RelatedElements)
+            for rel_agg in getattr(current, "IsDecomposedBy", None) or ():
+                for related_object in rel_agg.RelatedObjects:
+                    if related_object.is_a("IfcSpatialStructureElement"):
+                        contents.append(related_object)
+                        to_visit.append(related_object)
+        return contents
+
+    def get_shared_contexts(self):
+        # Groups the representation contexts of all models that the Merger would reuse as one context
+        shared_contexts = [] # [[(model_name, context), ...], ...]
+        for model_name, model in self.models.items():
+            for context in model.by_type("IfcGeometricRepresentationContext"):
+                for group in shared_contexts:
+                    if ifcpatch_merge.are_equivalent_contexts(group[0][1], context):
+                        group.append((model_name, context))
+                        break
+                else:
+                    shared_contexts.append([(model_name, context)])
+        return shared_contexts
+
+    def materialize(self, output_path=None, **merge_options):
+        # The models are copied before merging so the federation itself is left untouched.
+        # merge_options are passed to every Merger and override the level management of the federation
+        merge_options = {"lvls_mgmt": self.lvls_mgmt, **merge_options}
+        if self.merged_model is None or self.merged_options != merge_options:
+            self.logger.printlog("Materializing federation into a merged model")
+            model_names = list(self.models)
+            self.merged_model = self.get_model_copy(model_names[0])
+            for model_name in model_names[1:]:
+                self.logger.printlog(f"Start merge: <{model_name}> into <{model_names[0]}>")
+                merger = ifcpatch_merge.Merger(
+                    self.logger,
+                    self.merged_model,
+                    self.get_model_copy(model_name),
+                    **merge_options
+                )
+                self.merged_model = merger.merge()
+            self.merged_options = merge_options
+            self.logger.printlog("Done")
+        if output_path:
+            self.merged_model.write(output_path)
+            self.logger.printlog(f"Merged model was successfully saved to <{output_path}>")
+        return self.merged_model
+
+    def get_model_copy(self, model_name):
+        path = self.model_paths[model_name]
+        if path:
+            return ifcopenshell.open(path)
+        return ifcopenshell.file.from_string(self.models[model_name].to_string())
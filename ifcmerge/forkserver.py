@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+
+# Fork-server mode: one warmed interpreter keeps IfcOpenShell, the schemas and the merge plans loaded,
+# and forks a child per merge request, so small merges don't pay for the interpreter startup.
+# Requests and answers are one JSON line each, a request being a batch job:
+# {"name": ..., "inputs": [...], "output": ..., "options": {...}, "log_folder": ..., "print_memory": false}
+
+
+class ForkingUnixServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+class MergeRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        import batch
+
+        try:
+            job = json.loads(self.rfile.readline().decode("utf-8"))
+            job.setdefault("name", f"job_{os.getpid()}")
+            job.setdefault("options", {})
+            result = batch.run_job(job, job.get("log_folder"))
+        except Exception as ex:
+            result = {"name": "", "status": "error", "error": str(ex), "output": "", "elapsed": 0.0}
+        self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+
+
+def warm_up():
+    start_time = time.time()
+    import ifcopenshell
+    import ifcopenshell.api
+    import ifcopenshell.util.unit
+    import ifcopenshell.util.element
+    import main
+    import batch
+    import ifcpatch_merge
+    import integrity
+
+    ifcpatch_merge.warm_up()
+    return time.time() - start_time
+
+
+def serve(socket_path):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    warm_up_time = warm_up()
+    print(f"Fork server warmed up in {round(warm_up_time, 2)} s, listening on <{socket_path}>", flush=True)
+    with ForkingUnixServer(socket_path, MergeRequestHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+
+def submit(socket_path, job):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        with client.makefile("r", encoding="utf-8") as answer:
+            return json.loads(answer.readline())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Warm fork server for fast IFC merges")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Start the fork server")
+    serve_parser.add_argument("--socket", default="/tmp/ifcsuite_merge.sock", help="Unix socket path")
+
+    submit_parser = subparsers.add_parser("submit", help="Send one merge job to a running fork server")
+    submit_parser.add_argument("--socket", default="/tmp/ifcsuite_merge.sock", help="Unix socket path")
+    submit_parser.add_argument("--name", default=None, help="Job name (used for the log file name)")
+    submit_parser.add_argument("--log-folder", default=None, help="Folder for the job log file")
+    submit_parser.add_argument("-o", "--output", required=True, help="Merged output file")
+    submit_parser.add_argument("inputs", nargs="+", help="Input files, the first one is the parent model")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    if args.command == "serve":
+        serve(args.socket)
+        return 0
+
+    job = {
+        "name": args.name or os.path.splitext(os.path.basename(args.output))[0],
+        "inputs": [os.path.abspath(path) for path in args.inputs],
+        "output": os.path.abspath(args.output),
+        "options": {},
+        "log_folder": os.path.abspath(args.log_folder) if args.log_folder else None,
+    }
+    result = submit(args.socket, job)
+    print(f"{result['name']}: {result['status']} ({result['elapsed']} s)")
+    return 0 if result["status"] == "success" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
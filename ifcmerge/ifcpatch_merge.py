@@ -1,7 +1,79 @@
 import ifcopenshell
+import ifcopenshell.api
+import ifcopenshell.guid
 import ifcopenshell.util.element
 import ifcopenshell.util.unit as unit
 import logger
+import relocation
+import integrity
+import migration
+
+
+# Per schema: {ifc_class: [names of IfcLength attributes]}, computed once per process
+length_attributes_plans = {}
+
+
+def get_length_attributes_plan(schema_name):
+    if schema_name not in length_attributes_plans:
+        classes_to_modify = {}
+        s = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_name)
+        for d in s.declarations():
+            if not hasattr(d, "all_attributes") :#or "IfcLength" not in str(d.all_attributes()):
+                continue
+            attributes_to_modify = []
+            for attribute in d.all_attributes():
+                if "IfcLength" in str(attribute):
+                    attributes_to_modify.append(attribute.name())
+            classes_to_modify[d.name()] = attributes_to_modify
+        length_attributes_plans[schema_name] = classes_to_modify
+    return length_attributes_plans[schema_name]
+
+
+# Relationships that are collapsed into a single relation per relating object after the merge
+# (IfcRelVoidsElement and IfcRelFillsElement are one-to-one, there is nothing to collapse)
+CONSOLIDATED_RELATIONSHIPS = {
+    ifc_class: integrity.RELATIONSHIP_ATTRIBUTES[ifc_class]
+    for ifc_class in (
+        "IfcRelContainedInSpatialStructure",
+        "IfcRelAggregates",
+        "IfcRelDefinesByType",
+        "IfcRelDefinesByProperties",
+    )
+}
+
+
+def get_global_elevation(spatial_element):
+    global_elevation = 0
+    loc_placement = spatial_element.ObjectPlacement
+    while(hasattr(loc_placement, "PlacementRelTo") and loc_placement.PlacementRelTo):
+        global_elevation += loc_placement.RelativePlacement.Location.Coordinates[2]
+        loc_placement = loc_placement.PlacementRelTo
+    global_elevation += loc_placement.RelativePlacement.Location.Coordinates[2]
+    return global_elevation
+
+
+def are_equivalent_contexts(context, other_context):
+    if context.is_a() != other_context.is_a():
+        return False
+    if context.is_a("IfcGeometricRepresentationSubContext"):
+        return (
+            context.ContextType == other_context.ContextType
+            and context.ContextIdentifier == other_context.ContextIdentifier
+            and context.TargetView == other_context.TargetView
+        )
+    return (
+        context.ContextType == other_context.ContextType
+        and context.ContextIdentifier == other_context.ContextIdentifier
+    )
+
+
+def warm_up(schema_names=("IFC2X3", "IFC4")):
+    # Loads the schemas and compiles the merge plans, used by long-lived worker processes
+    for schema_name in schema_names:
+        ifcopenshell.file(schema=schema_name)
+        get_length_attributes_plan(schema_name)
+    for source_schema_name, target_schema_name in migration.SUPPORTED_MIGRATIONS:
+        migration.get_migration_plans(source_schema_name, target_schema_name)
 
 
 class Merger:
@@ -12,7 +84,11 @@ class Merger:
                  merge_sites=True, 
                  merge_buildings=True, 
                  lvls_mgmt=0, 
-                 remove_empty_containers=True
+                 remove_empty_containers=True,
+                 relocation=None,
+                 relocate_by_map_conversion=False,
+                 flatten_placements=False,
+                 consolidate_relationships=True
                  ):
 
         self.logger = logger
@@ -22,6 +98,10 @@ class Merger:
         self.merge_buildings = merge_buildings
         self.lvls_mgmt = lvls_mgmt
         self.remove_empty_containers = remove_empty_containers
+        self.relocation = relocation # {"dx": 0.0, "dy": 0.0, "dz": 0.0, "angle_deg": 0.0} in parent model units
+        self.relocate_by_map_conversion = relocate_by_map_conversion
+        self.flatten_placements = flatten_placements
+        self.consolidate_relationships = consolidate_relationships
         self.dict_original_prj_units = None
         self.dict_merged_prj_units = None
 
@@ -29,6 +109,7 @@ class Merger:
     def merge(self):
 
         self.logger.printlog("  Patch start")
+        self.migrate_schemas_if_needed()
         self.existing_contexts = self.file.by_type("IfcGeometricRepresentationContext")
         original_agreggates = self.file.by_type('IfcRelAggregates')
         original_project = self.file.by_type("IfcProject")[0]
@@ -55,6 +136,7 @@ class Merger:
         self.dict_original_prj_units = self.get_prj_units_dict(self.file)
         self.dict_merged_prj_units = self.get_prj_units_dict(self.source)
         self.convert_units_if_needed()
+        self.relocate_source_if_needed()
 
         self.added_contexts = set()
 
@@ -184,6 +266,13 @@ class Merger:
         self.logger.printlog("  Done")
         self.logger.printlog()
 
+        if self.consolidate_relationships:
+            self.logger.printlog("  Consolidating relationships")
+            self.logger.printlog("  ...")
+            self.merge_relationships_by_relating_object()
+            self.logger.printlog("  Done")
+            self.logger.printlog()
+
         self.logger.printlog("  Reusing existing contexts")
         self.logger.printlog("  ...")
         self.reuse_existing_contexts()
@@ -196,6 +285,9 @@ class Merger:
             self.purge_containers()
             self.logger.printlog("  Done")
 
+        if self.flatten_placements:
+            relocation.Relocator(self.logger, self.file).flatten_placements()
+
         return self.file
     
     def merge_levels_by_elevation(self, merged_storeys, original_storeys):
@@ -203,22 +295,12 @@ class Merger:
         for merged_storey in merged_storeys:
             storey_to_merge_into = None
             if hasattr(merged_storey, "Elevation") and (merged_storey.Elevation is not None):
-                merged_global_elevation = 0
-                loc_placement = merged_storey.ObjectPlacement
-                while(hasattr(loc_placement, "PlacementRelTo") and loc_placement.PlacementRelTo):
-                    merged_global_elevation += loc_placement.RelativePlacement.Location.Coordinates[2]
-                    loc_placement = loc_placement.PlacementRelTo
-                merged_global_elevation += loc_placement.RelativePlacement.Location.Coordinates[2]
+                merged_global_elevation = get_global_elevation(merged_storey)
                 self.logger.printlog(f"    Child level [Name: {merged_storey.Name} | GlobalElevation: {round(merged_global_elevation, 5)}]")
 
                 for original_storey in original_storeys:
                     if hasattr(original_storey, "Elevation") and (original_storey.Elevation is not None):
-                        original_global_elevation = 0
-                        loc_placement = original_storey.ObjectPlacement
-                        while(hasattr(loc_placement, "PlacementRelTo") and loc_placement.PlacementRelTo):
-                            original_global_elevation += loc_placement.RelativePlacement.Location.Coordinates[2]
-                            loc_placement = loc_placement.PlacementRelTo
-                        original_global_elevation += loc_placement.RelativePlacement.Location.Coordinates[2]
+                        original_global_elevation = get_global_elevation(original_storey)
                         # self.logger.printlog(f"    Parent level [Name: {original_storey.Name} | GlobalElevation: {round(original_global_elevation, 5)}]")
                         if (abs(original_global_elevation - merged_global_elevation) < 1e-5):
                             storey_to_merge_into = original_storey
@@ -278,6 +360,18 @@ class Merger:
 
     
 
+    def migrate_schemas_if_needed(self):
+        # Mixed-schema merge: the model with the oldest schema is migrated to the schema of the other one
+        if self.file.schema == self.source.schema:
+            return
+        if not migration.is_migration_supported(self.file.schema, self.source.schema):
+            raise ValueError(f"Unable to merge models with different IFC schemas ({self.file.schema} and {self.source.schema})")
+        target_schema_name = migration.get_migration_target(self.file.schema, self.source.schema)
+        if self.source.schema != target_schema_name:
+            self.source = migration.SchemaMigrator(self.logger, self.source, target_schema_name).migrate()
+        else:
+            self.file = migration.SchemaMigrator(self.logger, self.file, target_schema_name).migrate()
+
     def convert_units_if_needed(self):
         original_length_unit = self.dict_original_prj_units["LENGTHUNIT"]
         merged_length_unit = self.dict_merged_prj_units["LENGTHUNIT"]
@@ -303,6 +397,19 @@ class Merger:
             self.logger.printlog(f"  No need to convert length units (same units in both models: {merged_length_unit_name})")
 
 
+    def relocate_source_if_needed(self):
+        relocator = relocation.Relocator(self.logger, self.source)
+        if self.relocate_by_map_conversion:
+            relocator.relocate_from_map_conversions(self.file)
+        elif self.relocation:
+            relocator.relocate(
+                self.relocation.get("dx", 0.0),
+                self.relocation.get("dy", 0.0),
+                self.relocation.get("dz", 0.0),
+                self.relocation.get("angle_deg", 0.0),
+            )
+
+
     def reuse_existing_contexts(self):
         to_delete = set()
         for added_context in self.added_contexts:
@@ -318,22 +425,40 @@ class Merger:
 
     def get_equivalent_existing_context(self, added_context):
         for context in self.existing_contexts:
-            if context.is_a() != added_context.is_a():
-                continue
-            if context.is_a("IfcGeometricRepresentationSubContext"):
-                if (
-                    context.ContextType == added_context.ContextType
-                    and context.ContextIdentifier == added_context.ContextIdentifier
-                    and context.TargetView == added_context.TargetView
-                ):
-                    return context
-            elif (
-                context.ContextType == added_context.ContextType
-                and context.ContextIdentifier == added_context.ContextIdentifier
-            ):
+            if are_equivalent_contexts(context, added_context):
                 return context
             
 
+    def merge_relationships_by_relating_object(self):
+        for ifc_class, (relating_attribute, related_attribute) in CONSOLIDATED_RELATIONSHIPS.items():
+            rels_by_relating_object = {}
+            for rel in self.file.by_type(ifc_class, include_subtypes=False):
+                relating_object = getattr(rel, relating_attribute)
+                if not isinstance(relating_object, ifcopenshell.entity_instance):
+                    continue
+                rels_by_relating_object.setdefault(relating_object.id(), []).append(rel)
+
+            removed_count = 0
+            consolidated_count = 0
+            for rels in rels_by_relating_object.values():
+                if len(rels) < 2:
+                    continue
+                consolidated_count += 1
+                related_objects = []
+                related_ids = set()
+                for rel in rels:
+                    for related_object in getattr(rel, related_attribute) or ():
+                        if related_object.id() not in related_ids:
+                            related_ids.add(related_object.id())
+                            related_objects.append(related_object)
+                # The tuple is built once and assigned once to the relation that is kept
+                setattr(rels[0], related_attribute, tuple(related_objects))
+                for rel in rels[1:]:
+                    self.file.remove(rel)
+                    removed_count += 1
+            if removed_count:
+                self.logger.printlog(f"    {ifc_class}: {removed_count} relation(s) merged into those of {consolidated_count} relating object(s)")
+
     def merge_storeys(self, merged_storey, storey_to_merge_into):
 
          # Elements référencés par le niveau
@@ -507,17 +632,7 @@ class Merger:
             element.CompositionType = "ELEMENT"
 
     def convert_length_units_of_all_elements(self, model, merged_unit, original_unit):
-        classes_to_modify = {}
-        s = ifcopenshell.ifcopenshell_wrapper.schema_by_name(model.schema)
-
-        for d in s.declarations():
-            if not hasattr(d, "all_attributes") :#or "IfcLength" not in str(d.all_attributes()):
-                continue
-            attributes_to_modify = []
-            for attribute in d.all_attributes():
-                if "IfcLength" in str(attribute):
-                    attributes_to_modify.append(attribute.name())
-            classes_to_modify[d.name()] = attributes_to_modify
+        classes_to_modify = get_length_attributes_plan(model.schema)
 
         for ifc_class, attributes in classes_to_modify.items():
             for element in model.by_type(ifc_class):
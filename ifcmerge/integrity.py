@@ -0,0 +1,165 @@
+from collections import Counter, defaultdict
+
+import traversal
+
+
+# IfcRelationship class: (relating attribute, related attribute)
+RELATIONSHIP_ATTRIBUTES = {
+    "IfcRelAggregates": ("RelatingObject", "RelatedObjects"),
+    "IfcRelNests": ("RelatingObject", "RelatedObjects"),
+    "IfcRelContainedInSpatialStructure": ("RelatingStructure", "RelatedElements"),
+    "IfcRelDefinesByType": ("RelatingType", "RelatedObjects"),
+    "IfcRelDefinesByProperties": ("RelatingPropertyDefinition", "RelatedObjects"),
+    "IfcRelAssociatesMaterial": ("RelatingMaterial", "RelatedObjects"),
+    "IfcRelVoidsElement": ("RelatingBuildingElement", "RelatedOpeningElement"),
+    "IfcRelFillsElement": ("RelatingOpeningElement", "RelatedBuildingElement"),
+    "IfcRelConnectsPortToElement": ("RelatingPort", "RelatedElement"),
+}
+
+# Resource entities that point to what they describe and are never referenced themselves
+SELF_STANDING_RESOURCES = (
+    "IfcStyledItem",
+    "IfcPresentationLayerAssignment",
+    "IfcMaterialDefinitionRepresentation",
+    "IfcOwnerHistory",
+)
+
+MAX_EXAMPLES_IN_REPORT = 5
+
+
+class IntegrityChecker:
+    def __init__(self, logger, model):
+        self.logger = logger
+        self.model = model
+
+    def check(self):
+        # One sweep over the model builds the inverse reference counts and the merge-specific bookkeeping
+        inverse_counts = Counter()
+        projects = []
+        spatial_elements = []
+        elements = []
+        contexts = []
+        used_contexts = set()
+        aggregated_ids = set()
+        nested_ids = set()
+        containment_counts = Counter()
+        empty_relationships = []
+        duplicated_relationships = []
+        relationship_keys = {}
+        resources = []
+        entities_count = 0
+
+        for entity, references in traversal.iter_reference_map(self.model):
+            entities_count += 1
+            for ref in references:
+                inverse_counts[ref.id()] += 1
+
+            ifc_class = entity.is_a()
+            if not entity.is_a("IfcRoot"):
+                resources.append(entity)
+                if entity.is_a("IfcGeometricRepresentationContext"):
+                    contexts.append(entity)
+                elif entity.is_a("IfcRepresentation") and entity.ContextOfItems:
+                    used_contexts.add(entity.ContextOfItems.id())
+            elif ifc_class in RELATIONSHIP_ATTRIBUTES:
+                relating_attribute, related_attribute = RELATIONSHIP_ATTRIBUTES[ifc_class]
+                relating = getattr(entity, relating_attribute)
+                related = getattr(entity, related_attribute)
+                related = related if isinstance(related, tuple) else ((related,) if related is not None else ())
+                if relating is None or not related:
+                    empty_relationships.append(entity)
+                    continue
+                key = (ifc_class, relating.id(), frozenset(obj.id() for obj in related))
+                if key in relationship_keys:
+                    duplicated_relationships.append(entity)
+                else:
+                    relationship_keys[key] = entity
+                if ifc_class == "IfcRelAggregates":
+                    aggregated_ids.update(obj.id() for obj in related)
+                elif ifc_class == "IfcRelNests":
+                    nested_ids.update(obj.id() for obj in related)
+                elif ifc_class == "IfcRelContainedInSpatialStructure":
+                    containment_counts.update(obj.id() for obj in related)
+            elif entity.is_a("IfcProject"):
+                projects.append(entity)
+            elif entity.is_a("IfcSpatialStructureElement"):
+                spatial_elements.append(entity)
+            elif entity.is_a("IfcElement"):
+                if not entity.is_a("IfcFeatureElement"):
+                    elements.append(entity)
+
+        # A parent context is in use as soon as one of its subcontexts is
+        for context in contexts:
+            if context.is_a("IfcGeometricRepresentationSubContext") and context.ParentContext and context.id() in used_contexts:
+                used_contexts.add(context.ParentContext.id())
+
+        report = {
+            "entities": entities_count,
+            "projects": projects,
+            "orphan_spatial_elements": [spatial for spatial in spatial_elements if spatial.id() not in aggregated_ids],
+            "uncontained_elements": [
+                element for element in elements
+                if not containment_counts[element.id()] and element.id() not in aggregated_ids and element.id() not in nested_ids
+            ],
+            "multi_contained_elements": [element for element in elements if containment_counts[element.id()] > 1],
+            # Exporters commonly declare subcontexts they don't use (Box, FootPrint...), only unused root contexts are errors
+            "unused_contexts": [
+                context for context in contexts
+                if context.id() not in used_contexts and not context.is_a("IfcGeometricRepresentationSubContext")
+            ],
+            "unused_subcontexts": [
+                context for context in contexts
+                if context.id() not in used_contexts and context.is_a("IfcGeometricRepresentationSubContext")
+            ],
+            "empty_relationships": empty_relationships,
+            "duplicated_relationships": duplicated_relationships,
+            "unreferenced_resources": self.get_unreferenced_resources(resources, inverse_counts),
+        }
+        return report
+
+    def get_unreferenced_resources(self, resources, inverse_counts):
+        # Resource entities (not IfcRoot) that nothing points to anymore, typically left over by removed containers
+        unreferenced = defaultdict(int)
+        for entity in resources:
+            if inverse_counts[entity.id()]:
+                continue
+            if any(entity.is_a(ifc_class) for ifc_class in SELF_STANDING_RESOURCES):
+                continue
+            unreferenced[entity.is_a()] += 1
+        return dict(unreferenced)
+
+    def is_valid(self, report):
+        return (
+            len(report["projects"]) == 1
+            and not report["orphan_spatial_elements"]
+            and not report["uncontained_elements"]
+            and not report["multi_contained_elements"]
+            and not report["unused_contexts"]
+            and not report["empty_relationships"]
+            and not report["duplicated_relationships"]
+        )
+
+    def print_report(self, report):
+        self.logger.printlog(f"  Integrity report ({report['entities']} entities)")
+        self.print_check("Projects (1 expected)", report["projects"], expected_count=1)
+        self.print_check("Orphan spatial elements", report["orphan_spatial_elements"])
+        self.print_check("Elements without container", report["uncontained_elements"])
+        self.print_check("Elements in several containers", report["multi_contained_elements"])
+        self.print_check("Unused contexts", report["unused_contexts"])
+        self.print_check("Unused subcontexts", report["unused_subcontexts"], status_if_failed="INFO")
+        self.print_check("Empty relationships", report["empty_relationships"])
+        self.print_check("Duplicated relationships", report["duplicated_relationships"])
+        unreferenced = report["unreferenced_resources"]
+        if unreferenced:
+            summary = ", ".join(f"{ifc_class}: {count}" for ifc_class, count in sorted(unreferenced.items(), key=lambda x: -x[1])[:MAX_EXAMPLES_IN_REPORT])
+            self.logger.printlog(f"    [INFO] Unreferenced resources: {sum(unreferenced.values())} ({summary})")
+        else:
+            self.logger.printlog("    [OK] Unreferenced resources: 0")
+
+    def print_check(self, title, entities, expected_count=0, status_if_failed="ERROR"):
+        status = "OK" if len(entities) == expected_count else status_if_failed
+        line = f"    [{status}] {title}: {len(entities)}"
+        if status != "OK" and entities:
+            examples = " ".join(f"#{entity.id()}={entity.is_a()}" for entity in entities[:MAX_EXAMPLES_IN_REPORT])
+            line += f" ({examples}{' ...' if len(entities) > MAX_EXAMPLES_IN_REPORT else ''})"
+        self.logger.printlog(line)
@@ -14,12 +14,13 @@ class Logger:
         self.print_details = False
         self.no_output_file = False
         self.disabled = False
+        self.quiet = False # Only write to the log file (used by batch jobs running in parallel)
 
-    def initiate_logfile(self, output_folder, print_details=False):
+    def initiate_logfile(self, output_folder, print_details=False, log_filename="log.txt"):
         if not self.no_output_file:
             self.start_time = time.time()
             self.output_folder = output_folder
-            self.output_path = os.path.join(output_folder, "log.txt")
+            self.output_path = os.path.join(output_folder, log_filename)
             self.log_file = open(
                 self.output_path, "w", newline="", encoding="utf-8"
             )
@@ -53,13 +54,15 @@ class Logger:
         formatted_time = f"[{int(minutes):02}:{int(seconds):02}:{int(hundredths):02}]"
 
         if self.no_output_file:
-            print(f"{formatted_time}  {txt}")
+            if not self.quiet:
+                print(f"{formatted_time}  {txt}")
         else:
             separator = "-" * len(txt)
             if title:
                 self.printlog()
                 self.printlog(separator)
-            print(f"{formatted_time}  {txt}")
+            if not self.quiet:
+                print(f"{formatted_time}  {txt}")
             self.log_file.write(formatted_time + "  " + txt + "\n")
             self.log_file.flush()
             if title:
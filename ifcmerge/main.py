@@ -1,20 +1,15 @@
+import argparse
+import gc
 import sys
 import time
 import ifcopenshell
-import ifcopenshell.api
-import ifcopenshell.util
-import ifcopenshell.util.element
-import ifcopenshell.util.unit
 import logger
 import os
-import ifcpatch_merge
 
 import traceback
 
-import tkinter as tk
-from tkinter import filedialog
-
-import psutil
+# GUI (tkinter), diagnostics (psutil), IfcOpenShell api/util modules and the merge modules
+# are imported on first use, so headless and short runs don't pay for them at startup
 # from pympler import asizeof
 
 
@@ -26,6 +21,7 @@ class Main:
         self.models_name = []
         self.parent_model = None
         self.logger = None
+        self.print_memory_usage = False # Log the process RSS at every stage of the merge
 
         if getattr(sys, "frozen", False):
             dirpath = os.path.dirname(sys.executable)
@@ -39,18 +35,18 @@ class Main:
         self.output_filename = "IFCSuite_merged.ifc"
         self.output_filepath = os.path.join(self.output_folder, self.output_filename)
 
-        self.process = psutil.Process(os.getpid())
+        self.process = None
 
     def initiate_merge_environment(self, disable_log=False):
         self.logger = logger.Logger()
         self.logger.start_time = time.time()
         self.logger.no_output_file = True
         self.logger.disabled = disable_log
-        self.print_memory()
-        global schema, models_to_merge, models_name
-        schema = ""
-        models_to_merge = []
-        models_name = []
+        self.print_memory("Start")
+        self.schema = ""
+        self.models_to_merge = []
+        self.models_name = []
+        self.parent_model = None
         return "success"
 
     def get_object_size(object):
@@ -58,10 +54,18 @@ class Main:
         size = asizeof.asizeof(object)
         return f"size in bytes: {size:,}"
 
-    def print_memory(self):
-        return
-        memory_use = self.process.memory_info().rss
-        self.logger.printlog(f"Memory used: {memory_use:,} bytes")
+    def get_process(self):
+        if self.process is None:
+            import psutil
+            self.process = psutil.Process(os.getpid())
+        return self.process
+
+    def print_memory(self, stage=""):
+        if not self.print_memory_usage:
+            return
+        memory_use = self.get_process().memory_info().rss
+        stage = f" [{stage}]" if stage else ""
+        self.logger.printlog(f"Memory used{stage}: {memory_use / 1024**2:,.1f} MB ({memory_use:,} bytes)")
 
     # get_models_from_contents --- Cannot parse IFCZIP
         
@@ -90,29 +94,51 @@ class Main:
             self.logger.printlog(traceback.format_exc())
             return "error", ex
         if model.schema != self.schema and self.schema != "":
-            error_message = f"Unable to merge models with different IFC schemas ({self.schema} and {model.schema})"
-            self.logger.printlog(error_message)
-            return "error", error_message
-        self.schema = model.schema
+            import migration
+
+            if not migration.is_migration_supported(self.schema, model.schema):
+                error_message = f"Unable to merge models with different IFC schemas ({self.schema} and {model.schema})"
+                self.logger.printlog(error_message)
+                return "error", error_message
+            self.logger.printlog(f"Model schema ({model.schema}) differs from {self.schema}, it will be migrated during the merge")
+            self.schema = migration.get_migration_target(self.schema, model.schema)
+        else:
+            self.schema = model.schema
         self.models_name.append(name)
         self.models_to_merge.append(model)
         self.logger.printlog("Done")
         self.logger.printlog()
         return "success", ""
 
+    def release_memory(self):
+        gc.collect()
+        # Give the freed heap pages back to the OS (glibc keeps them otherwise, and the RSS never goes down)
+        if sys.platform.startswith("linux"):
+            try:
+                import ctypes
+                ctypes.CDLL("libc.so.6").malloc_trim(0)
+            except (OSError, AttributeError):
+                pass
+
     def free_memory(self):
+        # Drops every child model, only the parent (merged) model is kept
         self.logger.printlog("Freeing memory")
-        self.print_memory()
-        global models_to_merge, parent_model
-        models_to_merge = []
+        self.print_memory("Before freeing memory")
+        self.models_to_merge = self.models_to_merge[:1]
+        self.models_name = self.models_name[:1]
+        self.release_memory()
         self.logger.printlog("Done freeing memory")
-        self.print_memory()
+        self.print_memory("After freeing memory")
 
-    def patch_merge(self, model_num, merge_sites=True, merge_buildings=True, lvls_mgmt=0, remove_empty_containers=True):
+    def patch_merge(self, model_num, **merge_options):
         self.parent_model = self.models_to_merge[0]
-        child_model = self.models_to_merge[model_num]
-        self.print_memory()
-        self.logger.printlog(f"Start merge: <{self.models_name[model_num]}> into <{self.models_name[0]}>")
+        return self.merge_child_model(self.models_to_merge[model_num], self.models_name[model_num], **merge_options)
+
+    def merge_child_model(self, child_model, child_name, merge_sites=True, merge_buildings=True, lvls_mgmt=0, remove_empty_containers=True, relocation=None, relocate_by_map_conversion=False, flatten_placements=False, consolidate_relationships=True):
+        import ifcpatch_merge
+
+        self.print_memory(f"Before merging {child_name}")
+        self.logger.printlog(f"Start merge: <{child_name}> into <{self.models_name[0]}>")
         self.logger.printlog()
 
         merger = ifcpatch_merge.Merger(
@@ -122,10 +148,15 @@ class Main:
             merge_sites=merge_sites,
             merge_buildings=merge_buildings,
             lvls_mgmt=lvls_mgmt,
-            remove_empty_containers=remove_empty_containers
+            remove_empty_containers=remove_empty_containers,
+            relocation=relocation,
+            relocate_by_map_conversion=relocate_by_map_conversion,
+            flatten_placements=flatten_placements,
+            consolidate_relationships=consolidate_relationships
         )
         self.parent_model = merger.merge()
-        self.print_memory()
+        self.models_to_merge[0] = self.parent_model
+        self.print_memory(f"After merging {child_name}")
 
         self.logger.printlog()
         self.logger.printlog("Merge done")
@@ -133,8 +164,22 @@ class Main:
         self.logger.printlog()
         return "success", ""
 
+    def check_integrity(self):
+        import integrity
+
+        self.logger.printlog("Checking merged model integrity")
+        checker = integrity.IntegrityChecker(self.logger, self.parent_model)
+        report = checker.check()
+        checker.print_report(report)
+        self.logger.printlog("Done")
+        self.logger.printlog()
+        return "success", report
+
     def prompt_output_filename(self):
         try:
+            import tkinter as tk
+            from tkinter import filedialog
+
             root = tk.Tk()
             root.withdraw()  # Hides main window
             path = filedialog.asksaveasfilename(
@@ -176,6 +221,8 @@ class Main:
             return "error"
 
     def get_prj_units_dict(self, model):
+        import ifcopenshell.util.unit
+
         new_dict = {}
         unit_assignment = ifcopenshell.util.unit.get_unit_assignment(model)
         if unit_assignment:
@@ -186,47 +233,141 @@ class Main:
         return new_dict
 
 
+    def open_model(self, files_folder, model_to_open):
+        model_name = os.path.basename(model_to_open)
+        self.logger.printlog(f"Opening file: {model_name} ...")
+        model_path = os.path.join(files_folder, model_to_open)
+        if not os.path.exists(model_path):
+            self.logger.printlog(
+                f"Error : File <{model_path}> doesn't exist"
+            )
+            return None, model_name
+        model = ifcopenshell.open(model_path)
+        # self.logger.printlog("Size of models: " + get_object_size(models))
+        # self.logger.printlog(gc.get_referrers(models[-1]))
+        self.logger.printlog(
+            f"Model <{model_name}> [{model.schema}] was successfully opened"
+        )
+        self.print_memory(f"After opening {model_name}")
+        return model, model_name
+
     def open_and_get_models(self, files_folder, models_to_open):
         self.logger.printlog("Script starts: Opening files")
 
         for model_to_open in models_to_open:
-            self.print_memory()
-            model_name = os.path.basename(model_to_open)
-            self.logger.printlog(f"Opening file: {model_name} ...")
-            model_path = os.path.join(files_folder, model_to_open)
-            if os.path.exists(model_path):
-                self.models_to_merge.append(ifcopenshell.open(model_path))
+            model, model_name = self.open_model(files_folder, model_to_open)
+            if model is not None:
+                self.models_to_merge.append(model)
                 self.models_name.append(model_name)
-                # self.logger.printlog("Size of models: " + get_object_size(models))
-                # self.logger.printlog(gc.get_referrers(models[-1]))
-                self.logger.printlog(
-                    f"Model <{model_name}> [{self.models_to_merge[-1].schema}] was successfully opened"
-                )
-            else:
-                self.logger.printlog(
-                    f"Error : File <{model_path}> doesn't exist"
-                )
-            self.print_memory()
         self.logger.printlog("All files are opened")
         self.logger.printlog()
 
-    def main(self):
-        self.initiate_merge_environment(disable_log=False)
-        # self.print_memory()
-        self.open_and_get_models(self.files_folder, self.models_to_open)
-        # self.print_memory()
-        for model_num in range(1, len(self.models_to_merge)):
-            self.patch_merge(model_num)
+    def merge_sequentially(self, files_folder, models_to_open, merge_options=None):
+        # Load-merge-release: a child model is opened only once the previous one was merged and released,
+        # so the peak memory is about the parent model plus the largest child instead of the sum of all inputs
+        merge_options = merge_options or {}
+        self.logger.printlog("Script starts: Opening parent file")
+        parent_model, parent_name = self.open_model(files_folder, models_to_open[0])
+        if parent_model is None:
+            return "error", f"File <{os.path.join(files_folder, models_to_open[0])}> doesn't exist"
+        self.parent_model = parent_model
+        self.models_to_merge = [parent_model]
+        self.models_name = [parent_name]
+        del parent_model
+        self.logger.printlog()
+
+        for model_to_open in models_to_open[1:]:
+            child_model, child_name = self.open_model(files_folder, model_to_open)
+            if child_model is None:
+                return "error", f"File <{os.path.join(files_folder, model_to_open)}> doesn't exist"
+            self.merge_child_model(child_model, child_name, **merge_options)
+            del child_model
+            self.release_memory()
+            self.print_memory(f"After releasing {child_name}")
+        return "success", ""
+
+    def create_federation(self, files_folder, models_to_open, lvls_mgmt=0):
+        import federation
+
+        self.logger.printlog("Script starts: Creating federation")
+        federated_models = federation.Federation(self.logger, lvls_mgmt=lvls_mgmt)
+        for model_to_open in models_to_open:
+            model_path = os.path.join(files_folder, model_to_open)
+            if not os.path.exists(model_path):
+                self.logger.printlog(f"Error : File <{model_path}> doesn't exist")
+                return "error", None
+            federated_models.open_model(model_path)
+        self.logger.printlog("Done")
+        self.logger.printlog()
+        return "success", federated_models
+
+    def diff_models(self, files_folder, old_model_to_open, new_model_to_open):
+        import diff
+
+        self.logger.printlog("Script starts: Comparing model versions")
+        old_model, old_name = self.open_model(files_folder, old_model_to_open)
+        new_model, new_name = self.open_model(files_folder, new_model_to_open)
+        if old_model is None or new_model is None:
+            return "error", None
+        self.logger.printlog(f"Diff <{old_name}> -> <{new_name}>")
+        model_diff = diff.ModelDiff(self.logger, old_model, new_model)
+        result = model_diff.compute()
+        model_diff.print_report(result)
+        self.logger.printlog("Done")
+        self.logger.printlog()
+        return "success", result
+
+    def split_model(self, files_folder, model_to_open, output_folder, by="storey"):
+        import splitter
+
+        self.logger.printlog(f"Script starts: Splitting model by {by}")
+        model, model_name = self.open_model(files_folder, model_to_open)
+        if model is None:
+            return "error", []
+        model_splitter = splitter.Splitter(self.logger, model)
+        prefix = os.path.splitext(model_name)[0] + "_"
+        if by == "storey":
+            output_paths = model_splitter.split_by_storey(output_folder, prefix)
+        elif by == "discipline":
+            output_paths = model_splitter.split_by_discipline(output_folder, prefix)
+        else:
+            self.logger.printlog(f"ERROR : Unknown split mode <{by}>")
+            return "error", []
+        self.logger.printlog("Done")
+        self.logger.printlog()
+        return "success", output_paths
+
+    def run_merge(self, files_folder, models_to_open, output_filepath, merge_options=None):
+        status, error = self.merge_sequentially(files_folder, models_to_open, merge_options)
+        if status != "success":
+            self.logger.printlog("ERROR : Some input files could not be opened, merge cancelled")
+            return "error", error
+        self.check_integrity()
         self.logger.printlog()
         self.logger.printlog("---------------------------------------------------")
         self.logger.printlog()
-        self.logger.printlog(f"Merge done, saving file to <{self.output_filepath}>")
+        self.logger.printlog(f"Merge done, saving file to <{output_filepath}>")
         self.logger.printlog("...")
-        self.save_merged_file(self.output_filepath)
+        if self.save_merged_file(output_filepath) != "success":
+            return "error", f"Merged model could not be saved to <{output_filepath}>"
+        return "success", ""
+
+    def main(self):
+        self.initiate_merge_environment(disable_log=False)
+        # self.print_memory()
+        self.run_merge(self.files_folder, self.models_to_open, self.output_filepath)
         # self.print_memory()
         self.logger.close_log_file()
         # self.print_memory()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Merge the IFC files of the files folder")
+    parser.add_argument("--print-memory", action="store_true", help="Log the process RSS at every stage of the merge")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
     main_inst = Main()
+    main_inst.print_memory_usage = args.print_memory
     main_inst.main()
@@ -0,0 +1,315 @@
+import ifcopenshell
+import ifcopenshell.ifcopenshell_wrapper as wrapper
+
+import traversal
+
+
+SUPPORTED_MIGRATIONS = {("IFC2X3", "IFC4")}
+
+# Attributes renamed between the schemas: {(target class, target attribute): source attribute}
+# Inherited attributes are looked up on every supertype of the target class
+RENAMED_ATTRIBUTES = {
+    ("IfcPerson", "Identification"): "Id",
+    ("IfcOrganization", "Identification"): "Id",
+    ("IfcExternalReference", "Identification"): "ItemReference",
+    ("IfcDocumentInformation", "Identification"): "DocumentId",
+}
+
+# Known type narrowings of the target schema: {target class: SchemaMigrator method rebuilding the entity when
+# one of its references no longer has the required type}, the other entities with such a reference are dropped
+NARROWING_FIXUPS = {
+    "IfcRelConnectsPortToElement": "nest_port", # IFC4: RelatedElement must be an IfcDistributionElement
+}
+
+# Per (source schema, target schema): {source class: MigrationPlan}, computed once per process
+migration_plans = {}
+
+
+def is_migration_supported(schema_name, other_schema_name):
+    return (schema_name, other_schema_name) in SUPPORTED_MIGRATIONS or (other_schema_name, schema_name) in SUPPORTED_MIGRATIONS
+
+
+def get_migration_target(schema_name, other_schema_name):
+    # Models are always migrated up to the most recent schema of the two
+    if (schema_name, other_schema_name) in SUPPORTED_MIGRATIONS:
+        return other_schema_name
+    return schema_name
+
+
+def can_hold_instances(attribute_type):
+    # True when a value of this type can be (or contain) an entity instance, entity references and type-wrapped select values
+    if isinstance(attribute_type, wrapper.named_type):
+        return can_hold_instances(attribute_type.declared_type())
+    if isinstance(attribute_type, (wrapper.entity, wrapper.select_type)):
+        return True
+    if isinstance(attribute_type, wrapper.type_declaration):
+        return can_hold_instances(attribute_type.declared_type())
+    if isinstance(attribute_type, wrapper.aggregation_type):
+        return can_hold_instances(attribute_type.type_of_element())
+    return False
+
+
+def get_required_entity(attribute_type):
+    # Name of the entity class required by an entity reference or an aggregate of entity references, None otherwise
+    if isinstance(attribute_type, wrapper.aggregation_type):
+        return get_required_entity(attribute_type.type_of_element())
+    if isinstance(attribute_type, wrapper.named_type) and isinstance(attribute_type.declared_type(), wrapper.entity):
+        return attribute_type.declared_type().name()
+    return None
+
+
+def get_enumeration_items(attribute_type):
+    if isinstance(attribute_type, wrapper.named_type):
+        declared_type = attribute_type.declared_type()
+        if isinstance(declared_type, wrapper.enumeration_type):
+            return frozenset(declared_type.enumeration_items())
+    return None
+
+
+class MigrationPlan:
+    # How the instances of one source class are rebuilt in the target schema.
+    # identical: same class with the same attributes in both schemas, values are copied positionally
+    # and only the attributes that can hold instances go through the conversion (none at all for most geometry classes)
+    def __init__(self, target_class):
+        self.target_class = target_class
+        self.identical = False
+        self.instance_indices = [] # identical plans: indices of the attributes holding instances
+        self.attributes = [] # other plans: per target attribute (source index or None, holds instances, enumeration items, optional, required entity)
+
+
+def get_attribute_names_with_renames(declaration):
+    # {target attribute name: source attribute name} for the renamed attributes of the class and of its supertypes
+    renamed = {}
+    current = declaration
+    while current is not None:
+        for (ifc_class, target_name), source_name in RENAMED_ATTRIBUTES.items():
+            if ifc_class == current.name():
+                renamed[target_name] = source_name
+        current = current.supertype()
+    return renamed
+
+
+def get_nearest_target_declaration(source_declaration, target_schema):
+    # Classes removed from the target schema fall back to their nearest instantiable supertype
+    current = source_declaration
+    while current is not None:
+        try:
+            target_declaration = target_schema.declaration_by_name(current.name())
+        except Exception:
+            target_declaration = None
+        if target_declaration is not None and not target_declaration.is_abstract():
+            return target_declaration
+        current = current.supertype()
+    return None
+
+
+def compile_migration_plan(source_declaration, target_schema):
+    target_declaration = get_nearest_target_declaration(source_declaration, target_schema)
+    if target_declaration is None:
+        return None
+    plan = MigrationPlan(target_declaration.name())
+    source_attributes = source_declaration.all_attributes()
+    target_attributes = target_declaration.all_attributes()
+
+    if (
+        source_declaration.name() == target_declaration.name()
+        and len(source_attributes) == len(target_attributes)
+        and source_declaration.derived() == target_declaration.derived()
+        and all(
+            source_attribute.name() == target_attribute.name()
+            and str(source_attribute.type_of_attribute()) == str(target_attribute.type_of_attribute())
+            for source_attribute, target_attribute in zip(source_attributes, target_attributes)
+        )
+    ):
+        plan.identical = True
+        plan.instance_indices = [
+            index for index, attribute in enumerate(target_attributes)
+            if not target_declaration.derived()[index] and can_hold_instances(attribute.type_of_attribute())
+        ]
+        return plan
+
+    source_indices = {attribute.name(): index for index, attribute in enumerate(source_attributes)}
+    renamed = get_attribute_names_with_renames(target_declaration)
+    for index, attribute in enumerate(target_attributes):
+        if target_declaration.derived()[index]:
+            plan.attributes.append(None)
+            continue
+        source_index = source_indices.get(renamed.get(attribute.name(), attribute.name()))
+        if source_index is not None and source_declaration.derived()[source_index]:
+            source_index = None
+        attribute_type = attribute.type_of_attribute()
+        plan.attributes.append((
+            source_index,
+            can_hold_instances(attribute_type),
+            get_enumeration_items(attribute_type),
+            attribute.optional(),
+            get_required_entity(attribute_type),
+        ))
+    return plan
+
+
+def get_migration_plans(source_schema_name, target_schema_name):
+    key = (source_schema_name, target_schema_name)
+    if key not in migration_plans:
+        source_schema = wrapper.schema_by_name(source_schema_name)
+        target_schema = wrapper.schema_by_name(target_schema_name)
+        migration_plans[key] = {
+            declaration.name(): compile_migration_plan(declaration, target_schema)
+            for declaration in source_schema.entities()
+        }
+    return migration_plans[key]
+
+
+class SchemaMigrator:
+    # Rebuilds a whole model in another schema, every entity is converted once with the precompiled plan of its class
+    def __init__(self, logger, model, target_schema_name):
+        self.logger = logger
+        self.model = model
+        self.target_schema_name = target_schema_name
+        self.target_schema = wrapper.schema_by_name(target_schema_name)
+        self.plans = get_migration_plans(model.schema, target_schema_name)
+        self.target = None
+        self.converted = {} # {source entity id: target entity, date string or None}
+        self.fallback_classes = {} # {source class: target class}
+        self.dropped_classes = {} # {source class: count}
+        self.narrowed_references = {} # {(target class, attribute, required class, referenced class, fix-up or None): count}
+
+    def migrate(self):
+        self.logger.printlog(f"  Migrating model from {self.model.schema} to {self.target_schema_name}")
+        self.target = ifcopenshell.file(schema=self.target_schema_name)
+        for entity in self.model:
+            if entity.id() not in self.converted:
+                self.convert_entity_with_references(entity)
+        for source_class, target_class in self.fallback_classes.items():
+            self.logger.printlog(f"    {source_class} doesn't exist in {self.target_schema_name}, migrated as {target_class}")
+        for source_class, count in self.dropped_classes.items():
+            self.logger.printlog(f"    {count} {source_class} can't be migrated to {self.target_schema_name} and were dropped")
+        for (target_class, attribute_name, required_entity, referenced_class, fixup), count in self.narrowed_references.items():
+            outcome = f"rebuilt with {fixup}" if fixup else "dropped"
+            self.logger.printlog(f"    {count} {target_class} with an {referenced_class} as {attribute_name} ({required_entity} in {self.target_schema_name}) were {outcome}")
+        return self.target
+
+    def convert_entity_with_references(self, entity):
+        # Iterative post-order walk, referenced entities are converted before the entities referencing them
+        stack = [entity]
+        in_progress = set()
+        while stack:
+            current = stack[-1]
+            if current.id() in self.converted:
+                stack.pop()
+                continue
+            if current.id() not in in_progress:
+                in_progress.add(current.id())
+                for ref in traversal.get_forward_references(self.model, current):
+                    if ref.id() not in self.converted and ref.id() not in in_progress:
+                        stack.append(ref)
+                continue
+            stack.pop()
+            self.converted[current.id()] = self.convert_entity(current)
+
+    def convert_entity(self, entity):
+        source_class = entity.is_a()
+        plan = self.plans.get(source_class)
+        if plan is None:
+            date_string = self.convert_date(entity)
+            if date_string is None:
+                self.dropped_classes[source_class] = self.dropped_classes.get(source_class, 0) + 1
+            return date_string
+        if plan.target_class != source_class:
+            self.fallback_classes[source_class] = plan.target_class
+
+        if plan.identical:
+            values = list(entity)
+            for index in plan.instance_indices:
+                values[index] = self.convert_value(values[index])
+            return self.target.create_entity(plan.target_class, *values)
+
+        values = []
+        narrowed = None # (attribute index, required class, referenced class) of a mandatory reference without the required type
+        for attribute_index, attribute_plan in enumerate(plan.attributes):
+            if attribute_plan is None:
+                values.append(None)
+                continue
+            source_index, holds_instances, enumeration_items, optional, required_entity = attribute_plan
+            value = entity[source_index] if source_index is not None else None
+            if isinstance(value, ifcopenshell.entity_instance) and value.id() and not holds_instances:
+                # Entity replaced by a simple value in the target schema (IfcCalendarDate -> IfcDate...)
+                value = self.converted.get(value.id())
+            elif holds_instances:
+                value = self.convert_value(value)
+            if enumeration_items is not None and value not in enumeration_items:
+                value = self.get_enumeration_fallback(enumeration_items, optional)
+            if required_entity is not None and value is not None:
+                value, invalid_class = self.check_required_entity(value, required_entity)
+                if invalid_class is not None and narrowed is None and (value is None or value == ()) and not optional:
+                    narrowed = (attribute_index, required_entity, invalid_class)
+            values.append(value)
+
+        if narrowed is not None:
+            attribute_index, required_entity, invalid_class = narrowed
+            attribute_name = self.target_schema.declaration_by_name(plan.target_class).all_attributes()[attribute_index].name()
+            fixup = NARROWING_FIXUPS.get(plan.target_class)
+            key = (plan.target_class, attribute_name, required_entity, invalid_class, fixup)
+            self.narrowed_references[key] = self.narrowed_references.get(key, 0) + 1
+            return getattr(self, fixup)(entity) if fixup else None
+        return self.target.create_entity(plan.target_class, *values)
+
+    def check_required_entity(self, value, required_entity):
+        # (value without the references not of the required class, class of the first reference removed or None)
+        if isinstance(value, tuple):
+            kept = [v for v in value if not isinstance(v, ifcopenshell.entity_instance) or v.is_a(required_entity)]
+            invalid = [v for v in value if isinstance(v, ifcopenshell.entity_instance) and not v.is_a(required_entity)]
+            return tuple(kept), invalid[0].is_a() if invalid else None
+        if isinstance(value, ifcopenshell.entity_instance) and value.id() and not value.is_a(required_entity):
+            return None, value.is_a()
+        return value, None
+
+    def nest_port(self, entity):
+        # IFC4 nests the ports of the elements that aren't distribution elements
+        port = self.converted.get(entity.RelatingPort.id())
+        element = self.converted.get(entity.RelatedElement.id())
+        if not isinstance(port, ifcopenshell.entity_instance) or not isinstance(element, ifcopenshell.entity_instance):
+            return None
+        return self.target.create_entity(
+            "IfcRelNests",
+            entity.GlobalId,
+            self.convert_value(entity.OwnerHistory),
+            entity.Name,
+            entity.Description,
+            element,
+            (port,),
+        )
+
+    def convert_value(self, value):
+        if isinstance(value, ifcopenshell.entity_instance):
+            if value.id():
+                converted = self.converted.get(value.id())
+                return converted if isinstance(converted, ifcopenshell.entity_instance) else None
+            # Type-wrapped select value (IfcLabel, IfcLengthMeasure...)
+            try:
+                self.target_schema.declaration_by_name(value.is_a())
+            except Exception:
+                return None
+            return self.target.create_entity(value.is_a(), self.convert_value(value.wrappedValue))
+        if isinstance(value, tuple):
+            converted_values = [self.convert_value(v) for v in value]
+            return tuple(v for v in converted_values if v is not None)
+        return value
+
+    def get_enumeration_fallback(self, enumeration_items, optional):
+        if optional:
+            return None
+        for fallback in ("NOTDEFINED", "USERDEFINED"):
+            if fallback in enumeration_items:
+                return fallback
+        return sorted(enumeration_items)[0]
+
+    def convert_date(self, entity):
+        # IFC2X3 date and time entities became ISO 8601 strings
+        if entity.is_a("IfcCalendarDate"):
+            return f"{entity.YearComponent:04}-{entity.MonthComponent:02}-{entity.DayComponent:02}"
+        if entity.is_a("IfcLocalTime"):
+            return f"{entity.HourComponent:02}:{entity.MinuteComponent or 0:02}:{int(entity.SecondComponent or 0):02}"
+        if entity.is_a("IfcDateAndTime"):
+            return f"{self.convert_date(entity.DateComponent)}T{self.convert_date(entity.TimeComponent)}"
+        return None
@@ -0,0 +1,188 @@
+import math
+import numpy as np
+import ifcopenshell
+
+
+class Relocator:
+    def __init__(self, logger, model):
+        self.logger = logger
+        self.model = model
+
+    def relocate(self, dx=0.0, dy=0.0, dz=0.0, angle_deg=0.0):
+        # Applies one rigid transform (rotation around Z then translation) to the whole model.
+        # Only the absolute placements (sites or buildings aggregated under the IfcProject, and the grids, annotations,
+        # proxies... placed outside the spatial structure) are re-rooted under a new placement,
+        # the rest of the model is placed relative to them
+        if not (dx or dy or dz or angle_deg):
+            self.logger.printlog("  No relocation needed")
+            return None
+
+        root_placements = self.get_root_placements()
+        if not root_placements:
+            self.logger.printlog("  No root placement found, model was not relocated")
+            return None
+
+        self.logger.printlog(f"  Relocating model [dX: {dx} | dY: {dy} | dZ: {dz} | Angle: {angle_deg}°] ({len(root_placements)} root placement(s))")
+        angle = math.radians(angle_deg)
+        new_root = self.model.create_entity(
+            "IfcLocalPlacement",
+            **{
+                "PlacementRelTo": None,
+                "RelativePlacement": self.model.create_entity(
+                    "IfcAxis2Placement3D",
+                    **{
+                        "Location": self.model.create_entity("IfcCartesianPoint", Coordinates=(float(dx), float(dy), float(dz))),
+                        "Axis": self.model.create_entity("IfcDirection", DirectionRatios=(0.0, 0.0, 1.0)),
+                        "RefDirection": self.model.create_entity("IfcDirection", DirectionRatios=(math.cos(angle), math.sin(angle), 0.0)),
+                    },
+                ),
+            },
+        )
+        for placement in root_placements:
+            placement.PlacementRelTo = new_root
+        return new_root
+
+    def relocate_from_map_conversions(self, reference_model):
+        # Computes the transform that brings this model into the local coordinates of the reference model
+        # from the IfcMapConversion of both models (IFC4 georeferencing), then applies it at the root
+        model_conversion = self.get_map_conversion(self.model)
+        reference_conversion = self.get_map_conversion(reference_model)
+        if model_conversion is None or reference_conversion is None:
+            self.logger.printlog("  No IfcMapConversion in both models, relocation by georeferencing skipped")
+            return None
+
+        model_angle = self.get_map_conversion_angle(model_conversion)
+        reference_angle = self.get_map_conversion_angle(reference_conversion)
+        delta_eastings = model_conversion.Eastings - reference_conversion.Eastings
+        delta_northings = model_conversion.Northings - reference_conversion.Northings
+        delta_height = model_conversion.OrthogonalHeight - reference_conversion.OrthogonalHeight
+
+        # Map offsets expressed in the reference local axes
+        dx = delta_eastings * math.cos(reference_angle) + delta_northings * math.sin(reference_angle)
+        dy = -delta_eastings * math.sin(reference_angle) + delta_northings * math.cos(reference_angle)
+        scale = reference_conversion.Scale if reference_conversion.Scale else 1.0
+        model_scale = model_conversion.Scale if model_conversion.Scale else 1.0
+        if abs(model_scale / scale - 1.0) > 1e-9:
+            # A rigid placement cannot scale, the lengths of the model are scaled before it is relocated
+            self.scale(model_scale / scale)
+        angle_deg = math.degrees(model_angle - reference_angle)
+        return self.relocate(dx / scale, dy / scale, delta_height / scale, angle_deg)
+
+    def scale(self, factor):
+        import ifcpatch_merge
+
+        self.logger.printlog(f"  Scaling model lengths by {factor} (IfcMapConversion scales differ)")
+        for ifc_class, attributes in ifcpatch_merge.get_length_attributes_plan(self.model.schema).items():
+            if ifc_class == "IfcMapConversion":
+                # Offsets in map coordinates, not model lengths
+                continue
+            for element in self.model.by_type(ifc_class):
+                if element.is_a() != ifc_class:
+                    continue
+                for attribute in attributes:
+                    value = getattr(element, attribute)
+                    if isinstance(value, tuple):
+                        setattr(element, attribute, tuple(val * factor if isinstance(val, float) else val for val in value))
+                    elif isinstance(value, float):
+                        setattr(element, attribute, value * factor)
+
+    def get_root_placements(self):
+        root_placements = {}
+        for project in self.model.by_type("IfcProject"):
+            for rel_agg in project.IsDecomposedBy or ():
+                for spatial_element in rel_agg.RelatedObjects:
+                    placement = getattr(spatial_element, "ObjectPlacement", None)
+                    if placement is not None and placement.is_a("IfcLocalPlacement") and placement.PlacementRelTo is None:
+                        root_placements[placement.id()] = placement
+
+        # Products placed outside the spatial structure (grids, annotations, proxies...) have absolute placements too
+        other_placements = {}
+        other_classes = set()
+        for product in self.model.by_type("IfcProduct"):
+            placement = product.ObjectPlacement
+            if placement is None or placement.id() in root_placements:
+                continue
+            if placement.is_a("IfcLocalPlacement") and placement.PlacementRelTo is None:
+                other_placements[placement.id()] = placement
+                other_classes.add(product.is_a())
+        if other_placements:
+            self.logger.printlog(f"  {len(other_placements)} absolute placement(s) outside the spatial structure also relocated ({', '.join(sorted(other_classes))})")
+        root_placements.update(other_placements)
+        return list(root_placements.values())
+
+    def get_map_conversion(self, model):
+        if model.schema == "IFC2X3":
+            return None
+        map_conversions = model.by_type("IfcMapConversion")
+        if map_conversions:
+            return map_conversions[0]
+        return None
+
+    def get_map_conversion_angle(self, map_conversion):
+        abscissa = map_conversion.XAxisAbscissa if map_conversion.XAxisAbscissa is not None else 1.0
+        ordinate = map_conversion.XAxisOrdinate if map_conversion.XAxisOrdinate is not None else 0.0
+        return math.atan2(ordinate, abscissa)
+
+    def flatten_placements(self):
+        # Fallback for viewers that do not resolve nested placements correctly:
+        # every IfcLocalPlacement is rewritten as an absolute placement
+        self.logger.printlog("  Flattening placements")
+        all_placements = self.model.by_type("IfcLocalPlacement")
+        matrices = {}
+        for placement in all_placements:
+            matrices[placement.id()] = self.get_absolute_matrix(placement, matrices)
+
+        # Placements relative to an IfcGridPlacement (directly or not) have no matrix and are kept as they are
+        placements = [placement for placement in all_placements if matrices[placement.id()] is not None]
+        if len(placements) < len(all_placements):
+            self.logger.printlog(f"  {len(all_placements) - len(placements)} placement(s) relative to a grid placement are not flattened")
+        for placement in placements:
+            matrix = matrices[placement.id()]
+            placement.RelativePlacement = self.model.create_entity(
+                "IfcAxis2Placement3D",
+                **{
+                    "Location": self.model.create_entity("IfcCartesianPoint", Coordinates=tuple(float(v) for v in matrix[0:3, 3])),
+                    "Axis": self.model.create_entity("IfcDirection", DirectionRatios=tuple(float(v) for v in matrix[0:3, 2])),
+                    "RefDirection": self.model.create_entity("IfcDirection", DirectionRatios=tuple(float(v) for v in matrix[0:3, 0])),
+                },
+            )
+        for placement in placements:
+            placement.PlacementRelTo = None
+        self.logger.printlog(f"  Done ({len(placements)} placements)")
+
+    def get_absolute_matrix(self, placement, matrices):
+        # Iterative walk up the placement chain, each intermediate matrix is computed only once.
+        # The position of an IfcGridPlacement depends on the grid axes, the chains going through one get None
+        chain = []
+        while placement is not None and placement.id() not in matrices:
+            if not placement.is_a("IfcLocalPlacement"):
+                matrices[placement.id()] = None
+                break
+            chain.append(placement)
+            placement = placement.PlacementRelTo
+        matrix = matrices[placement.id()] if placement is not None else np.eye(4)
+        for loc_placement in reversed(chain):
+            if matrix is not None:
+                matrix = matrix @ self.get_axis2placement_matrix(loc_placement.RelativePlacement)
+            matrices[loc_placement.id()] = matrix
+        return matrix
+
+    def get_axis2placement_matrix(self, axis_placement):
+        matrix = np.eye(4)
+        if axis_placement is None:
+            return matrix
+        coordinates = list(axis_placement.Location.Coordinates) + [0.0] * (3 - len(axis_placement.Location.Coordinates))
+        z_axis = np.array(axis_placement.Axis.DirectionRatios if getattr(axis_placement, "Axis", None) else (0.0, 0.0, 1.0), dtype=float)
+        ref_direction = getattr(axis_placement, "RefDirection", None)
+        x_axis = np.array(ref_direction.DirectionRatios if ref_direction else (1.0, 0.0, 0.0), dtype=float)
+        if len(x_axis) == 2:
+            x_axis = np.append(x_axis, 0.0)
+        z_axis = z_axis / np.linalg.norm(z_axis)
+        x_axis = x_axis - np.dot(x_axis, z_axis) * z_axis
+        x_axis = x_axis / np.linalg.norm(x_axis)
+        y_axis = np.cross(z_axis, x_axis)
+        matrix[0:3, 0] = x_axis
+        matrix[0:3, 1] = y_axis
+        matrix[0:3, 2] = z_axis
+        matrix[0:3, 3] = coordinates
+        return matrix
@@ -0,0 +1,206 @@
+import os
+import re
+
+import ifcopenshell
+
+import integrity
+
+
+# Relationships distributed with their roles swapped: a port goes to the outputs of the element it belongs to
+DISTRIBUTION_ATTRIBUTES = {
+    "IfcRelConnectsPortToElement": ("RelatedElement", "RelatingPort"),
+}
+
+class Splitter:
+    # Cuts one model into several sub-models (one per storey or per source discipline).
+    # The spatial structure is walked once to assign every product to its output(s), the relationships are
+    # then distributed in a single pass, and all outputs are written in one pass over the products.
+    # Within an output, resource entities shared by several products (placements, types, styles...) are copied once
+    def __init__(self, logger, model):
+        self.logger = logger
+        self.model = model
+        self.groups_by_product = {} # {product id: set of output names}
+        self.output_names = []
+
+    def split_by_storey(self, output_folder, prefix=""):
+        self.logger.printlog("  Splitting model by storey")
+        for storey_num, storey in enumerate(self.model.by_type("IfcBuildingStorey")):
+            output_name = self.get_valid_filename(f"{prefix}{storey_num:02}_{storey.Name or storey.GlobalId}")
+            self.output_names.append(output_name)
+            for spatial_ancestor in self.get_spatial_ancestors(storey):
+                self.add_to_group(spatial_ancestor, output_name)
+            for product in self.get_spatial_descendants(storey):
+                self.add_to_group(product, output_name)
+        return self.write_outputs(output_folder)
+
+    def split_by_discipline(self, output_folder, prefix=""):
+        # The Merger keeps the IfcOwnerHistory of each source model, its owning user and application identify
+        # the discipline of every product (a model can hold several IfcOwnerHistory for the same owner)
+        self.logger.printlog("  Splitting model by discipline")
+        output_names_by_owner = {}
+        for element in self.model.by_type("IfcProduct"):
+            if element.is_a("IfcSpatialStructureElement") and not element.is_a("IfcSpace"):
+                continue
+            # Openings and parts of assemblies follow the element they belong to
+            if element.is_a("IfcFeatureElement") or self.get_container(element) is None:
+                continue
+            owner_history = element.OwnerHistory
+            owner_key = self.get_owner_key(owner_history)
+            if owner_key not in output_names_by_owner:
+                output_name = self.get_valid_filename(f"{prefix}{self.get_discipline_name(owner_history, len(output_names_by_owner))}")
+                output_names_by_owner[owner_key] = output_name
+                self.output_names.append(output_name)
+            output_name = output_names_by_owner[owner_key]
+            for product in self.get_spatial_descendants(element, follow_containment=False):
+                self.add_to_group(product, output_name)
+            for spatial_ancestor in self.get_spatial_ancestors(self.get_container(element)):
+                self.add_to_group(spatial_ancestor, output_name)
+        return self.write_outputs(output_folder)
+
+    def get_owner_key(self, owner_history):
+        if not owner_history:
+            return None
+        person = organization = application = None
+        if owner_history.OwningUser:
+            person = owner_history.OwningUser.ThePerson
+            organization = owner_history.OwningUser.TheOrganization
+        if owner_history.OwningApplication:
+            application = owner_history.OwningApplication
+        return (
+            (getattr(person, "Identification", None) or getattr(person, "Id", None), person.FamilyName, person.GivenName) if person else None,
+            (getattr(organization, "Identification", None) or getattr(organization, "Id", None), organization.Name) if organization else None,
+            (application.ApplicationIdentifier, application.Version) if application else None,
+        )
+
+    def get_discipline_name(self, owner_history, discipline_num):
+        name = "unknown"
+        if owner_history and owner_history.OwningUser:
+            person = owner_history.OwningUser.ThePerson
+            organization = owner_history.OwningUser.TheOrganization
+            for value in (
+                getattr(person, "Identification", None) or getattr(person, "Id", None),
+                person.FamilyName,
+                person.GivenName,
+                organization.Name,
+            ):
+                if value:
+                    name = value
+                    break
+        return f"discipline_{discipline_num:02}_{name}"
+
+    def get_valid_filename(self, name):
+        return re.sub(r"[^\w\-. ]", "_", name).strip()
+
+    def add_to_group(self, product, output_name):
+        self.groups_by_product.setdefault(product.id(), set()).add(output_name)
+
+    def get_container(self, element):
+        for rel in getattr(element, "ContainedInStructure", None) or ():
+            return rel.RelatingStructure
+        for rel in getattr(element, "Decomposes", None) or ():
+            if rel.RelatingObject.is_a("IfcSpatialStructureElement"):
+                return rel.RelatingObject
+        return None
+
+    def get_spatial_ancestors(self, spatial_element):
+        ancestors = [spatial_element]
+        current = spatial_element
+        while current is not None:
+            parent = None
+            for rel in getattr(current, "Decomposes", None) or ():
+                parent = rel.RelatingObject
+            if parent is not None:
+                ancestors.append(parent)
+            current = parent
+        return ancestors
+
+    def get_spatial_descendants(self, product, follow_containment=True):
+        # The product, what it contains (if follow_containment) or is decomposed into, its openings and their fillings, its ports
+        descendants = []
+        visited = set()
+        to_visit = [product]
+        while to_visit:
+            current = to_visit.pop()
+            if current.id() in visited:
+                continue
+            visited.add(current.id())
+            descendants.append(current)
+            for rel in getattr(current, "ContainsElements", None) or () if follow_containment else ():
+                to_visit.extend(rel.RelatedElements)
+            for rel in getattr(current, "IsDecomposedBy", None) or ():
+                to_visit.extend(rel.RelatedObjects)
+            for rel in getattr(current, "HasOpenings", None) or ():
+                to_visit.append(rel.RelatedOpeningElement)
+            for rel in getattr(current, "HasFillings", None) or ():
+                to_visit.append(rel.RelatedBuildingElement)
+            for rel in getattr(current, "IsNestedBy", None) or ():
+                to_visit.extend(rel.RelatedObjects)
+            for rel in getattr(current, "HasPorts", None) or ():
+                to_visit.append(rel.RelatingPort)
+        return descendants
+
+    def distribute_relationships(self):
+        # Single pass over the relationships: each one goes to every output holding one of its related objects,
+        # with its related objects filtered to that output. Type relationships come first so the types they pull
+        # into an output are known when their material relationships are processed
+        relationships_by_output = {output_name: [] for output_name in self.output_names}
+        relationship_classes = sorted(integrity.RELATIONSHIP_ATTRIBUTES, key=lambda ifc_class: ifc_class != "IfcRelDefinesByType")
+        for ifc_class in relationship_classes:
+            relating_attribute, related_attribute = DISTRIBUTION_ATTRIBUTES.get(ifc_class, integrity.RELATIONSHIP_ATTRIBUTES[ifc_class])
+            for rel in self.model.by_type(ifc_class, include_subtypes=False):
+                relating = getattr(rel, relating_attribute)
+                related = getattr(rel, related_attribute)
+                related = related if isinstance(related, tuple) else ((related,) if related is not None else ())
+                if not isinstance(relating, ifcopenshell.entity_instance) or not related:
+                    continue
+                is_relating_product = relating.is_a("IfcProduct")
+                output_names = set()
+                for related_object in related:
+                    output_names.update(self.groups_by_product.get(related_object.id(), ()))
+                for output_name in output_names:
+                    # A spatial or element relating object must itself be part of the output
+                    if is_relating_product and output_name not in self.groups_by_product.get(relating.id(), ()):
+                        continue
+                    filtered_related = [obj for obj in related if output_name in self.groups_by_product.get(obj.id(), ())]
+                    relationships_by_output[output_name].append((rel, related_attribute, filtered_related))
+                    if ifc_class == "IfcRelDefinesByType":
+                        self.add_to_group(relating, output_name)
+        return relationships_by_output
+
+    def write_outputs(self, output_folder):
+        relationships_by_output = self.distribute_relationships()
+        outputs = {output_name: ifcopenshell.file(schema=self.model.schema) for output_name in self.output_names}
+
+        # One pass over the rooted objects, each one is copied (with its forward closure) into its outputs
+        for entity in self.model.by_type("IfcObjectDefinition"):
+            for output_name in self.groups_by_product.get(entity.id(), ()):
+                outputs[output_name].add(entity)
+
+        for output_name, relationships in relationships_by_output.items():
+            output = outputs[output_name]
+            for rel, related_attribute, filtered_related in relationships:
+                self.copy_relationship(output, rel, related_attribute, filtered_related)
+
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        output_paths = []
+        for output_name, output in outputs.items():
+            output_path = os.path.join(output_folder, f"{output_name}.ifc")
+            output.write(output_path)
+            output_paths.append(output_path)
+            self.logger.printlog(f"    <{output_name}.ifc> written ({len(output.by_type('IfcProduct'))} products)")
+        return output_paths
+
+    def copy_relationship(self, output, rel, related_attribute, filtered_related):
+        attributes = rel.get_info(include_identifier=False, recursive=False)
+        del attributes["type"]
+        for name, value in attributes.items():
+            if name == related_attribute:
+                value = filtered_related if isinstance(getattr(rel, related_attribute), tuple) else filtered_related[0]
+            if isinstance(value, ifcopenshell.entity_instance):
+                attributes[name] = output.add(value)
+            elif isinstance(value, (tuple, list)):
+                attributes[name] = [output.add(v) if isinstance(v, ifcopenshell.entity_instance) else v for v in value]
+            else:
+                attributes[name] = value
+        return output.create_entity(rel.is_a(), **attributes)
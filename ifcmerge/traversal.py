@@ -0,0 +1,9 @@
+def get_forward_references(model, entity):
+    # Entities directly referenced by the attributes of <entity> (one level, no wrapped values)
+    return [ref for ref in model.traverse(entity, max_levels=1)[1:] if ref.id()]
+
+
+def iter_reference_map(model):
+    # Single sweep over the model, yields (entity, direct forward references)
+    for entity in model:
+        yield entity, get_forward_references(model, entity)
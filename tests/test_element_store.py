@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from shapely.geometry import LineString
+
+from bimify.elements import ElementsManager, Node, Opening, Wall
+
+
+def add_wall(manager, line, thickness=10):
+    return Wall(manager, LineString(line).buffer(thickness / 2, cap_style="flat"), line, thickness)
+
+
+def test_orthogonalize_walls_updates_polygons_and_nodes():
+    manager = ElementsManager(use_element_store=True)
+    wall = add_wall(manager, ((0, 0), (400, 20)))
+    start_node, end_node = Node(manager, (0, 0)), Node(manager, (400, 20))
+    wall.connect_to_node(start_node, 0)
+    wall.connect_to_node(end_node, wall.get_length())
+    length = wall.get_length()
+
+    rows = manager.store.orthogonalize_walls(epsilon_deg=5)
+    assert rows.tolist() == [wall.row]
+    assert wall.get_angle() == pytest.approx(0)
+    assert wall.get_length() == pytest.approx(length)
+    (x1, y1), (x2, y2) = wall.line
+    assert y1 == pytest.approx(10) and y2 == pytest.approx(10)
+    # Polygon and nodes follow the new line
+    assert wall.polygon.bounds == pytest.approx((x1, 5, x2, 15))
+    assert start_node.position == pytest.approx((x1, y1))
+    assert end_node.position == pytest.approx((x2, y2))
+
+
+def test_store_is_the_only_copy_of_the_geometry():
+    manager = ElementsManager(use_element_store=True)
+    wall = add_wall(manager, ((0, 0), (400, 0)))
+    opening = Opening(manager, (200, 0), wall, 80, classname="window")
+    assert not hasattr(wall, "__dict__") and not hasattr(opening, "__dict__")
+    wall.line = ((0, 0), (0, 400))
+    assert manager.store.get_wall_line(wall.row) == ((0, 0), (0, 400))
+    opening.length = 120
+    assert manager.store.get_opening_length(opening.row) == 120
+
+    subwall = wall.create_subwall(wall.polygon, ((0, 0), (0, 200)), 10)
+    class_ids = manager.store.walls["class_id"]
+    assert class_ids[wall.row] != class_ids[subwall.row]
+
+    opening.remove(manager)
+    assert not manager.store.openings["alive"][opening.row]
+    assert manager.store.opening_objects[opening.row] is None
+    assert np.count_nonzero(manager.store.openings["alive"]) == 0
+
+
+def test_opening_wall_without_row():
+    manager = ElementsManager(use_element_store=True)
+    wall = Wall(ElementsManager(), LineString(((0, 0), (400, 0))).buffer(5, cap_style="flat"), ((0, 0), (400, 0)), 10)
+    with pytest.raises(ValueError):
+        Opening(manager, (200, 0), wall, 80)
@@ -0,0 +1,39 @@
+import ifcopenshell.geom
+import numpy as np
+import pytest
+
+from bimify import global_variables as gvars
+from bimify.benchmark_ifc_writer import create_grid_plan
+from bimify.ifc_modeling import IFCModelHandler
+
+
+def export_bounding_boxes(bulk_writer, shared_representations=True):
+    walls, rooms, openings = create_grid_plan(3)
+    handler = IFCModelHandler(bulk_writer=bulk_writer, shared_representations=shared_representations)
+    handler.create_project()
+    handler.create_ifc_walls_from_polygons(walls)
+    handler.create_ifc_spaces_from_enclosed_areas(rooms)
+    handler.create_ifc_openings_from_polygons(openings)
+    for room in rooms:
+        handler.create_slab(room.polygon, gvars.default_slab_thickness, f"slab_{room.id}")
+    handler.flush_relationships()
+
+    settings = ifcopenshell.geom.settings()
+    settings.set("use-world-coords", True)
+    bounding_boxes = {}
+    for product in handler.model.by_type("IfcProduct"):
+        if not product.Representation:
+            continue
+        vertices = np.array(ifcopenshell.geom.create_shape(settings, product).geometry.verts).reshape(-1, 3)
+        bounding_boxes[(product.is_a(), product.Name)] = np.concatenate((vertices.min(axis=0), vertices.max(axis=0)))
+    return bounding_boxes
+
+
+@pytest.mark.parametrize("shared_representations", [True, False])
+def test_bulk_writer_matches_api(shared_representations):
+    api_boxes = export_bounding_boxes(bulk_writer=False)
+    bulk_boxes = export_bounding_boxes(bulk_writer=True, shared_representations=shared_representations)
+    assert set(bulk_boxes) == set(api_boxes)
+    assert {ifc_class for ifc_class, name in api_boxes} >= {"IfcWall", "IfcSpace", "IfcOpeningElement", "IfcSlab"}
+    for key, api_box in api_boxes.items():
+        assert bulk_boxes[key] == pytest.approx(api_box, abs=1e-5), key
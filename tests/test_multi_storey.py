@@ -0,0 +1,42 @@
+from shapely.geometry import LineString
+
+from bimify.elements import RoomCategory
+from bimify.multi_storey import StoreyPlan, build_elements
+
+
+HALLWAY_CLS_ID = 7
+BEDROOM_CLS_ID = 4
+
+
+def create_corridor_plan(room_labels=()):
+    # Corridor along the bottom (y 0-200), two flats of two rooms above it (x 0-400 and 400-800), each flat
+    # opens onto the corridor and its rooms are connected by a door
+    lines = [
+        ((0, 0), (800, 0)), ((0, 600), (800, 600)), ((0, 0), (0, 600)), ((800, 0), (800, 600)),
+        ((0, 200), (800, 200)), ((0, 400), (800, 400)), ((400, 200), (400, 600)),
+    ]
+    walls = [(list(LineString(line).buffer(5, cap_style="flat").exterior.coords), line, 10) for line in lines]
+    openings = [((200, 200), 4, 90, "door"), ((600, 200), 4, 90, "door"), ((200, 400), 5, 90, "door"), ((600, 400), 5, 90, "door")]
+    return StoreyPlan("Level 0", 0.0, walls, openings, room_labels=room_labels)
+
+
+def test_without_labels_the_corridor_joins_the_flats():
+    storey = build_elements(create_corridor_plan())
+    assert len(storey.rooms) == 5
+    assert len(storey.housings) == 1
+
+
+def test_labelled_corridor_separates_the_housings():
+    storey = build_elements(create_corridor_plan(room_labels=[((400, 100), HALLWAY_CLS_ID), ((100, 300), BEDROOM_CLS_ID)]))
+    corridor = next(room for room in storey.rooms if room.polygon.bounds[3] <= 200)
+    assert corridor.category == RoomCategory.HALLWAY
+    assert corridor.part_of_housing is None
+    assert len(storey.housings) == 2
+    assert sorted(len(housing.rooms) for housing in storey.housings) == [2, 2]
+    assert sorted(housing.type for housing in storey.housings) == ["T1", "T2"]
+
+
+def test_most_prioritary_label_wins():
+    storey = build_elements(create_corridor_plan(room_labels=[((400, 100), BEDROOM_CLS_ID), ((300, 100), HALLWAY_CLS_ID)]))
+    corridor = next(room for room in storey.rooms if room.polygon.bounds[3] <= 200)
+    assert corridor.category == RoomCategory.BEDROOM
@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+from shapely.geometry import box
+
+from bimify.elements import RoomCategory, RoomSide
+from bimify.multi_storey import StoreyPlan, build_elements
+from bimify.outlet_placement import OutletPlacer
+
+
+def is_position_valid_linear(roomside, spans, position):
+    # Linear scan over the spans, as RoomSide.is_position_valid did before the interval index
+    if position < 0 or position > roomside.length:
+        return False
+    return not any(min(start, end) <= position <= max(start, end) for start, end in spans)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_is_position_valid_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    roomside = RoomSide(None, 0, ((0, 0), (1000, 0)))
+    spans = []
+    for _ in range(30):
+        start = rng.uniform(-50, 1050)
+        span = (start, start + rng.choice([-1, 1]) * rng.uniform(0, 80))
+        spans.append(span)
+        roomside.add_occupied_span(*span)
+    # Random positions, plus the span ends themselves (inclusive)
+    positions = [rng.uniform(-100, 1100) for _ in range(2000)] + [value for span in spans for value in span]
+    for position in positions:
+        assert roomside.is_position_valid(position) == is_position_valid_linear(roomside, spans, position)
+    assert all(start <= end for start, end in zip(roomside.occupied_starts, roomside.occupied_ends))
+    assert all(end < start for end, start in zip(roomside.occupied_ends, roomside.occupied_starts[1:]))
+
+
+def create_grid_plan(n=3, size=600, thickness=20):
+    length = n * size
+    walls = []
+    for i in range(n + 1):
+        offset = i * size
+        walls.append((list(box(offset - thickness / 2, 0, offset + thickness / 2, length).exterior.coords), ((offset, 0), (offset, length)), thickness))
+        walls.append((list(box(0, offset - thickness / 2, length, offset + thickness / 2).exterior.coords), ((0, offset), (length, offset)), thickness))
+    openings = []
+    for i in range(n):
+        for j in range(n):
+            x, y = i * size, j * size
+            if i > 0:
+                openings.append(((x, y + size / 2), 2 * i, 90, "door"))
+            openings.append(((x + size / 2, y), 2 * j + 1, 120, "window"))
+    objects = [("bed-single", list(box(size * 0.3, size * 0.05, size * 0.6, size * 0.4).exterior.coords))]
+    return StoreyPlan("Level 0", 0.0, walls, openings, objects)
+
+
+def test_outlets_spaced_across_sides():
+    storey = build_elements(create_grid_plan())
+    for room in storey.rooms:
+        room.category = RoomCategory.KITCHEN
+    placer = OutletPlacer(storey.manager, min_spacing=150, margin=20,
+                          outlets_per_room_category={RoomCategory.KITCHEN.code: 12}, rj45_per_room_category={RoomCategory.KITCHEN.code: 2})
+    outlets = placer.place(storey.rooms)
+    assert outlets
+    for room in storey.rooms:
+        points = np.array([(outlet.x, outlet.y) for outlet in outlets if outlet.contained_in_room is room])
+        if len(points) < 2:
+            continue
+        distances = np.hypot(*(points[:, None] - points[None]).transpose(2, 0, 1))
+        distances[np.diag_indices(len(points))] = np.inf
+        assert distances.min() >= 150 - 1e-6
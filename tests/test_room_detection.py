@@ -0,0 +1,78 @@
+import pytest
+from shapely.geometry import LineString
+
+from bimify.elements import ElementsManager, Node, Wall
+from bimify.room_detection import RoomDetector
+
+
+def add_wall(manager, start_node, end_node, thickness=10):
+    line = (start_node.position, end_node.position)
+    wall = Wall(manager, LineString(line).buffer(thickness / 2, cap_style="flat"), line, thickness)
+    wall.connect_to_node(start_node, 0)
+    wall.connect_to_node(end_node, wall.get_length())
+    return wall
+
+
+def create_square(manager, size=400):
+    corners = [Node(manager, position) for position in ((0, 0), (size, 0), (size, size), (0, size))]
+    walls = [add_wall(manager, corners[i], corners[(i + 1) % 4]) for i in range(4)]
+    return corners, walls
+
+
+def add_stub(manager, walls, size=400, stub_length=150):
+    # Wall going into the room from the middle of its left side
+    left_wall = walls[3]
+    base = Node(manager, (0, size / 2))
+    left_wall.connect_to_node(base, size / 2)
+    tip = Node(manager, (stub_length, size / 2))
+    return add_wall(manager, base, tip)
+
+
+@pytest.mark.parametrize("method", ["faces", "polygonize"])
+def test_square(method):
+    manager = ElementsManager()
+    corners, walls = create_square(manager)
+    rooms = RoomDetector(manager).detect_rooms(method)
+    assert len(rooms) == 1
+    assert rooms[0].polygon.is_valid
+    assert rooms[0].polygon.area == pytest.approx(400 * 400)
+    assert {wall.id for wall in rooms[0].surrounding_walls} == {wall.id for wall in walls}
+
+
+@pytest.mark.parametrize("method", ["faces", "polygonize"])
+def test_square_with_stub(method):
+    manager = ElementsManager()
+    corners, walls = create_square(manager)
+    stub = add_stub(manager, walls)
+    rooms = RoomDetector(manager).detect_rooms(method)
+    assert len(rooms) == 1
+    polygon = rooms[0].polygon
+    assert polygon.is_valid
+    assert polygon.area == pytest.approx(400 * 400)
+    assert len(polygon.exterior.coords) == 6 # 4 corners, the base of the stub, closing point
+    assert len(rooms[0].surrounding_node_ids) == 5
+    assert stub.id not in {wall.id for wall in rooms[0].surrounding_walls}
+
+
+def test_faces_and_polygonize_agree_with_stub():
+    manager = ElementsManager()
+    corners, walls = create_square(manager)
+    add_stub(manager, walls)
+    from_faces = RoomDetector(manager).detect_rooms("faces")[0].polygon
+    from_polygonize = RoomDetector(manager).detect_rooms("polygonize")[0].polygon
+    assert from_faces.normalize().equals_exact(from_polygonize.normalize(), 1e-9)
+
+
+def test_square_with_bent_stub():
+    # Stub of two walls: both segments are walked there and back
+    manager = ElementsManager()
+    corners, walls = create_square(manager)
+    stub = add_stub(manager, walls)
+    tip = Node(manager, (150, 300))
+    bend = manager.graph.get_last_node(stub.id)[0]
+    bent_stub = add_wall(manager, bend, tip)
+    rooms = RoomDetector(manager).detect_rooms()
+    assert len(rooms) == 1
+    assert rooms[0].polygon.is_valid
+    assert len(rooms[0].polygon.exterior.coords) == 6
+    assert {stub.id, bent_stub.id}.isdisjoint(wall.id for wall in rooms[0].surrounding_walls)
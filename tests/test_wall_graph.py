@@ -0,0 +1,26 @@
+import pytest
+from shapely.geometry import LineString
+
+from bimify.elements import ElementsManager, Node, Wall
+
+
+def create_wall(manager, line, wall_id=None):
+    return Wall(manager, LineString(line).buffer(5, cap_style="flat"), line, 10, wall_id=wall_id)
+
+
+def test_duplicate_wall_id():
+    manager = ElementsManager(use_element_store=True)
+    wall = create_wall(manager, ((0, 0), (400, 0)), wall_id=3)
+    with pytest.raises(ValueError):
+        create_wall(manager, ((0, 0), (0, 400)), wall_id=3)
+    assert manager.graph.walls[3] is wall
+    assert manager.store.walls.row_count == 1
+    assert create_wall(manager, ((0, 0), (0, 400))).id == 4
+
+
+def test_node_position():
+    manager = ElementsManager()
+    node = Node(manager, (10, 20))
+    assert node.position == (10.0, 20.0)
+    node.position = (15, 25)
+    assert node.position == (15.0, 25.0)